@@ -0,0 +1,213 @@
+"""Crawl a synthetic site served on localhost, end to end.
+
+    python benchmarks/crawl.py [--pages 500] [--fan-out 10] [--depth 3]
+                               [--latency 0.01] [--images 2] [--workers 4]
+                               [--output run.json]
+
+The site (see scraper.local_site) runs in a separate process, so it doesn't
+share CPU time and memory of the crawling one. A spider with the usual test
+XPaths runs [{'action': 'crawl', 'target': 'content'}] over it, on a
+temporary SQLite database and crawl directories. Throughput (pages/sec),
+p50/p99 latency of page downloads and peak RSS of the crawling process and
+its extracting workers are printed, and written as JSON if --output is given.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import platform
+import resource
+import tempfile
+import threading
+
+from multiprocessing import Process, Pipe
+from optparse import OptionParser
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+FORMAT_VERSION = 1
+
+sys.path.insert(0, ROOT)
+
+from scraper.local_site import LocalSite  # noqa
+
+
+def serve(site, connection):
+    """Run the site until the parent process sends anything"""
+    site.start()
+    connection.send(site.port)
+    connection.recv()
+    connection.send(site.requests)
+    site.stop()
+
+
+def configure(temp_dir, options):
+    from django.conf import settings
+    settings.configure(
+        DATABASES={
+            'default': {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': os.path.join(temp_dir, 'db.sqlite3'),
+            }
+        },
+        INSTALLED_APPS=[
+            'django.contrib.auth',
+            'django.contrib.contenttypes',
+            'scraper',
+        ],
+        MEDIA_ROOT=os.path.join(temp_dir, 'media'),
+        SCRAPER_SETTINGS={
+            'CRAWL_ROOT': 'crawl/',
+            'TEMP_DIR': os.path.join(temp_dir, 'tmp'),
+            'FETCH_THREADS': options.threads,
+        },
+    )
+    import django
+    if hasattr(django, 'setup'):
+        django.setup()
+    from django.core.management import call_command
+    call_command('syncdb', interactive=False, verbosity=0)
+    logging.getLogger('scraper').setLevel(logging.WARNING)
+
+
+class TimingLoader(object):
+    """Downloads pages like the default loader, recording how long each
+    one takes"""
+
+    def __init__(self):
+        self.durations = []
+        self._lock = threading.Lock()
+
+    def get_source(self, url, headers=None, proxies=None):
+        from scraper.extractor import get_session
+        start = time.time()
+        content = get_session().get(url, headers=headers,
+                                    proxies=proxies).content
+        with self._lock:
+            self.durations.append(time.time() - start)
+        return content
+
+
+def percentile(values, ratio):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(int(len(values) * ratio), len(values) - 1)]
+
+
+def peak_rss():
+    """Return peak RSS (MB) of this process and of its largest child"""
+    # Linux reports kilobytes, OS X bytes
+    unit = 1024.0 * 1024 if sys.platform == 'darwin' else 1024.0
+    return tuple(
+        resource.getrusage(who).ru_maxrss / unit
+        for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN))
+
+
+def crawl(url, options):
+    from scraper import extractor, models
+    collector = models.Collector.objects.create(
+        name='benchmark', get_image=bool(options.images))
+    collector.selectors.add(models.Selector.objects.create(
+        key='post', xpath="//div[@class='post-body']", data_type='html'))
+    spider = models.Spider.objects.create(
+        url=url, name='benchmark', crawl_depth=options.depth,
+        target_links=["//div[@class='post-title']/h2/a"],
+        expand_links=['//a[@rel="next"]'])
+    spider.collectors.add(collector)
+
+    loader = TimingLoader()
+    extractor.custom_loader = loader
+    start = time.time()
+    result = spider.operate(
+        [{'action': 'crawl', 'target': 'content',
+          'workers': options.workers}])
+    duration = time.time() - start
+    stats = result.data.get('stats', {})
+    pages = stats.get('pages', 0)
+    rss, children_rss = peak_rss()
+    return {
+        'pages': pages,
+        'files': stats.get('files', 0),
+        'errors': stats.get('errors', 0),
+        'duration': duration,
+        'pages_per_sec': pages / duration if duration else 0,
+        'latency_p50': percentile(loader.durations, 0.5),
+        'latency_p99': percentile(loader.durations, 0.99),
+        'peak_rss_mb': rss,
+        'peak_children_rss_mb': children_rss,
+    }
+
+
+def main():
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('--pages', type='int', default=500,
+                      help='Number of articles in the site')
+    parser.add_option('--fan-out', dest='fan_out', type='int', default=10,
+                      help='Articles and child listings of each listing')
+    parser.add_option('--depth', type='int', default=3,
+                      help='Number of listing levels')
+    parser.add_option('--latency', type='float', default=0,
+                      help='Delay of every response, in seconds')
+    parser.add_option('--jitter', type='float', default=0,
+                      help='Random extra delay, up to this number of seconds')
+    parser.add_option('--images', type='int', default=0,
+                      help='Images in each article, downloaded if not 0')
+    parser.add_option('--page-size', dest='page_size', type='int',
+                      default=2000, help='Size of article text, in bytes')
+    parser.add_option('--workers', type='int', default=0,
+                      help='Extracting processes, 0 to crawl sequentially')
+    parser.add_option('--threads', type='int', default=8,
+                      help='Downloading threads when workers are used')
+    parser.add_option('--output', help='Write results as JSON to file')
+    options, args = parser.parse_args()
+
+    site = LocalSite(
+        pages=options.pages, fan_out=options.fan_out, depth=options.depth,
+        latency=options.latency, jitter=options.jitter,
+        images=options.images, page_size=options.page_size)
+    connection, child_connection = Pipe()
+    server = Process(target=serve, args=(site, child_connection))
+    server.daemon = True
+    server.start()
+    site.port = connection.recv()
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        configure(temp_dir, options)
+        results = crawl(site.url, options)
+    finally:
+        connection.send(None)
+        requests = connection.recv() if connection.poll(5) else None
+        server.join(5)
+        shutil.rmtree(temp_dir)
+    results['requests'] = requests
+
+    print('Site: {0} articles, {1} request(s)'.format(
+        site.articles, results['requests']))
+    print('Crawled {pages} page(s), {files} file(s), {errors} error(s) in '
+          '{duration:.2f}s'.format(**results))
+    print('Throughput: {pages_per_sec:.1f} pages/sec'.format(**results))
+    print('Page latency: p50 {0:.1f}ms, p99 {1:.1f}ms'.format(
+        results['latency_p50'] * 1000, results['latency_p99'] * 1000))
+    print('Peak RSS: {peak_rss_mb:.1f}MB, workers {peak_children_rss_mb:.1f}'
+          'MB'.format(**results))
+    if options.output:
+        options_dict = dict(
+            (key, getattr(options, key))
+            for key in ('pages', 'fan_out', 'depth', 'latency', 'jitter',
+                        'images', 'page_size', 'workers', 'threads'))
+        with open(options.output, 'w') as output:
+            json.dump({
+                'version': FORMAT_VERSION,
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'python': platform.python_version(),
+                'options': options_dict,
+                'results': results,
+            }, output, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
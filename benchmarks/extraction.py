@@ -0,0 +1,250 @@
+"""Time the extraction hot paths on the test pages and synthetic big pages.
+
+    python benchmarks/extraction.py [--repeat 5] [--output run.json]
+    python benchmarks/extraction.py --compare base.json run.json
+
+Every benchmark runs `repeat` times, the best and mean times of a single
+call are printed and written as JSON if --output is given. Fast functions
+are called in loops long enough to be measured. With --compare, two outputs are
+compared: benchmarks slower by more than --threshold (ratio of best times)
+are flagged and the exit status is 1.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+
+from optparse import OptionParser
+
+from django.conf import settings
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+DATA_DIR = os.path.join(ROOT, 'scraper', 'test_data')
+FORMAT_VERSION = 1
+# Minimum duration of a timed loop, and maximum number of calls in it
+MIN_TIME = 0.05
+MAX_NUMBER = 100000
+
+sys.path.insert(0, ROOT)
+settings.configure(SCRAPER_SETTINGS={})
+
+from django.core.files.storage import FileSystemStorage  # noqa
+from scraper.extractor import Extractor  # noqa
+from scraper.utils import SimpleArchive, get_content, move_to_storage  # noqa
+
+
+POST_XPATH = "//div[@class='post-body']"
+LINK_XPATHS = ["//div[@class='post-title']/h2/a", '//a[@rel="next"]']
+REPLACE_RULES = [r'<script.*?</script>', r'<!--.*?-->', r'\s{2,}']
+
+
+def read_page(name):
+    with open(os.path.join(DATA_DIR, name)) as page:
+        return page.read()
+
+
+def synthetic_page(posts=2000):
+    """Return big page made of repeated posts, with links and images"""
+    post = (
+        '<div class="post-title"><h2><a href="/post-{0}">Post {0}</a></h2>'
+        '</div><div class="post-body"><p>Text of post {0} <b>bold</b> '
+        '<a href="/tag/{1}">tag {1}</a></p><img src="/img/{0}.jpg" alt="">'
+        '<!-- comment {0} --></div>')
+    body = ''.join(post.format(i, i % 50) for i in range(posts))
+    return '<html><head><title>Big</title></head><body>{0}' \
+        '<a rel="next" href="/page-2">Next</a></body></html>'.format(body)
+
+
+class Fixture(object):
+    """Pages and temporary directory used by benchmarks"""
+
+    def __init__(self, posts):
+        self.temp_dir = tempfile.mkdtemp()
+        self.pages = {
+            'small': read_page('yc.a0.html'),
+            'listing': read_page('yc.0.html'),
+            'large': synthetic_page(posts),
+        }
+
+    def extractor(self, name):
+        return Extractor('http://local/' + name, html=self.pages[name],
+                         base_dir=self.temp_dir)
+
+    def files(self, count=200, size=4096):
+        """Create directory of files, returns its path"""
+        path = tempfile.mkdtemp(dir=self.temp_dir)
+        os.makedirs(os.path.join(path, 'images'))
+        for i in range(count):
+            name = 'images/{0}.jpg'.format(i) if i % 2 else \
+                '{0}.json'.format(i)
+            with open(os.path.join(path, name), 'wb') as output:
+                output.write(os.urandom(size))
+        return path
+
+    def close(self):
+        shutil.rmtree(self.temp_dir)
+
+
+def get_benchmarks(fixture):
+    """Return list of (name, setup, function). Setup runs before each
+    timed run and its output is the argument of function. Functions using
+    up their argument (moved files,...) are called once per run."""
+    benchmarks = []
+    for page in ('small', 'listing', 'large'):
+        extractor = fixture.extractor(page)
+        elements = extractor.xpath(POST_XPATH)
+        html = fixture.pages[page]
+        benchmarks.extend([
+            ('parse_content.' + page, lambda html=html: html,
+             extractor.parse_content),
+            ('xpath.' + page, lambda: POST_XPATH, extractor.xpath),
+            ('extract_links.' + page, lambda: LINK_XPATHS,
+             extractor.extract_links),
+            ('extract_content.text.' + page,
+             lambda: {'post': (POST_XPATH + '//text()', 'text')},
+             lambda selectors, e=extractor: e.extract_content(
+                 selectors, get_image=False)),
+            ('extract_content.html.' + page,
+             lambda: {'post': (POST_XPATH, 'html')},
+             lambda selectors, e=extractor: e.extract_content(
+                 selectors, get_image=False)),
+            ('get_content.text.' + page, lambda e=elements: e,
+             lambda e: get_content(e, 'text')),
+            ('get_content.html.' + page, lambda e=elements: e,
+             lambda e: get_content(e, 'html')),
+            ('refine_content.' + page,
+             lambda html=html: html,
+             lambda content, e=extractor: e.refine_content(
+                 content, REPLACE_RULES)),
+        ])
+
+    def archive(path):
+        archive = SimpleArchive('bench.zip', fixture.temp_dir)
+        for base, dirs, files in os.walk(path):
+            for name in files:
+                full_path = os.path.join(base, name)
+                archive.write_file(os.path.relpath(full_path, path),
+                                   full_path)
+        archive.finish()
+
+    storage = FileSystemStorage(location=os.path.join(fixture.temp_dir,
+                                                      'storage'))
+    benchmarks = [_ + (True,) for _ in benchmarks]
+    benchmarks.extend([
+        ('simple_archive', fixture.files, archive, False),
+        ('move_to_storage', fixture.files,
+         lambda path: move_to_storage(storage, path, 'results'), False),
+    ])
+    return benchmarks
+
+
+def get_number(function, argument):
+    """Return number of calls taking at least MIN_TIME"""
+    number = 1
+    while number < MAX_NUMBER:
+        start = time.time()
+        for i in range(number):
+            function(argument)
+        if time.time() - start >= MIN_TIME:
+            break
+        number *= 2
+    return number
+
+
+def run(benchmarks, repeat, selected=None):
+    results = {}
+    for name, setup, function, loop in benchmarks:
+        if selected and not any(name.startswith(_) for _ in selected):
+            continue
+        number = get_number(function, setup()) if loop else 1
+        times = []
+        for i in range(repeat):
+            argument = setup()
+            start = time.time()
+            for j in range(number):
+                function(argument)
+            times.append((time.time() - start) / number)
+        results[name] = {
+            'best': min(times),
+            'mean': sum(times) / len(times),
+            'runs': repeat,
+            'number': number,
+        }
+        print('{0:<32} {1:>10.5f} {2:>10.5f}'.format(
+            name, results[name]['best'], results[name]['mean']))
+    return results
+
+
+def compare(base_path, new_path, threshold):
+    """Print ratio of best times of two outputs, returns names of
+    regressed benchmarks"""
+    base = json.load(open(base_path))['results']
+    new = json.load(open(new_path))['results']
+    regressions = []
+    print('{0:<32} {1:>10} {2:>10} {3:>8}'.format(
+        'Benchmark', 'Base (s)', 'New (s)', 'Ratio'))
+    for name in sorted(set(base) & set(new)):
+        ratio = new[name]['best'] / base[name]['best'] \
+            if base[name]['best'] else 1.0
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = 'REGRESSION'
+            regressions.append(name)
+        elif ratio < 1 - threshold:
+            flag = 'faster'
+        print('{0:<32} {1:>10.5f} {2:>10.5f} {3:>8.2f} {4}'.format(
+            name, base[name]['best'], new[name]['best'], ratio, flag))
+    for name in sorted(set(base) ^ set(new)):
+        print('{0:<32} only in {1}'.format(
+            name, 'base' if name in base else 'new'))
+    return regressions
+
+
+def main():
+    parser = OptionParser(usage='%prog [--repeat N] [--output FILE] | '
+                                '--compare BASE NEW')
+    parser.add_option('--repeat', type='int', default=5)
+    parser.add_option('--posts', type='int', default=2000,
+                      help='Number of posts in the synthetic large page')
+    parser.add_option('--only', action='append', default=[],
+                      help='Only run benchmarks with this name prefix')
+    parser.add_option('--output', help='Write results as JSON to file')
+    parser.add_option('--compare', action='store_true', default=False,
+                      help='Compare two JSON outputs')
+    parser.add_option('--threshold', type='float', default=0.2,
+                      help='Allowed slowdown ratio when comparing')
+    options, args = parser.parse_args()
+
+    if options.compare:
+        if len(args) != 2:
+            parser.error('--compare needs BASE and NEW files')
+        regressions = compare(args[0], args[1], options.threshold)
+        if regressions:
+            print('{0} regression(s)'.format(len(regressions)))
+            sys.exit(1)
+        return
+
+    fixture = Fixture(options.posts)
+    try:
+        print('{0:<32} {1:>10} {2:>10}'.format(
+            'Benchmark', 'Best (s)', 'Mean (s)'))
+        results = run(get_benchmarks(fixture), options.repeat, options.only)
+    finally:
+        fixture.close()
+    if options.output:
+        with open(options.output, 'w') as output:
+            json.dump({
+                'version': FORMAT_VERSION,
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'python': platform.python_version(),
+                'posts': options.posts,
+                'results': results,
+            }, output, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
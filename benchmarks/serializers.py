@@ -0,0 +1,89 @@
+"""Compare serializers on crawl output built from the test pages.
+
+    python benchmarks/serializers.py [--pages 2000] [--repeat 5]
+
+Every available serializer (see SERIALIZER setting) dumps and loads the
+same Data of a crawl, the best time of each is printed with output size.
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+from optparse import OptionParser
+
+from django.conf import settings
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+DATA_DIR = os.path.join(ROOT, 'scraper', 'test_data')
+PAGES = ('yc.a0.html', 'yc.a1.html', 'yc.a2.html')
+
+sys.path.insert(0, ROOT)
+settings.configure(SCRAPER_SETTINGS={})
+
+from scraper.extractor import Extractor  # noqa
+from scraper.serializers import get_serializer, available_serializers  # noqa
+from scraper.utils import Data, Datum  # noqa
+
+
+def build_data(pages):
+    """Return Data like the one of a crawl with given number of pages,
+    extracted from the local test pages"""
+    temp_dir = tempfile.mkdtemp()
+    extracted = []
+    try:
+        for name in PAGES:
+            html = open(os.path.join(DATA_DIR, name)).read()
+            extractor = Extractor('http://local/' + name, html=html,
+                                  base_dir=temp_dir)
+            content, path = extractor.extract_content(
+                selectors={'post': ("//div[@class='post-body']", 'html')},
+                get_image=False)
+            content['links'] = extractor.extract_links()
+            extracted.append(content)
+    finally:
+        shutil.rmtree(temp_dir)
+    combined = {}
+    for i in range(pages):
+        combined['page-{0}'.format(i)] = {
+            'content': extracted[i % len(extracted)],
+            'url': 'http://local/page-{0}'.format(i),
+        }
+    data = Data(url='http://local/', uuid='benchmark')
+    data.add_result(Datum(combined, action='crawl', target='content'))
+    return data.dict
+
+
+def best_time(function, value, repeat):
+    times = []
+    for i in range(repeat):
+        start = time.time()
+        function(value)
+        times.append(time.time() - start)
+    return min(times)
+
+
+def main():
+    parser = OptionParser(usage='%prog [--pages N] [--repeat N]')
+    parser.add_option('--pages', type='int', default=2000)
+    parser.add_option('--repeat', type='int', default=5)
+    options, args = parser.parse_args()
+
+    data = build_data(options.pages)
+    row = '{0:<10} {1:>12} {2:>10} {3:>10}'
+    print(row.format('Name', 'Size', 'Dump (s)', 'Load (s)'))
+    for name in available_serializers():
+        serializer = get_serializer(name)
+        output = serializer.dumps(data)
+        print(row.format(
+            name, len(output),
+            '{0:.4f}'.format(best_time(serializer.dumps, data,
+                                       options.repeat)),
+            '{0:.4f}'.format(best_time(serializer.loads, output,
+                                       options.repeat))))
+
+
+if __name__ == '__main__':
+    main()
@@ -8,13 +8,22 @@ from django.conf import settings
 
 current_dir = os.path.dirname(os.path.realpath(__file__))
 
+# Test database is kept in a file, so it can be shared by worker processes
+# (see QueueProcessTests)
+database = {
+    "ENGINE": "django.db.backends.sqlite3",
+}
+test_name = os.path.join(current_dir, 'test_scraper.sqlite3')
+if django.VERSION >= (1, 7):
+    database["TEST"] = {"NAME": test_name}
+else:
+    database["TEST_NAME"] = test_name
+
 settings.configure(
     DEBUG=True,
     USE_TZ=True,
     DATABASES={
-        "default": {
-            "ENGINE": "django.db.backends.sqlite3",
-        }
+        "default": database,
     },
     ROOT_URLCONF="scraper.urls",
     INSTALLED_APPS=[
@@ -67,7 +76,7 @@ if hasattr(django, "setup"):
 from django_nose import NoseTestSuiteRunner
 
 
-test_runner = NoseTestSuiteRunner(verbosity=1)
+test_runner = NoseTestSuiteRunner(verbosity=1, interactive=False)
 failures = test_runner.run_tests(["scraper"])
 
 if failures:
@@ -1,12 +1,140 @@
+import urlparse
+import simplejson as json
+
+from django.conf.urls import url
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.core.urlresolvers import reverse
+from django.db import connections
+from django.shortcuts import get_object_or_404
+from django.template.response import TemplateResponse
+from django.utils.html import format_html
 
 import models
 
+
+# Tables smaller than this are counted exactly
+ESTIMATE_THRESHOLD = 10000
+
+
+def estimate_count(queryset):
+    """ Return estimated number of rows of unfiltered queryset, taken from
+    PostgreSQL statistics. None if not available or the table is small. """
+    query = getattr(queryset, 'query', None)
+    if query is None or query.where:
+        return None
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    cursor = connection.cursor()
+    try:
+        cursor.execute('SELECT reltuples FROM pg_class WHERE relname = %s',
+                       [queryset.model._meta.db_table])
+        row = cursor.fetchone()
+    finally:
+        cursor.close()
+    if row and row[0] >= ESTIMATE_THRESHOLD:
+        return int(row[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    """ Paginator of big tables, COUNT(*) of the whole table is replaced by
+    the estimate of database if available """
+
+    def _get_count(self):
+        if self._count is None:
+            self._count = estimate_count(self.object_list)
+        return super(EstimatedCountPaginator, self)._get_count()
+    count = property(_get_count)
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    # Filtered lists are not counted again without filters (Django 1.8+)
+    show_full_result_count = False
+
+
+class ResultAdmin(LargeTableAdmin):
+    list_display = ('task_id', 'spider', 'created_time', 'other',
+                    'items_link')
+    list_filter = ('created_time',)
+    list_select_related = ('other', 'spider')
+    search_fields = ('=task_id',)
+    date_hierarchy = 'created_time'
+    raw_id_fields = ('spider', 'other')
+    exclude = ('data',)
+    readonly_fields = ('summary', 'items_link')
+    items_per_page = 20
+
+    def get_queryset(self, request):
+        # JSON data could be huge, it's only loaded for a single result
+        return super(ResultAdmin, self).get_queryset(request).defer('data')
+
+    def get_urls(self):
+        urls = [
+            url(r'^(\d+)/items/$',
+                self.admin_site.admin_view(self.items_view),
+                name='scraper_result_items'),
+        ]
+        return urls + super(ResultAdmin, self).get_urls()
+
+    def summary(self, obj):
+        data = obj.data or {}
+        return format_html(
+            'URL: {0}<br>Time: {1} - {2}<br>Stats: {3}',
+            data.get('url'), data.get('start'), data.get('end'),
+            json.dumps(data.get('stats', {}), sort_keys=True))
+
+    def items_link(self, obj):
+        if obj.pk is None:
+            return ''
+        return format_html(
+            '<a href="{0}">Pages</a>',
+            reverse('admin:scraper_result_items', args=[obj.pk]))
+    items_link.short_description = 'Pages'
+
+    def items_view(self, request, object_id):
+        """ Show pages of single result, one page of items at a time """
+        result = get_object_or_404(self.get_queryset(request), pk=object_id)
+        try:
+            number = max(int(request.GET.get('page', 1)), 1)
+        except ValueError:
+            number = 1
+        start = (number - 1) * self.items_per_page
+        # One more item is loaded to know if there is next page
+        pages = result.get_pages(start, self.items_per_page + 1)
+        # Scraped URLs are only linked if they are HTTP(S) ones, not to run
+        # javascript: or other URLs in the admin
+        items = [{'url': _['url'],
+                  'link': urlparse.urlparse(_['url'] or '').scheme.lower() in
+                  ('http', 'https'),
+                  'content': json.dumps(_['content'], indent=2)}
+                 for _ in pages[:self.items_per_page]]
+        context = {
+            'title': u'Pages of {0}'.format(result),
+            'opts': self.model._meta,
+            'original': result,
+            'items': items,
+            'page': number,
+            'has_previous': number > 1,
+            'has_next': len(pages) > self.items_per_page,
+        }
+        return TemplateResponse(
+            request, 'admin/scraper/result/items.html', context)
+
+
+class LocalContentAdmin(LargeTableAdmin):
+    list_display = ('url', 'local_path', 'created_time', 'state')
+    list_filter = ('created_time',)
+    search_fields = ('=url',)
+    date_hierarchy = 'created_time'
+
+
 admin.site.register(models.Spider)
 admin.site.register(models.Collector)
 admin.site.register(models.Selector)
 
-admin.site.register(models.Result)
-admin.site.register(models.LocalContent)
+admin.site.register(models.Result, ResultAdmin)
+admin.site.register(models.LocalContent, LocalContentAdmin)
 admin.site.register(models.UserAgent)
 admin.site.register(models.ProxyServer)
@@ -1,6 +1,7 @@
 import urlparse
 import os
 
+from collections import namedtuple
 from datetime import datetime
 
 from django.db import models
@@ -13,6 +14,13 @@ from .exceptions import ExtractorNotSet
 
 logger = getLogger('scraper')
 
+# Settings of a crawl loaded from database once, when operating starts:
+#   proxies, user_agent - Values passed to extractors
+#   collector - Collector extracting target pages (None if missing)
+#   plan - Extraction plan of the collector, see Spider.get_plan()
+CrawlContext = namedtuple('CrawlContext',
+                          ['proxies', 'user_agent', 'collector', 'plan'])
+
 
 class BaseCrawl(models.Model):
     """Provides base class for crawling and extracting classes"""
@@ -23,6 +31,12 @@ class BaseCrawl(models.Model):
     user_agent = models.ForeignKey(
         'UserAgent', blank=True, null=True, on_delete=models.PROTECT)
     _storage_location = None
+    stats = None
+    # Writer of result files, extractors use the temporary dir if missing
+    writer = None
+    # CrawlContext of current operation, related objects are queried every
+    # time if missing
+    context = None
 
     class Meta:
         abstract = True
@@ -36,21 +50,28 @@ class BaseCrawl(models.Model):
         return self._storage_location
 
     def get_proxy(self):
+        if self.context is not None:
+            return self.context.proxies
         return self.proxy.get_dict() if self.proxy else None
 
     def get_ua(self):
+        if self.context is not None:
+            return self.context.user_agent
         return self.user_agent.value if self.user_agent else None
 
-    def _new_extractor(self, url):
+    def _new_extractor(self, url, html=''):
         """Return Extractor instance with given URL. If URL invalid, None will be
-        returned"""
+        returned. The page is not downloaded if html is given."""
         splitted_url = urlparse.urlsplit(url)
         if splitted_url.scheme and splitted_url.netloc:
             extractor = Extractor(
                 url,
+                html=html,
                 base_dir=os.path.join(TEMP_DIR, self.storage_location),
                 proxies=self.get_proxy(),
-                user_agent=self.get_ua()
+                user_agent=self.get_ua(),
+                stats=self.stats,
+                writer=self.writer,
             )
             return extractor
         else:
@@ -9,6 +9,17 @@ logger = getLogger('scraper')
 EXCLUDED_ATTRIBS = ('html')
 
 INDEX_JSON = 'index.json'
+INDEX_JSONL = 'index.jsonl'
+
+# Size of blocks used when copying files around
+CHUNK_SIZE = 64 * 1024
+
+# Files of these types are already compressed, archives store them as-is
+COMPRESSED_EXTENSIONS = (
+    'jpg', 'jpeg', 'png', 'gif', 'webp', 'ico', 'mp3', 'mp4', 'm4a', 'ogg',
+    'webm', 'avi', 'mov', 'flv', 'zip', 'gz', 'tgz', 'bz2', 'xz', '7z', 'rar',
+    'pdf', 'woff', 'woff2',
+)
 
 DATETIME_FORMAT = '%Y/%m/%d %H:%I:%S'
 
@@ -30,12 +41,61 @@ PROTOCOLS = (
     ('https', 'HTTPS'),
 )
 
+# Operations which don't need to download the spider page
+OFFLINE_ACTIONS = ('reextract',)
+
+LINK_KINDS = (
+    ('target', 'Target link'),
+    ('expand', 'Expand link'),
+)
+
+QUEUE_PENDING, QUEUE_LEASED, QUEUE_DONE, QUEUE_FAILED = range(4)
+QUEUE_STATES = (
+    (QUEUE_PENDING, 'Pending'),
+    (QUEUE_LEASED, 'Leased'),
+    (QUEUE_DONE, 'Done'),
+    (QUEUE_FAILED, 'Failed'),
+)
+
 SETTINGS = getattr(settings, 'SCRAPER_SETTINGS', {})
 
 COMPRESS_RESULT = SETTINGS.get('COMPRESS_RESULT', False)
 TEMP_DIR = SETTINGS.get('TEMP_DIR', '/tmp/scraper')
+# Write results directly to storage (or archive) instead of TEMP_DIR
+DIRECT_WRITE = SETTINGS.get('DIRECT_WRITE', False)
+# Store crawled pages as ResultItem rows, inserted by batches
+RESULT_ITEMS = SETTINGS.get('RESULT_ITEMS', False)
+RESULT_BATCH = SETTINGS.get('RESULT_BATCH', 500)
+# Append crawled pages to JSON Lines index instead of keeping in memory
+STREAM_INDEX = SETTINGS.get('STREAM_INDEX', False)
+# Format of Data, Datum and index files: json (compact), pretty, ujson,
+# orjson or msgpack
+SERIALIZER = SETTINGS.get('SERIALIZER', 'json')
+# Directory keeping raw pages by content hash (disabled if empty), and the
+# compression of stored blobs: zlib or zstd
+SNAPSHOT_DIR = SETTINGS.get('SNAPSHOT_DIR', '')
+SNAPSHOT_COMPRESSION = SETTINGS.get('SNAPSHOT_COMPRESSION', 'zlib')
+# Number of kept pages sent to each worker at once when extracting again
+REEXTRACT_CHUNK = SETTINGS.get('REEXTRACT_CHUNK', 64)
+# Directory of WARC files written and read by the WARC loaders
+WARC_DIR = SETTINGS.get('WARC_DIR', 'warc')
 CRAWL_ROOT = SETTINGS.get('CRAWL_ROOT', '')
 NO_TASK_PREFIX = SETTINGS.get('NO_TASK_ID_PREFIX', '')
+# Number of processes parsing and extracting pages while crawling. When 0,
+# pages are fetched and extracted one by one in current process.
+CRAWL_WORKERS = SETTINGS.get('CRAWL_WORKERS', 0)
+FETCH_THREADS = SETTINGS.get('FETCH_THREADS', 8)
+# Number of seed URLs (from sitemaps,...) put into the crawl at once
+SEED_BATCH = SETTINGS.get('SEED_BATCH', 100)
+# Distributed crawling: seconds a worker holds a queued link, seconds to wait
+# when queue is empty and number of tries before a link is marked failed
+QUEUE_LEASE_TIMEOUT = SETTINGS.get('QUEUE_LEASE_TIMEOUT', 300)
+QUEUE_POLL_INTERVAL = SETTINGS.get('QUEUE_POLL_INTERVAL', 2)
+QUEUE_MAX_ATTEMPTS = SETTINGS.get('QUEUE_MAX_ATTEMPTS', 3)
+# Scheduled crawling: maximum random delay (seconds) added to start time of
+# due spiders, and seconds after which a running lock is considered stale
+SCHEDULE_JITTER = SETTINGS.get('SCHEDULE_JITTER', 60)
+SCHEDULE_LOCK_TIMEOUT = SETTINGS.get('SCHEDULE_LOCK_TIMEOUT', 6 * 3600)
 
 custom_loader = None
 if SETTINGS.get('CUSTOM_LOADER', None):
@@ -1,2 +1,12 @@
 class ExtractorNotSet(Exception):
     pass
+
+
+class BudgetExceeded(Exception):
+    """Raised when a crawl runs out of one of its budgets"""
+
+    def __init__(self, budget, limit):
+        self.budget = budget
+        self.limit = limit
+        super(BudgetExceeded, self).__init__(
+            '{0} ({1}) reached'.format(budget, limit))
@@ -2,18 +2,78 @@ import requests
 import os
 import re
 import logging
+import threading
 import urlparse
 
 from os.path import join
+from contextlib import contextmanager
 from lxml import etree
 from readability.readability import Document
 
 from .config import DEFAULT_REPLACE_RULES, custom_loader
-from .utils import complete_url, get_uuid, get_link_info, get_content
+from .utils import complete_url, get_link_info, get_content, CrawlStats
+from .writers import FileWriter
+from .timing import timed
 
 
 logger = logging.getLogger('scraper')
 
+# Semaphore limiting the number of simultaneous downloads, could be shared
+# by multiple processes
+_fetch_slots = None
+
+# HTTP sessions are kept per thread, so connections are reused
+_local = threading.local()
+
+
+def get_session():
+    """Return HTTP session of current thread. Forked processes (workers of
+    Pipeline) get new sessions, connections of the parent are not shared."""
+    if not hasattr(_local, 'session') or \
+            getattr(_local, 'pid', os.getpid()) != os.getpid():
+        _local.session = requests.Session()
+        _local.pid = os.getpid()
+    return _local.session
+
+
+def set_fetch_limit(slots):
+    """Limit simultaneous downloads by given semaphore, None to unset"""
+    global _fetch_slots
+    _fetch_slots = slots
+
+
+@contextmanager
+def fetch_slot():
+    """Wait for a free download slot if the limit is set"""
+    if _fetch_slots is None:
+        yield
+        return
+    _fetch_slots.acquire()
+    try:
+        yield
+    finally:
+        _fetch_slots.release()
+
+
+def get_source(url, headers=None, proxies=None):
+    """Loads page content from given URL, using the custom loader if set
+    Returns: HTML content (source)
+    """
+    try:
+        arguments = {
+            'url': url,
+            'headers': headers or {},
+            'proxies': proxies
+        }
+        with fetch_slot():
+            if custom_loader:
+                content = custom_loader.get_source(**arguments)
+            else:
+                content = get_session().get(**arguments).content
+        return content
+    except:
+        logger.exception('Unable to browse \'{0}\''.format(url))
+
 
 class Extractor(object):
     _url = ''
@@ -24,13 +84,17 @@ class Extractor(object):
     headers = {}
 
     def __init__(self, url, base_dir='.', html='', proxies=None,
-                 user_agent=None):
+                 user_agent=None, stats=None, writer=None):
         self.proxies = proxies
-        self.headers['User-Agent'] = user_agent if user_agent else ''
+        self.stats = stats if stats is not None else CrawlStats()
+        # Own headers of each extractor, spiders could run in threads
+        self.headers = {'User-Agent': user_agent if user_agent else ''}
         self.base_dir = base_dir
+        self.writer = writer or FileWriter(base_dir)
         self.load_source(url, html)
         self._location = self.location
 
+    @timed('xpath')
     def xpath(self, value):
         """Supports calling xpath() from root element"""
         try:
@@ -55,24 +119,16 @@ class Extractor(object):
         self.root = self.parse_content(html)
         self._url = url
 
+    @timed('get_source')
     def get_source(self, url):
         """Loads page content from given URL
         Returns: HTML content (source)
         """
-        try:
-            arguments = {
-                'url': url,
-                'headers': self.headers,
-                'proxies': self.proxies
-            }
-            if custom_loader:
-                content = custom_loader.get_source(**arguments)
-            else:
-                content = requests.get(**arguments).content
-            return content
-        except:
-            logger.exception('Unable to browse \'{0}\''.format(url))
+        content = get_source(url, self.headers, self.proxies)
+        self.stats.add_page(content)
+        return content
 
+    @timed('parse_content')
     def parse_content(self, html=''):
         """ Returns etree._Element object of target page
             html - If provided, this will be used over content at given url
@@ -86,10 +142,15 @@ class Extractor(object):
     @property
     def location(self):
         if not self._location:
-            self._uuid = get_uuid(self._url, self.base_dir)
-            self._location = os.path.join(self.base_dir, self._uuid)
+            self._uuid = self.writer.new_id(self._url)
+            self._location = self.writer.location(self._uuid)
         return self._location
 
+    def set_writer(self, writer):
+        """Write files of this page by given writer, the page ID is kept"""
+        self.writer = writer
+        self._location = writer.location(self._uuid)
+
     def complete_url(self, path):
         return complete_url(self._url, path)
 
@@ -120,7 +181,7 @@ class Extractor(object):
         return found_links
 
     def extract_content(self, selectors={}, get_image=True, replace_rules=[],
-                        black_words=[]):
+                        black_words=[], get_media=True):
         """ Extract the content from current extractor page following rules in
         selectors.
 
@@ -129,6 +190,7 @@ class Extractor(object):
             get_image - Download images if having HTML content
             replace_rules - List of rules for removing useless text data
             black_words - Process will stop if one of these words found
+            get_media - Download files of binary selectors
 
         Returns - List of content dict and path to temp directory if existing
             (
@@ -153,6 +215,8 @@ class Extractor(object):
 
             # Different handlers for each data_type value
             if data_type == 'binary':
+                if not get_media:
+                    continue
                 for url in elements:
                     # The element must be string to downloadable target
                     if not (isinstance(url, basestring) and url.strip()):
@@ -163,7 +227,8 @@ class Extractor(object):
                     if file_name:
                         media.append((file_name, description))
             else:
-                tmp_content = get_content(elements, data_type)
+                with self.stats.span('get_content'):
+                    tmp_content = get_content(elements, data_type)
 
                 # Stop operation if black word found
                 for word in black_words:
@@ -218,21 +283,18 @@ class Extractor(object):
         return imeta
 
     def write_file(self, file_name, content):
-        """ Write file to temporary directory """
-        file_path = os.path.join(self.location, file_name)
+        """ Write file into page location, by the writer """
         try:
-            if not os.path.exists(self.location):
-                os.makedirs(self.location)
-            with open(file_path, 'w') as mfile:
-                mfile.write(content)
-            return file_path
+            return self.writer.write(join(self._uuid, file_name), content)
         except (OSError, IOError):
-            logger.exception('Cannot create file: {0}'.format(file_path))
+            logger.exception('Cannot create file: {0}'.format(
+                join(self.location, file_name)))
 
     def get_path(self, file_name):
         """ Return full path of file (include containing directory) """
         return join(self._location, os.path.basename(file_name))
 
+    @timed('download_file')
     def download_file(self, url):
         """ Download file from given url and save to common location """
         file_url = url.strip()
@@ -242,16 +304,29 @@ class Extractor(object):
         lives = 3
         while lives:
             try:
-                response = requests.get(file_url, headers=self.headers,
-                                        proxies=self.proxies)
-                if response.status_code == 200:
-                    if self.write_file(file_name, response.content):
+                with fetch_slot():
+                    content = self.fetch_file(file_url)
+                if content is not None:
+                    if self.write_file(file_name, content):
+                        self.stats.add(files=1, bytes=len(content))
                         return file_name
                 else:
                     logger.error('Cannot downloading file %s' % url)
             except requests.ConnectionError:
                 logger.info('Retry downloading file: %s' % file_url)
             lives -= 1
+        self.stats.add(errors=1)
+
+    def fetch_file(self, url):
+        """Return content of file at URL, None if it's not available. The
+        custom loader is used if it can fetch files (has get_file())."""
+        if custom_loader and hasattr(custom_loader, 'get_file'):
+            return custom_loader.get_file(
+                url, headers=self.headers, proxies=self.proxies)
+        response = get_session().get(
+            url, headers=self.headers, proxies=self.proxies)
+        if response.status_code == 200:
+            return response.content
 
     def refine_content(self, content, custom_rules=None):
         """ rules should adapt formats:
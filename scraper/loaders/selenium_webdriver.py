@@ -1,3 +1,6 @@
+import atexit
+import Queue
+
 from selenium import webdriver
 from selenium.webdriver.firefox.firefox_profile import FirefoxProfile
 from selenium.common.exceptions import WebDriverException
@@ -7,6 +10,9 @@ from django.utils.log import getLogger
 
 logger = getLogger('scraper')
 
+# Idle browsers, which are reused for next pages instead of starting new ones
+_drivers = Queue.Queue()
+
 
 def get_profile():
     profile = FirefoxProfile()
@@ -17,13 +23,39 @@ def get_profile():
     return profile
 
 
+def get_driver():
+    """ Return an idle browser, or start new one """
+    try:
+        return _drivers.get_nowait()
+    except Queue.Empty:
+        return webdriver.Firefox(firefox_profile=get_profile())
+
+
+def quit_drivers():
+    """ Close all idle browsers """
+    while True:
+        try:
+            _drivers.get_nowait().quit()
+        except Queue.Empty:
+            break
+
+
+atexit.register(quit_drivers)
+
+
 def get_source(url, headers=[], proxies=[]):
     """ Get HTML content of page at given URL """
+    driver = None
     try:
-        driver = webdriver.Firefox(firefox_profile=get_profile())
+        driver = get_driver()
         driver.get(url)
-        return driver.page_source
+        source = driver.page_source
+        # Browser is put back for next pages only if working fine
+        _drivers.put(driver)
+        driver = None
+        return source
     except WebDriverException:
         logger.exception('Unable to browse page: {0}'.format(url))
     finally:
-        driver.quit()
+        if driver is not None:
+            driver.quit()
@@ -0,0 +1,43 @@
+"""Loader fetching pages and files over HTTP like the default one, while
+recording every response into WARC files of WARC_DIR. Enabled by:
+    CUSTOM_LOADER = 'scraper.loaders.warc_record'
+"""
+import os
+import threading
+
+from scraper.warc import WARCWriter
+
+
+_writer = None
+_lock = threading.Lock()
+
+
+def get_writer():
+    """Return WARC writer of current process, every process (crawl worker)
+    writes its own file"""
+    global _writer
+    with _lock:
+        if _writer is None or _writer.pid != os.getpid():
+            # Imported here, config is still loading when loader is imported
+            from scraper.config import WARC_DIR
+            _writer = WARCWriter(WARC_DIR)
+        return _writer
+
+
+def fetch(url, headers=None, proxies=None):
+    from scraper.extractor import get_session
+    response = get_session().get(url, headers=headers or {}, proxies=proxies)
+    get_writer().write_response(url, response.status_code, response.reason,
+                                response.headers, response.content)
+    return response
+
+
+def get_source(url, headers=None, proxies=None):
+    return fetch(url, headers, proxies).content
+
+
+def get_file(url, headers=None, proxies=None):
+    """Return content of file at URL, None if it's not available"""
+    response = fetch(url, headers, proxies)
+    if response.status_code == 200:
+        return response.content
@@ -0,0 +1,45 @@
+"""Loader serving pages and files from WARC files of WARC_DIR, recorded by
+scraper.loaders.warc_record (or other tools), nothing is fetched from the
+network. URLs which were not recorded are not available. Enabled by:
+    CUSTOM_LOADER = 'scraper.loaders.warc_replay'
+"""
+import logging
+import threading
+
+from scraper.warc import WARCArchive
+
+
+logger = logging.getLogger('scraper')
+
+_archive = None
+_lock = threading.Lock()
+
+
+def get_archive():
+    """Return archive of WARC_DIR, indexes are loaded on first use"""
+    global _archive
+    with _lock:
+        if _archive is None:
+            from scraper.config import WARC_DIR
+            _archive = WARCArchive(WARC_DIR)
+        return _archive
+
+
+def get_response(url):
+    response = get_archive().get(url)
+    if response is None:
+        logger.info('Not recorded: {0}'.format(url))
+    return response
+
+
+def get_source(url, headers=None, proxies=None):
+    response = get_response(url)
+    if response is not None:
+        return response[2]
+
+
+def get_file(url, headers=None, proxies=None):
+    """Return content of file at URL, None if it's not available"""
+    response = get_response(url)
+    if response is not None and response[0] == 200:
+        return response[2]
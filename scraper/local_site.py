@@ -0,0 +1,215 @@
+"""Synthetic web site served over HTTP on localhost, for crawling tests and
+benchmarks without network access.
+
+    with LocalSite(pages=1000, fan_out=20, depth=3, latency=0.01) as site:
+        spider = Spider(url=site.url, crawl_depth=site.depth, ...)
+
+Listing pages form a tree: each one links to `fan_out` articles (targets,
+"//div[@class='post-title']/h2/a") and to `fan_out` child listings (expand
+links, '//a[@rel="next"]') down to `depth` levels. Articles have their
+text in "//div[@class='post-body']" with `images` images each.
+"""
+import re
+import time
+import random
+import socket
+import threading
+
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+
+
+# 1x1 transparent GIF
+IMAGE = ('GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff!\xf9'
+         '\x04\x01\x00\x00\x00\x00,\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02'
+         '\x02D\x01\x00;')
+TEXT = ('Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do '
+        'eiusmod tempor incididunt ut labore et dolore magna aliqua. ')
+
+LISTING_PATH = re.compile(r'^/(?:list/(\d+))?$')
+POST_PATH = re.compile(r'^/post/(\d+)$')
+IMAGE_PATH = re.compile(r'^/img/[\w.-]+$')
+
+
+class SiteHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so crawler sessions reuse connections
+    protocol_version = 'HTTP/1.1'
+    # Responses are written at once, small writes would be delayed by Nagle
+    # algorithm and delayed ACK
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        site = self.server.site
+        site.count_request()
+        if site.latency:
+            time.sleep(site.get_latency())
+        status, content_type, body = site.render(self.path.split('?')[0])
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class SiteServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, *args, **kwargs):
+        HTTPServer.__init__(self, *args, **kwargs)
+        self.connections = set()
+
+    def process_request_thread(self, request, client_address):
+        # Kept-alive connections are tracked, to be closed on stop
+        self.connections.add(request)
+        try:
+            ThreadingMixIn.process_request_thread(
+                self, request, client_address)
+        finally:
+            self.connections.discard(request)
+
+    def close_connections(self, timeout=1):
+        for connection in list(self.connections):
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+        # Wait for handler threads to finish
+        deadline = time.time() + timeout
+        while self.connections and time.time() < deadline:
+            time.sleep(0.01)
+
+    def handle_error(self, request, client_address):
+        # Clients dropping connections are not errors of the site
+        pass
+
+
+class LocalSite(object):
+    """Synthetic site served by a threaded HTTP server
+    Arguments:
+        pages - Number of articles
+        fan_out - Number of articles and child listings of each listing
+        depth - Number of listing levels
+        latency - Seconds each response is delayed
+        jitter - Random extra delay, up to this number of seconds
+        images - Number of images in each article
+        page_size - Approximate size of article text, in bytes
+    """
+
+    def __init__(self, pages=100, fan_out=10, depth=2, latency=0, jitter=0,
+                 images=0, page_size=2000, port=0):
+        self.pages = pages
+        self.fan_out = max(fan_out, 1)
+        self.depth = max(depth, 1)
+        self.latency = latency
+        self.jitter = jitter
+        self.images = images
+        self.page_size = page_size
+        self.port = port
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{0}/'.format(self.port)
+
+    @property
+    def articles(self):
+        """Number of articles linked from listings (reachable by crawling)"""
+        count = 0
+        index = 0
+        while self.has_listing(index):
+            count += len(self.listing_articles(index))
+            index += 1
+        return count
+
+    def start(self):
+        self._server = SiteServer(('127.0.0.1', self.port), SiteHandler)
+        self._server.site = self
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, kwargs={'poll_interval': 0.1})
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.close_connections()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def get_latency(self):
+        return self.latency + random.uniform(0, self.jitter)
+
+    def get_level(self, index):
+        level = 0
+        while index > 0:
+            index = (index - 1) // self.fan_out
+            level += 1
+        return level
+
+    def has_listing(self, index):
+        return index * self.fan_out < self.pages and \
+            self.get_level(index) < self.depth
+
+    def listing_articles(self, index):
+        start = index * self.fan_out
+        return range(start, min(start + self.fan_out, self.pages))
+
+    def render(self, path):
+        """Return (status, content type, body) of page at path"""
+        match = LISTING_PATH.match(path)
+        if match and self.has_listing(int(match.group(1) or 0)):
+            return 200, 'text/html', self.render_listing(
+                int(match.group(1) or 0))
+        match = POST_PATH.match(path)
+        if match and int(match.group(1)) < self.pages:
+            return 200, 'text/html', self.render_post(int(match.group(1)))
+        if IMAGE_PATH.match(path):
+            return 200, 'image/gif', IMAGE
+        return 404, 'text/html', '<html><body>Not found</body></html>'
+
+    def render_listing(self, index):
+        parts = ['<html><head><title>Listing {0}</title></head><body>'.format(
+            index)]
+        for i in self.listing_articles(index):
+            parts.append(
+                '<div class="post-title"><h2><a href="/post/{0}">Post {0}'
+                '</a></h2></div>'.format(i))
+        first = index * self.fan_out + 1
+        for child in range(first, first + self.fan_out):
+            if self.has_listing(child):
+                parts.append('<a rel="next" href="/list/{0}">Next</a>'.format(
+                    child))
+        parts.append('</body></html>')
+        return ''.join(parts)
+
+    def render_post(self, index):
+        text = TEXT * max(self.page_size // len(TEXT), 1)
+        images = ''.join(
+            '<img src="/img/{0}-{1}.gif" alt="">'.format(index, i)
+            for i in range(self.images))
+        return (
+            '<html><head><title>Post {0}</title></head><body>'
+            '<div class="post-title"><h2>Post {0}</h2></div>'
+            '<div class="post-body"><p>{1}</p>{2}</div>'
+            '</body></html>').format(index, text, images)
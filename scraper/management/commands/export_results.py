@@ -0,0 +1,156 @@
+import csv
+import simplejson as json
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils.dateparse import parse_date, parse_datetime
+
+from scraper.models import Result
+from scraper.serializers import get_line_serializer
+from scraper.utils import iter_queryset
+
+
+FORMATS = ('jsonl', 'csv')
+BASE_FIELDS = ['result', 'task_id', 'url']
+
+
+def iter_records(results, full=False):
+    """ Yield one record per page of given results, or per result if full
+    is True (with the whole data) """
+    for result in results:
+        if full:
+            yield {'result': result.pk, 'task_id': result.task_id,
+                   'data': result.data}
+            continue
+        for page in result.iter_pages():
+            yield {'result': result.pk, 'task_id': result.task_id,
+                   'url': page['url'], 'content': page['content']}
+
+
+def flatten(record):
+    """ Put content values next to the base fields, as CSV row """
+    row = dict((key, record.get(key)) for key in BASE_FIELDS)
+    content = record.get('content', record.get('data'))
+    if isinstance(content, dict):
+        row.update(content)
+    else:
+        row['content'] = content
+    for key, value in row.items():
+        if isinstance(value, unicode):
+            row[key] = value.encode('utf-8')
+        elif value is not None and not isinstance(value, (str, int, long)):
+            row[key] = json.dumps(value)
+    return row
+
+
+class Output(object):
+    """ File-like object passing written data to given function """
+
+    def __init__(self, write):
+        self.write = write
+
+
+def parse_time(value):
+    parsed = parse_datetime(value) or parse_date(value)
+    if parsed is None:
+        raise CommandError('Invalid date: {0}'.format(value))
+    return parsed
+
+
+class Command(BaseCommand):
+    """ Export results as JSON Lines or CSV, one record per crawled page.
+    Results are loaded by chunks and records are written one by one, so
+    memory use doesn't grow with the number of results. """
+
+    option_list = BaseCommand.option_list + (
+        make_option('--task', dest='tasks', action='append', default=[],
+                    help='Task ID of result (repeatable)'),
+        make_option('--spider', dest='spiders', action='append', default=[],
+                    help='ID or name of spider producing results '
+                         '(repeatable)'),
+        make_option('--since', dest='since', default=None,
+                    help='Only results created from this date/time'),
+        make_option('--until', dest='until', default=None,
+                    help='Only results created before this date/time'),
+        make_option('--format', dest='format', default='jsonl',
+                    help='Output format: jsonl (default) or csv'),
+        make_option('--fields', dest='fields', default=None,
+                    help='Content fields of CSV columns, comma separated. '
+                         'Fields of the first page are used if missing'),
+        make_option('--full', dest='full', action='store_true',
+                    default=False,
+                    help='Export the whole data of each result, instead of '
+                         'its pages'),
+        make_option('--output', dest='output', default=None,
+                    help='Output file, standard output if missing'),
+        make_option('--chunk', dest='chunk', type='int', default=500,
+                    help='Number of results loaded at once'),
+    )
+
+    def handle(self, *args, **options):
+        if options['format'] not in FORMATS:
+            raise CommandError('Unknown format: {0}'.format(
+                options['format']))
+        results = iter_queryset(self.get_queryset(options),
+                                options['chunk'])
+        records = iter_records(results, options['full'])
+        if options['output']:
+            output = open(options['output'], 'wb')
+        else:
+            # Encoded lines are written as they are, with no extra ending
+            output = Output(lambda line: self.stdout.write(line, ending=''))
+        try:
+            if options['format'] == 'csv':
+                count = self.write_csv(output, records, options['fields'])
+            else:
+                count = self.write_jsonl(output, records)
+        finally:
+            if options['output']:
+                output.close()
+        if options['output']:
+            self.stdout.write('{0} record(s) exported to {1}'.format(
+                count, options['output']))
+
+    def get_queryset(self, options):
+        queryset = Result.objects.select_related('other')
+        if options['tasks']:
+            queryset = queryset.filter(task_id__in=options['tasks'])
+        if options['spiders']:
+            ids = [_ for _ in options['spiders'] if _.isdigit()]
+            names = [_ for _ in options['spiders'] if not _.isdigit()]
+            queryset = queryset.filter(
+                Q(spider__pk__in=ids) | Q(spider__name__in=names))
+        if options['since']:
+            queryset = queryset.filter(
+                created_time__gte=parse_time(options['since']))
+        if options['until']:
+            queryset = queryset.filter(
+                created_time__lt=parse_time(options['until']))
+        return queryset
+
+    def write_jsonl(self, output, records):
+        dumps = get_line_serializer().dumps
+        count = 0
+        for record in records:
+            output.write(dumps(record) + '\n')
+            count += 1
+        return count
+
+    def write_csv(self, output, records, fields=None):
+        writer = None
+        count = 0
+        for record in records:
+            row = flatten(record)
+            if writer is None:
+                if fields:
+                    columns = [_.strip() for _ in fields.split(',')]
+                else:
+                    columns = sorted(set(row) - set(BASE_FIELDS))
+                writer = csv.DictWriter(output, BASE_FIELDS + columns,
+                                        extrasaction='ignore')
+                writer.writeheader()
+            writer.writerow(row)
+            count += 1
+        return count
@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from scraper.models import Result, purge_results
+
+
+class Command(BaseCommand):
+    """ Delete old results with their local contents, files and snapshots.
+    Results are selected by queries and deleted by chunks, files are
+    removed in parallel. """
+
+    option_list = BaseCommand.option_list + (
+        make_option('--days', dest='days', type='int', default=None,
+                    help='Delete results older than this number of days'),
+        make_option('--keep', dest='keep', type='int', default=None,
+                    help='Keep this number of latest results of each spider'),
+        make_option('--spider', dest='spiders', action='append', default=[],
+                    help='Only results of this spider (ID or name, '
+                         'repeatable)'),
+        make_option('--task', dest='tasks', action='append', default=[],
+                    help='Task ID of result to delete (repeatable)'),
+        make_option('--chunk', dest='chunk', type='int', default=500,
+                    help='Number of results deleted at once'),
+        make_option('--workers', dest='workers', type='int', default=8,
+                    help='Number of threads deleting files'),
+        make_option('--dry-run', dest='dry_run', action='store_true',
+                    default=False,
+                    help='Only count the results to be deleted'),
+    )
+
+    def handle(self, *args, **options):
+        if not any((options['days'] is not None, options['keep'] is not None,
+                    options['spiders'], options['tasks'])):
+            raise CommandError('One of --days, --keep, --spider or --task '
+                               'is required')
+        queryset = self.get_queryset(options)
+        if options['dry_run']:
+            self.stdout.write('{0} result(s) would be deleted'.format(
+                queryset.count()))
+            return
+        summary = purge_results(queryset, options['chunk'],
+                                options['workers'])
+        self.stdout.write(
+            'Deleted {results} result(s), {contents} local content(s), '
+            '{files} file(s) and {snapshots} snapshot(s)'.format(**summary))
+
+    def get_queryset(self, options):
+        queryset = Result.objects.all()
+        if options['tasks']:
+            queryset = queryset.filter(task_id__in=options['tasks'])
+        if options['spiders']:
+            ids = [_ for _ in options['spiders'] if _.isdigit()]
+            names = [_ for _ in options['spiders'] if not _.isdigit()]
+            queryset = queryset.filter(
+                Q(spider__pk__in=ids) | Q(spider__name__in=names))
+        if options['days'] is not None:
+            queryset = queryset.filter(created_time__lt=datetime.now() -
+                                       timedelta(days=options['days']))
+        if options['keep'] is not None:
+            queryset = queryset.exclude(pk__in=self.get_kept(
+                queryset, options['keep']))
+        return queryset
+
+    def get_kept(self, queryset, keep):
+        """ Return IDs of the latest results of each spider """
+        kept = []
+        spiders = queryset.order_by().values_list(
+            'spider', flat=True).distinct()
+        for spider in list(spiders):
+            kept.extend(Result.objects.filter(spider=spider).order_by(
+                '-created_time', '-pk').values_list('pk', flat=True)[:keep])
+        return kept
@@ -0,0 +1,59 @@
+import time
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from scraper.models import Spider
+
+
+class Command(BaseCommand):
+    """ Extract again pages kept from previous crawls, without downloading
+    anything, then save the output as new result """
+    args = '<spider ID or name>'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--result', dest='result', type='int', default=None,
+                    help='ID of Result whose page snapshots are extracted'),
+        make_option('--content', dest='local_content', type='int',
+                    default=None,
+                    help='ID of LocalContent whose page snapshots are '
+                         'extracted'),
+        make_option('--dir', dest='directory', default=None,
+                    help='Directory of saved pages (*.html) to extract'),
+        make_option('--workers', dest='workers', type='int', default=None,
+                    help='Number of extracting processes, 0 to extract in '
+                         'current process'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('Spider ID or name is required')
+        sources = [options[_] for _ in ('result', 'local_content',
+                                        'directory')]
+        if not any(_ is not None for _ in sources):
+            raise CommandError('One of --result, --content or --dir is '
+                               'required')
+        spider = self.get_spider(args[0])
+        operation = {'action': 'reextract', 'target': 'content'}
+        for key in ('result', 'local_content', 'directory', 'workers'):
+            if options[key] is not None:
+                operation[key] = options[key]
+
+        start = time.time()
+        result = spider.operate([operation])
+        duration = time.time() - start
+        stats = result.data.get('stats', {})
+        pages = stats.get('pages', 0)
+        self.stdout.write(
+            'Result {0}: {1} page(s), {2} error(s) in {3:.1f}s '
+            '({4:.0f} pages/min)'.format(
+                result.pk, pages, stats.get('errors', 0), duration,
+                pages * 60 / duration if duration else 0))
+
+    def get_spider(self, key):
+        spiders = Spider.objects.filter(
+            **{'pk' if key.isdigit() else 'name': key})
+        if not spiders:
+            raise CommandError('Spider not found: {0}'.format(key))
+        return spiders[0]
@@ -0,0 +1,36 @@
+import os
+import time
+import socket
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from scraper.config import QUEUE_POLL_INTERVAL
+from scraper.models import run_queue_worker
+
+
+class Command(BaseCommand):
+    """ Process links of distributed crawls from the shared queue """
+
+    option_list = BaseCommand.option_list + (
+        make_option('--crawl', dest='crawl_id', default=None,
+                    help='Only process links of this crawl ID'),
+        make_option('--name', dest='worker', default=None,
+                    help='Unique worker name, default is HOST-PID'),
+        make_option('--forever', action='store_true', dest='forever',
+                    default=False,
+                    help='Keep waiting for new links when queue is empty'),
+    )
+
+    def handle(self, *args, **options):
+        worker = options['worker'] or '{0}-{1}'.format(
+            socket.gethostname(), os.getpid())
+        while True:
+            count = run_queue_worker(worker, options['crawl_id'])
+            self.stdout.write('{0}: processed {1} link(s)'.format(
+                worker, count))
+            if not options['forever']:
+                break
+            if not count:
+                time.sleep(QUEUE_POLL_INTERVAL)
@@ -0,0 +1,37 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from scraper.config import SCHEDULE_JITTER
+from scraper.scheduler import Scheduler
+from .run_scraper import parse_operation, DEFAULT_OPERATIONS
+
+
+class Command(BaseCommand):
+    """ Keep running spiders following their interval or cron schedule """
+
+    option_list = BaseCommand.option_list + (
+        make_option('--workers', dest='workers', type='int', default=4,
+                    help='Number of spiders run at the same time'),
+        make_option('--operation', dest='operations', action='append',
+                    default=[],
+                    help='Operation as ACTION:TARGET (repeatable), '
+                         'default is crawl:content'),
+        make_option('--jitter', dest='jitter', type='int',
+                    default=SCHEDULE_JITTER,
+                    help='Maximum random delay (seconds) of start times'),
+        make_option('--tick', dest='tick', type='int', default=10,
+                    help='Seconds between two schedule checks'),
+    )
+
+    def handle(self, *args, **options):
+        operations = [parse_operation(value) for value in
+                      options['operations'] or DEFAULT_OPERATIONS]
+        scheduler = Scheduler(operations, options['workers'],
+                              options['jitter'])
+        try:
+            scheduler.run_forever(options['tick'])
+        except KeyboardInterrupt:
+            self.stdout.write('Waiting for running spiders...')
+        finally:
+            scheduler.close()
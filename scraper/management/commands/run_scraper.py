@@ -1,15 +1,123 @@
-from django.core.management.base import NoArgsCommand
+import time
 
+from multiprocessing import Pool, BoundedSemaphore
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from scraper.extractor import set_fetch_limit
 from scraper.models import Spider
 
 
-class Command(NoArgsCommand):
+DEFAULT_OPERATIONS = ['crawl:content']
+
+
+def parse_operation(value):
+    """ Convert 'action:target' into operation dict """
+    try:
+        action, target = value.split(':', 1)
+    except ValueError:
+        raise CommandError('Invalid operation: {0}'.format(value))
+    return {'action': action, 'target': target}
+
+
+def close_connections():
+    """ Database connections must not be shared with forked processes """
+    for conn in connections.all():
+        conn.close()
+
+
+def run_spider(args):
+    """ Operate single spider, this could run in worker processes.
+    Returns: Summary dict of the run """
+    spider_id, operations = args
+    spider = Spider.objects.get(pk=spider_id)
+    summary = {'name': spider.name or spider.url, 'error': None}
+    start = time.time()
+    try:
+        result = spider.operate(operations)
+        summary.update(result.data.get('stats', {}))
+    except Exception as e:
+        summary['error'] = repr(e)
+    summary['time'] = time.time() - start
+    return summary
+
+
+class Command(BaseCommand):
     """ Crawl all active resources """
 
-    def handle_noargs(self, **options):
-        spiders = Spider.objects.all()
-        operations = [
-            {'action': 'crawl', 'target': 'content'}
-        ]
-        for spider in spiders:
-            spider.operate(operations)
+    option_list = BaseCommand.option_list + (
+        make_option('--workers', dest='workers', type='int', default=1,
+                    help='Number of processes running spiders in parallel'),
+        make_option('--spider', dest='spiders', action='append', default=[],
+                    help='ID or name of spider to be run (repeatable), '
+                         'all spiders are run if missing'),
+        make_option('--operation', dest='operations', action='append',
+                    default=[],
+                    help='Operation as ACTION:TARGET (repeatable), '
+                         'default is crawl:content'),
+        make_option('--concurrency', dest='concurrency', type='int',
+                    default=0,
+                    help='Maximum number of simultaneous downloads, shared '
+                         'by all spiders'),
+    )
+
+    def handle(self, *args, **options):
+        spiders = self.get_spiders(options['spiders'])
+        operations = [parse_operation(value) for value in
+                      options['operations'] or DEFAULT_OPERATIONS]
+        tasks = [(spider.pk, [dict(_) for _ in operations])
+                 for spider in spiders]
+
+        if options['concurrency'] > 0:
+            set_fetch_limit(BoundedSemaphore(options['concurrency']))
+        start = time.time()
+        if options['workers'] > 1:
+            # Pool processes are daemonic and cannot start pools of their
+            # own, so spiders extract pages in their process
+            for task in tasks:
+                for operation in task[1]:
+                    operation['workers'] = 0
+            close_connections()
+            pool = Pool(options['workers'])
+            try:
+                summaries = pool.map(run_spider, tasks, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            summaries = [run_spider(task) for task in tasks]
+        set_fetch_limit(None)
+        self.print_summary(summaries, time.time() - start)
+
+    def get_spiders(self, keys):
+        """ Return spiders matching given IDs or names """
+        if not keys:
+            return Spider.objects.all()
+        spiders = []
+        for key in keys:
+            if key.isdigit():
+                found = Spider.objects.filter(pk=int(key))
+            else:
+                found = Spider.objects.filter(name=key)
+            if not found:
+                raise CommandError('Spider not found: {0}'.format(key))
+            spiders.extend(found)
+        return spiders
+
+    def print_summary(self, summaries, total_time):
+        row = '{0:<32} {1:>7} {2:>8} {3:>12} {4:>7} {5:>8}'
+        self.stdout.write(row.format(
+            'Spider', 'Pages', 'Pages/s', 'Bytes', 'Errors', 'Time'))
+        for summary in summaries:
+            pages = summary.get('pages', 0)
+            speed = pages / summary['time'] if summary['time'] else 0
+            self.stdout.write(row.format(
+                summary['name'][:32], pages, '{0:.2f}'.format(speed),
+                summary.get('bytes', 0), summary.get('errors', 0),
+                '{0:.1f}s'.format(summary['time'])))
+            if summary['error']:
+                self.stdout.write('  Failed: {0}'.format(summary['error']))
+        self.stdout.write('Total: {0} spider(s) in {1:.1f}s'.format(
+            len(summaries), total_time))
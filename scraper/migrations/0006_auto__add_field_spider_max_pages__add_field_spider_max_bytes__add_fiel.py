@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+from south.utils import datetime_utils as datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding field 'Spider.max_pages'
+        db.add_column(u'scraper_spider', 'max_pages',
+                      self.gf('django.db.models.fields.PositiveIntegerField')(default=0),
+                      keep_default=False)
+
+        # Adding field 'Spider.max_bytes'
+        db.add_column(u'scraper_spider', 'max_bytes',
+                      self.gf('django.db.models.fields.BigIntegerField')(default=0),
+                      keep_default=False)
+
+        # Adding field 'Spider.max_media'
+        db.add_column(u'scraper_spider', 'max_media',
+                      self.gf('django.db.models.fields.PositiveIntegerField')(default=0),
+                      keep_default=False)
+
+        # Adding field 'Spider.max_duration'
+        db.add_column(u'scraper_spider', 'max_duration',
+                      self.gf('django.db.models.fields.PositiveIntegerField')(default=0),
+                      keep_default=False)
+
+
+    def backwards(self, orm):
+        # Deleting field 'Spider.max_pages'
+        db.delete_column(u'scraper_spider', 'max_pages')
+
+        # Deleting field 'Spider.max_bytes'
+        db.delete_column(u'scraper_spider', 'max_bytes')
+
+        # Deleting field 'Spider.max_media'
+        db.delete_column(u'scraper_spider', 'max_media')
+
+        # Deleting field 'Spider.max_duration'
+        db.delete_column(u'scraper_spider', 'max_duration')
+
+
+    models = {
+        u'scraper.collector': {
+            'Meta': {'object_name': 'Collector'},
+            'black_words': ('django.db.models.fields.CharField', [], {'max_length': '256', 'null': 'True', 'blank': 'True'}),
+            'get_image': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '256'}),
+            'replace_rules': ('jsonfield.fields.JSONField', [], {'default': '{}'}),
+            'selectors': ('django.db.models.fields.related.ManyToManyField', [], {'to': u"orm['scraper.Selector']", 'symmetrical': 'False', 'blank': 'True'})
+        },
+        u'scraper.localcontent': {
+            'Meta': {'object_name': 'LocalContent'},
+            'created_time': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now', 'null': 'True', 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'local_path': ('django.db.models.fields.CharField', [], {'max_length': '256'}),
+            'state': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'url': ('django.db.models.fields.CharField', [], {'max_length': '256'})
+        },
+        u'scraper.proxyserver': {
+            'Meta': {'object_name': 'ProxyServer'},
+            'address': ('django.db.models.fields.CharField', [], {'max_length': '128'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '64'}),
+            'port': ('django.db.models.fields.IntegerField', [], {}),
+            'protocol': ('django.db.models.fields.CharField', [], {'max_length': '16'})
+        },
+        u'scraper.queueitem': {
+            'Meta': {'unique_together': "(('crawl_id', 'kind', 'url'),)", 'object_name': 'QueueItem'},
+            'attempts': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'crawl_id': ('django.db.models.fields.CharField', [], {'max_length': '64', 'db_index': 'True'}),
+            'data': ('jsonfield.fields.JSONField', [], {'null': 'True', 'blank': 'True'}),
+            'depth': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'kind': ('django.db.models.fields.CharField', [], {'max_length': '16'}),
+            'lease_expires': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'spider': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['scraper.Spider']"}),
+            'state': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'url': ('django.db.models.fields.CharField', [], {'max_length': '256'}),
+            'worker': ('django.db.models.fields.CharField', [], {'max_length': '64', 'null': 'True', 'blank': 'True'})
+        },
+        u'scraper.result': {
+            'Meta': {'object_name': 'Result'},
+            'data': ('jsonfield.fields.JSONField', [], {'default': '{}'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'other': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['scraper.LocalContent']", 'null': 'True', 'on_delete': 'models.SET_NULL', 'blank': 'True'}),
+            'task_id': ('django.db.models.fields.CharField', [], {'max_length': '64', 'null': 'True', 'blank': 'True'})
+        },
+        u'scraper.selector': {
+            'Meta': {'object_name': 'Selector'},
+            'data_type': ('django.db.models.fields.CharField', [], {'max_length': '64'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'key': ('django.db.models.fields.SlugField', [], {'max_length': '50'}),
+            'xpath': ('django.db.models.fields.CharField', [], {'max_length': '512'})
+        },
+        u'scraper.spider': {
+            'Meta': {'object_name': 'Spider'},
+            'collectors': ('django.db.models.fields.related.ManyToManyField', [], {'symmetrical': 'False', 'related_name': "'spider'", 'blank': 'True', 'to': u"orm['scraper.Collector']"}),
+            'crawl_depth': ('django.db.models.fields.PositiveIntegerField', [], {'default': '1'}),
+            'crawl_interval': ('django.db.models.fields.PositiveIntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'crawl_root': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'crawl_schedule': ('django.db.models.fields.CharField', [], {'default': "''", 'max_length': '64', 'blank': 'True'}),
+            'expand_links': ('jsonfield.fields.JSONField', [], {'default': '{}'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'last_run': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'max_bytes': ('django.db.models.fields.BigIntegerField', [], {'default': '0'}),
+            'max_duration': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'max_media': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'max_pages': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '256', 'null': 'True', 'blank': 'True'}),
+            'proxy': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['scraper.ProxyServer']", 'null': 'True', 'on_delete': 'models.PROTECT', 'blank': 'True'}),
+            'running_since': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'seed_stop_after': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'seed_template': ('django.db.models.fields.CharField', [], {'default': "''", 'max_length': '256', 'blank': 'True'}),
+            'seed_values': ('jsonfield.fields.JSONField', [], {'null': 'True', 'blank': 'True'}),
+            'sitemap_changed_only': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'sitemap_checked': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'sitemap_url': ('django.db.models.fields.CharField', [], {'default': "''", 'max_length': '256', 'blank': 'True'}),
+            'target_links': ('jsonfield.fields.JSONField', [], {'default': '{}'}),
+            'url': ('django.db.models.fields.URLField', [], {'max_length': '256'}),
+            'user_agent': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['scraper.UserAgent']", 'null': 'True', 'on_delete': 'models.PROTECT', 'blank': 'True'})
+        },
+        u'scraper.useragent': {
+            'Meta': {'object_name': 'UserAgent'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '64'}),
+            'value': ('django.db.models.fields.CharField', [], {'max_length': '256'})
+        }
+    }
+
+    complete_apps = ['scraper']
\ No newline at end of file
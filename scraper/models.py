@@ -1,25 +1,44 @@
 import uuid
 import os
-import simplejson as json
+import time
+import threading
+import itertools
 
-from datetime import datetime
+from datetime import datetime, timedelta
+from multiprocessing.pool import ThreadPool
 from os.path import join
 from jsonfield.fields import JSONField
 from shutil import rmtree
+from zipfile import ZipFile
 
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models import Q, F, Count
 from django.db.models.signals import pre_delete
 from django.utils.log import getLogger
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 from django.core.files.storage import default_storage as storage
 from django.dispatch.dispatcher import receiver
 
-from .config import (DATA_TYPES, PROTOCOLS, INDEX_JSON, COMPRESS_RESULT,
-                     TEMP_DIR, NO_TASK_PREFIX)
-from .base import BaseCrawl, ExtractorMixin
-from .utils import SimpleArchive, Datum, Data
-from .utils import write_storage_file, move_to_storage
-from .signals import post_scrape
+from .config import (DATA_TYPES, PROTOCOLS, COMPRESS_RESULT,
+                     TEMP_DIR, NO_TASK_PREFIX, CRAWL_WORKERS, LINK_KINDS,
+                     QUEUE_STATES, QUEUE_PENDING, QUEUE_LEASED, QUEUE_DONE,
+                     QUEUE_FAILED, QUEUE_LEASE_TIMEOUT, QUEUE_POLL_INTERVAL,
+                     QUEUE_MAX_ATTEMPTS, SCHEDULE_LOCK_TIMEOUT, SEED_BATCH,
+                     DIRECT_WRITE, RESULT_ITEMS, RESULT_BATCH, INDEX_JSONL,
+                     STREAM_INDEX, OFFLINE_ACTIONS)
+from .base import BaseCrawl, ExtractorMixin, CrawlContext
+from .exceptions import BudgetExceeded
+from .pipeline import Pipeline, extract_page, reextract, EMPTY_HTML
+from .utils import SimpleArchive, Datum, Data, CrawlStats
+from .utils import (write_storage_file, move_to_storage, next_cron_time,
+                    chunks, URLTemplate, make_storage_dir, store_file,
+                    delete_storage_path)
+from .sitemaps import Sitemap
+from .writers import ArchiveWriter, StorageWriter
+from .serializers import get_serializer, get_line_serializer
+from .snapshots import get_store
+from .signals import post_scrape, post_page, crawl_timings
 
 
 logger = getLogger('scraper')
@@ -44,6 +63,11 @@ class Collector(ExtractorMixin, models.Model):
         return u'Collector: {0}'.format(self.name)
 
     def get_page(self, **kwargs):
+        """ Return HTML of the page, or only put it into snapshot store if
+        SNAPSHOT_DIR is set (digest is in 'snapshot' of extras) """
+        store = get_store()
+        if store:
+            return Datum(content='', snapshot=store.put(self.extractor._html))
         return Datum(content=self.extractor._html)
 
     def get_links(self, **kwargs):
@@ -60,27 +84,19 @@ class Collector(ExtractorMixin, models.Model):
         Returns:
             Datum object
         """
-        data, result_path = self.extractor.extract_content(
-            get_image=self.get_image,
-            selectors=self.selector_dict,
-            replace_rules=self.replace_rules,
-        )
-        if not os.path.exists(result_path):
-            os.makedirs(result_path)
-        with open(join(result_path, INDEX_JSON), 'w') as index_file:
-            index_file.write(json.dumps(data))
-        extras = {'path': result_path}
-        if explore:
-            # In case of having exploring rules, additional information
-            # like other target/expand links will also be collected
-            for rule in explore.keys():
-                extras[rule] = []
-                for link in self.extractor.extract_links(explore[rule]):
-                    extras[rule].append(link['url'])
-            extras['uuid'] = self.extractor._uuid
-        data.update(extras)
+        data = extract_page(self.extractor, self.get_plan(explore))
         return Datum(**data)
 
+    def get_plan(self, explore=None):
+        """Return the extraction rules of this collector as plain dict, so
+        they can be passed to other processes"""
+        return {
+            'selectors': self.selector_dict,
+            'replace_rules': self.replace_rules,
+            'get_image': self.get_image,
+            'explore': explore,
+        }
+
     @property
     def selector_dict(self):
         """Convert the self.selectors into dict of XPaths"""
@@ -105,10 +121,57 @@ class Spider(ExtractorMixin, BaseCrawl):
         in case of crawling from this page')
     collectors = models.ManyToManyField(
         Collector, blank=True, related_name='spider')
+    # Target pages could also be taken from sitemap
+    sitemap_url = models.CharField(
+        max_length=256, blank=True, default='',
+        help_text='URL of sitemap or sitemap index (could be gzipped) \
+        listing target pages')
+    sitemap_changed_only = models.BooleanField(
+        default=False,
+        help_text='Only pages modified since last crawl (by <lastmod>)')
+    sitemap_checked = models.DateTimeField(
+        blank=True, null=True, editable=False)
+    # ... or generated from URL template
+    seed_template = models.CharField(
+        max_length=256, blank=True, default='',
+        help_text='Template of target URLs, ex: "http://site/{0}/page-{1}"')
+    seed_values = JSONField(
+        blank=True, null=True,
+        help_text='Values of each template element, intervals are \
+        expanded, ex: [["news", "tech"], "1-5000"]')
+    seed_stop_after = models.PositiveIntegerField(
+        default=0, help_text='Skip the rest of a range after this number of \
+        consecutive pages without content (0 to disable)')
+    # Crawl budgets, crawling stops when one runs out (0 is unlimited)
+    max_pages = models.PositiveIntegerField(
+        default=0, help_text='Maximum number of fetched pages')
+    max_bytes = models.BigIntegerField(
+        default=0, help_text='Maximum size of downloaded pages and files')
+    max_media = models.PositiveIntegerField(
+        default=0, help_text='Maximum number of downloaded files')
+    max_duration = models.PositiveIntegerField(
+        default=0, help_text='Maximum crawling time, in seconds')
+    # Options for scheduled runs (run_scheduler command)
+    crawl_interval = models.PositiveIntegerField(
+        blank=True, null=True,
+        help_text='Run this spider every given seconds')
+    crawl_schedule = models.CharField(
+        max_length=64, blank=True, default='',
+        help_text='Cron expression of run times, ex: "30 2 * * *"')
+    last_run = models.DateTimeField(blank=True, null=True, editable=False)
+    running_since = models.DateTimeField(
+        blank=True, null=True, editable=False)
 
     depths = None
     task_id = None
+    result = None
+    snapshots = None
     crawl_links = None
+    seeds = None
+    crawl_start = None
+    # Position of current operation, pages stored as ResultItem rows are
+    # tagged with it
+    operation_index = 0
 
     def operate(self, operations, task_id=None):
         """Performs all given operations on spider URL
@@ -118,28 +181,69 @@ class Spider(ExtractorMixin, BaseCrawl):
                 {'action': 'get', 'target': 'links'}
                 ...
                 ]
-            task_id - Will be generated if missing
+            task_id - Will be generated if missing, result of previous run
+                with the same ID is replaced
         Returns: Result object
         """
-        self._set_extractor()
+        self.stats = CrawlStats()
+        self.context = None
+        self.context = self.get_context()
+        self._set_extractor(offline=all(
+            _['action'] in OFFLINE_ACTIONS for _ in operations))
+        self.writer = self.get_writer(self.extractor._uuid)
+        if self.writer:
+            self.extractor.set_writer(self.writer)
+        self.task_id = task_id
+        self.snapshots = []
+        # Result is created first when pages are stored as rows of it, it
+        # takes the task ID (and replaces the previous result) at the end
+        self.result = create_result(
+            {}, spider=self) if RESULT_ITEMS else None
         has_files = False
         data = Data(url=self.url, uuid=self.extractor._uuid, task_id=task_id)
-        for operation in operations:
+        for index, operation in enumerate(operations):
+            self.operation_index = index
             datum = self._perform(**operation)
             data.add_result(datum)
             if 'path' in datum.extras and not has_files:
                 has_files = True
-        result = create_result(data.dict, task_id)
+        # Snapshots are referred by the local content
+        has_files = has_files or bool(self.snapshots)
+        data.update(stats=self.stats.dict)
+        local_content = None
         if has_files:
-            result.other = self._finalize(data)
-            result.save()
+            with self.stats.span('finalize'):
+                local_content = self._finalize(data)
+        elif self.writer:
+            self.writer.discard()
+        # Histograms of crawl phases (see scraper.timing) are saved with the
+        # result, so they don't cover its writing, crawl_timings does
+        result_data = data.dict
+        result_data['timings'] = self.stats.timings.dict
+        with self.stats.span('create_result'):
+            if self.result:
+                result = self.result
+                result.data = result_data
+                result.other = local_content
+                if task_id:
+                    result.bind_task(task_id)
+                else:
+                    result.save()
+            else:
+                result = create_result(result_data, task_id,
+                                       local_content=local_content,
+                                       spider=self)
+        if crawl_timings.has_listeners(self.__class__):
+            crawl_timings.send(self.__class__, spider=self, task_id=task_id,
+                               result=result,
+                               timings=self.stats.timings.dict)
         return result
 
     def _perform(self, action, target, **kwargs):
         """Perform operation based on given parameters. At the moment, only
         one collector is supported"""
         if action == 'get':
-            operator = self.collectors.first()
+            operator = self.get_context().collector
             operator.extractor = self.extractor
         else:
             operator = self
@@ -147,24 +251,35 @@ class Spider(ExtractorMixin, BaseCrawl):
         data = method(**kwargs)
         data.extras['action'] = action
         data.extras['target'] = target
+        if data.extras.get('snapshot'):
+            self.snapshots.append((self.url, data.extras['snapshot']))
         # Content extracting needs some more refinements
-        post_scrape.send(self.__class__, result=data.json)
+        if post_scrape.has_listeners(self.__class__):
+            post_scrape.send(self.__class__, datum=data)
         return data
 
-    def _set_extractor(self, force=False):
+    def _set_extractor(self, force=False, offline=False):
+        """Create extractor of spider URL, offline ones don't download the
+        page"""
         if force or self._extractor is None:
-            self.extractor = self._new_extractor(self.url)
+            self.extractor = self._new_extractor(
+                self.url, html=EMPTY_HTML if offline else '')
         return self.extractor
 
-    def crawl_content(self, **kwargs):
+    def crawl_content(self, workers=None, **kwargs):
         """ Extract all found links then scrape those pages
         Arguments:
-            task_id - ID of the (Celery) task, will be genenrated if missing
+            workers - Number of processes extracting pages, CRAWL_WORKERS
+                setting will be used if missing. 0 means serial crawling.
         Returns:
-            (result, path) - Result and path to collected content (dir or ZIP)
+            Datum object, with content of all crawled pages. If a budget ran
+            out, the reason is put in 'stopped' of extras.
         """
         logger.info('[{0}] START CRAWLING: {1}'.format(
             self.task_id, self.url))
+        self.crawl_start = time.time()
+        if self.stats is None:
+            self.stats = CrawlStats()
 
         # Collect all target links from level 0
         self.depths = {'target': {}, 'expand': {}}
@@ -175,36 +290,337 @@ class Spider(ExtractorMixin, BaseCrawl):
         self.aggregate_links(self.get_links(self.extractor), 1)
         logger.info('Found: {0} targets, {1} expansions'.format(
             len(self.crawl_links['target']), len(self.crawl_links['expand'])))
+        seeded_time = timezone.now()
+        seeds = self.get_seeds()
+        self.seeds = list(seeds)
 
-        combined_json = {}
-        result_paths = []
-        while self.crawl_links['target'] or self.crawl_links['expand']:
-            # Collect data and links from targeted links
-            while self.crawl_links['target']:
-                target_url = self.crawl_links['target'].pop()
-                data = self.process_target(target_url)
-                data_id = data.extras['uuid']
-                single_content = {
-                    'content': data.content,
-                    'url': data.extras['url']
-                }
-                combined_json[data_id] = single_content
-                result_paths.append(data.extras['path'])
-            # ... and only links from expand links
-            while self.crawl_links['expand']:
-                expand_url = self.crawl_links['expand'].pop()
-                depth = self.depths['expand'][expand_url]
-                # Is this redundant check?
-                if depth >= self.crawl_depth:
-                    continue
-                # Only extract target & expand links, so collector is not
-                # necessary
-                extr = self._new_extractor(expand_url)
-                self.aggregate_links(self.get_links(extr), depth + 1)
+        crawled = CrawledPages(self.result, index_path=self.get_index_path(),
+                               operation=self.operation_index)
+        if workers is None:
+            workers = CRAWL_WORKERS
+        pipeline = None
+        if workers:
+            pipeline = Pipeline(self.get_plan(), workers, stats=self.stats)
+        stopped = None
+        try:
+            while self.crawl_links['target'] or \
+                    self.crawl_links['expand'] or self.seeds:
+                if not (self.crawl_links['target'] or
+                        self.crawl_links['expand']):
+                    self.pull_seeds()
+                if pipeline:
+                    pages = self._process_pipeline(pipeline)
+                else:
+                    pages = self._process_serial()
+                for data in pages:
+                    self.report_seeds(data.extras['url'],
+                                      any(data.content.values()))
+                    self.add_page(crawled, data.extras['uuid'],
+                                  data.extras['url'], data.content,
+                                  data.extras['path'],
+                                  data.extras.get('snapshot'))
+                    self.check_budget()
+        except BudgetExceeded as e:
+            stopped = str(e)
+            logger.info('[{0}] Crawling stopped: {1}'.format(
+                self.task_id, stopped))
+        finally:
+            if pipeline:
+                pipeline.close(terminate=stopped is not None)
+        if not stopped:
+            self.mark_seeded(seeded_time, seeds)
 
         # Create the aggregated Result
-        extras = {'path': result_paths}
-        return Datum(content=combined_json, **extras)
+        return crawled.get_datum(stopped)
+
+    def add_page(self, crawled, uuid, url, content, path, snapshot=None):
+        """ Add extracted page into crawled pages, post_page signal is
+        sent if having receivers """
+        crawled.add(uuid, url, content, path)
+        if snapshot and self.snapshots is not None:
+            self.snapshots.append((url, snapshot))
+        if post_page.has_listeners(self.__class__):
+            post_page.send(self.__class__, spider=self, task_id=self.task_id,
+                           url=url, uuid=uuid, content=content, path=path)
+
+    def reextract_content(self, result=None, local_content=None,
+                          directory=None, workers=None, **kwargs):
+        """ Extract again pages kept from previous crawls, using current
+        selectors of the first collector. Nothing is downloaded, images
+        and files of binary selectors are not collected and links are not
+        followed.
+        Arguments:
+            result - ID of Result, its snapshots are extracted
+            local_content - ID of LocalContent, same as above
+            directory - Path to directory of saved pages (*.html)
+            workers - Number of processes, CRAWL_WORKERS setting or number
+                of CPUs if missing
+        Returns:
+            Datum object, same as crawl_content()
+        """
+        logger.info('[{0}] START EXTRACTING AGAIN: {1}'.format(
+            self.task_id, result or local_content or directory))
+        plan = self.get_plan()
+        plan.update({'explore': None, 'get_image': False, 'get_media': False,
+                     'snapshot': False})
+        if workers is None:
+            workers = CRAWL_WORKERS or None
+        if self.stats is None:
+            self.stats = CrawlStats()
+        pages = iter_kept_pages(result, local_content, directory)
+        crawled = CrawledPages(self.result, index_path=self.get_index_path(),
+                               operation=self.operation_index)
+        for url, kind, source, data in reextract(pages, plan, workers,
+                                                 self.stats):
+            if data is None:
+                continue
+            snapshot = source if kind == 'snapshot' else None
+            self.add_page(crawled, data['uuid'], url, data['content'],
+                          data['path'], snapshot)
+        return crawled.get_datum()
+
+    def check_budget(self, pages=None):
+        """ Raise BudgetExceeded if one of crawl budgets runs out
+        Arguments:
+            pages - Number of crawled pages, taken from stats if missing
+        """
+        if pages is None:
+            pages = self.stats.pages
+        used = (
+            ('max_pages', pages),
+            ('max_bytes', self.stats.bytes if self.stats else 0),
+            ('max_media', self.stats.files if self.stats else 0),
+            ('max_duration', time.time() - (self.crawl_start or time.time())),
+        )
+        for budget, value in used:
+            limit = getattr(self, budget)
+            if limit and value >= limit:
+                raise BudgetExceeded(budget, limit)
+
+    def get_seeds(self):
+        """ Return list of iterators of URLs to be crawled as targets, besides
+        the links found in starting page """
+        seeds = []
+        if self.sitemap_url:
+            since = None
+            if self.sitemap_changed_only:
+                since = self.sitemap_checked
+            seeds.append(Sitemap(
+                self.sitemap_url, since,
+                headers={'User-Agent': self.get_ua() or ''},
+                proxies=self.get_proxy()))
+        if self.seed_template:
+            seeds.append(URLTemplate(
+                self.seed_template, self.seed_values, self.seed_stop_after))
+        return seeds
+
+    def pull_seeds(self):
+        """ Move next batch of seed URLs into crawling targets, seeds are
+        consumed lazily, one iterator at a time """
+        while self.seeds:
+            seed = self.seeds[0]
+            urls = list(itertools.islice(seed, SEED_BATCH))
+            if urls:
+                added = self.aggregate_links({'target': urls}, 1)
+                if hasattr(seed, 'discard'):
+                    # Already known URLs are not crawled again, so never
+                    # reported
+                    for url in set(urls).difference(added):
+                        seed.discard(url)
+                return
+            self.seeds.pop(0)
+
+    def report_seeds(self, url, found):
+        """ Tell seeds whether the crawled page has content or not (empty or
+        failed pages, like 404, give no content) """
+        for seed in self.seeds or []:
+            if hasattr(seed, 'report'):
+                seed.report(url, found)
+
+    def mark_seeded(self, seeded_time, seeds):
+        """ Remember the time seeds were taken, for next crawls. Nothing is
+        changed if a sitemap couldn't be read completely, its pages would
+        be skipped by next crawls otherwise. """
+        if any(not getattr(seed, 'complete', True) for seed in seeds):
+            return
+        if self.sitemap_url and self.pk:
+            Spider.objects.filter(pk=self.pk).update(
+                sitemap_checked=seeded_time)
+            self.sitemap_checked = seeded_time
+
+    def _process_serial(self):
+        """Crawl the pending links one by one. Yields data of target pages"""
+        # Collect data and links from targeted links
+        while self.crawl_links['target']:
+            target_url = self.crawl_links['target'].pop()
+            yield self.process_target(target_url)
+        # ... and only links from expand links
+        while self.crawl_links['expand']:
+            expand_url = self.crawl_links['expand'].pop()
+            depth = self.depths['expand'][expand_url]
+            # Is this redundant check?
+            if depth >= self.crawl_depth:
+                continue
+            self.check_budget()
+            # Only extract target & expand links, so collector is not
+            # necessary
+            extr = self._new_extractor(expand_url)
+            self.aggregate_links(self.get_links(extr), depth + 1)
+
+    def _process_pipeline(self, pipeline):
+        """Send all pending links to the pipeline. Yields data of target
+        pages as soon as they are extracted"""
+        tasks = []
+        while self.crawl_links['target']:
+            tasks.append(('target', self.crawl_links['target'].pop()))
+        while self.crawl_links['expand']:
+            expand_url = self.crawl_links['expand'].pop()
+            if self.depths['expand'][expand_url] < self.crawl_depth:
+                tasks.append(('expand', expand_url))
+        for kind, url, data in pipeline.process(tasks):
+            if data is None:
+                if kind == 'target':
+                    self.report_seeds(url, False)
+                continue
+            if kind == 'target':
+                yield self.handle_target(url, Datum(**data))
+            else:
+                self.aggregate_links(data, self.depths['expand'][url] + 1)
+                self.check_budget()
+
+    def crawl_distributed(self, work=True, **kwargs):
+        """ Crawl like crawl_content(), but links are put into the shared
+        crawl queue, so other workers (see run_queue_worker) on this or other
+        hosts can help processing them. Collected files must be reachable
+        from this host for finalizing, e.g. TEMP_DIR on a shared volume.
+        Arguments:
+            work - Also process queued links in current process
+        Returns:
+            Datum object, with content of all crawled pages
+        """
+        crawl_id = self.extractor._uuid
+        logger.info('[{0}] START DISTRIBUTED CRAWLING: {1} ({2})'.format(
+            self.task_id, self.url, crawl_id))
+        if self.crawl_root:
+            QueueItem.objects.enqueue(
+                self, crawl_id, {'target': [self.url]}, 0)
+        QueueItem.objects.enqueue(
+            self, crawl_id, self.get_links(self.extractor), 1)
+        seeded_time = timezone.now()
+        seeds = self.get_seeds()
+        for seed in seeds:
+            for urls in chunks(seed, SEED_BATCH):
+                QueueItem.objects.enqueue(
+                    self, crawl_id, {'target': urls}, 1)
+                if hasattr(seed, 'discard'):
+                    # Pages are crawled by queue workers, which don't report
+                    for url in urls:
+                        seed.discard(url)
+        self.mark_seeded(seeded_time, seeds)
+
+        worker = 'coordinator-{0}'.format(crawl_id) if work else None
+        self.crawl_start = time.time()
+        stopped = None
+        while not QueueItem.objects.is_finished(crawl_id):
+            if stopped:
+                # Cancel the pending links, also the ones queued meanwhile
+                # by workers of leased links, which are still finished
+                QueueItem.objects.filter(
+                    crawl_id=crawl_id, state=QUEUE_PENDING).update(
+                    state=QUEUE_FAILED)
+                if not QueueItem.objects.is_finished(crawl_id):
+                    time.sleep(QUEUE_POLL_INTERVAL)
+                continue
+            if not (worker and run_queue_worker(worker, crawl_id, limit=1)):
+                time.sleep(QUEUE_POLL_INTERVAL)
+            try:
+                # Only page and time budgets are known by the coordinator
+                self.check_budget(QueueItem.objects.filter(
+                    crawl_id=crawl_id, state=QUEUE_DONE).count())
+            except BudgetExceeded as e:
+                stopped = str(e)
+                logger.info('[{0}] Crawling stopped: {1}'.format(
+                    self.task_id, stopped))
+
+        crawled = CrawledPages(self.result, index_path=self.get_index_path(),
+                               operation=self.operation_index)
+        items = QueueItem.objects.filter(
+            crawl_id=crawl_id, kind='target', state=QUEUE_DONE)
+        for item in items.iterator():
+            self.add_page(crawled, item.data['uuid'], item.url,
+                          item.data['content'], item.data['path'],
+                          item.data.get('snapshot'))
+        QueueItem.objects.filter(crawl_id=crawl_id).delete()
+        return crawled.get_datum(stopped)
+
+    def process_item(self, item):
+        """ Process a leased link of the crawl queue, found links are put
+        back into the queue.
+        Returns: Dict of extracted data, None for expand links """
+        extractor = self._new_extractor(item.url)
+        if item.kind == 'target':
+            data = Datum(**extract_page(extractor, self.get_plan()))
+            links = self.followed_links(data.extras, item.depth)
+            result = {
+                'uuid': data.extras['uuid'],
+                'content': data.content,
+                'path': data.extras['path'],
+                'snapshot': data.extras.get('snapshot'),
+            }
+        else:
+            links = self.get_links(extractor)
+            result = None
+        QueueItem.objects.enqueue(self, item.crawl_id, links, item.depth+1)
+        return result
+
+    def get_context(self):
+        """Return CrawlContext of current operation. Collector, selectors,
+        proxy and user agent are loaded from database only once, so crawled
+        pages don't need any query."""
+        if self.context is not None:
+            return self.context
+        proxies = self.get_proxy()
+        user_agent = self.get_ua()
+        collector = self.collectors.first()
+        plan = None
+        if collector is not None:
+            plan = collector.get_plan(explore={
+                'target': self.target_links,
+                'expand': self.expand_links
+            })
+            plan.update({
+                'base_dir': join(TEMP_DIR, self.storage_location),
+                'proxies': proxies,
+                'user_agent': user_agent,
+            })
+        self.context = CrawlContext(proxies, user_agent, collector, plan)
+        return self.context
+
+    def get_plan(self):
+        """Return the extraction plan used while crawling, which holds rules
+        of the first collector and options for creating extractors"""
+        plan = dict(self.get_context().plan)
+        if self.writer and self.writer.shared:
+            plan['writer'] = self.writer
+        return plan
+
+    def get_index_path(self):
+        """Return path of the JSON Lines file which pages crawled by current
+        operation are appended to, if STREAM_INDEX is set"""
+        if STREAM_INDEX:
+            return join(TEMP_DIR, self.storage_location, '{0}-{1}'.format(
+                self.extractor._uuid, get_index_name(self.operation_index)))
+
+    def get_writer(self, crawl_id):
+        """Return writer of result files for crawling with given ID. None
+        (files go to TEMP_DIR) unless DIRECT_WRITE is set, then files are
+        written into the result archive or final location in storage."""
+        if not DIRECT_WRITE:
+            return None
+        if COMPRESS_RESULT:
+            return ArchiveWriter(SimpleArchive(
+                crawl_id + '.zip', join(TEMP_DIR, self.storage_location)))
+        return StorageWriter(join(self.storage_location, crawl_id))
 
     def _finalize(self, data):
         """Should be called at final step in operate(). This finalizes and
@@ -213,34 +629,51 @@ class Spider(ExtractorMixin, BaseCrawl):
         logger.info('[{0}] Finalizing result [{1}]'.format(
             self.task_id, crawl_id))
 
+        temp_dir = join(TEMP_DIR, self.storage_location)
         data_paths = []
-        for datum in data.results:
+        # Index files of crawl operations, stored under their own names
+        indexes = []
+        for index, datum in enumerate(data.results):
             if 'path' in datum.get('extras', {}):
                 data_paths.extend(datum['extras']['path'])
+            index_path = datum.get('extras', {}).get('index')
+            if index_path and os.path.isfile(index_path):
+                indexes.append((get_index_name(index), index_path))
+        # Pages written directly by the writer are in place already
+        data_paths = [_ for _ in data_paths
+                      if _.startswith(temp_dir) and os.path.isdir(_)]
         if COMPRESS_RESULT:
-            archive = SimpleArchive(
-                crawl_id + '.zip',
-                join(TEMP_DIR, self.storage_location))
-            archive.write(INDEX_JSON, data.json)
+            archive = getattr(self.writer, 'archive', None) or \
+                SimpleArchive(crawl_id + '.zip', temp_dir)
+            archive.write(get_serializer().index_name, data.json)
             # Collect all content files from operations
             # Move those dirs into spider dir
             for d_path in data_paths:
                 d_id = os.path.basename(d_path)
                 for item in os.listdir(d_path):
-                    archive.write(join(d_id, item),
-                                  open(join(d_path, item), 'r').read())
+                    archive.write_file(join(d_id, item), join(d_path, item))
+            for name, index_path in indexes:
+                archive.write_file(name, index_path)
+                os.remove(index_path)
             storage_path = archive.move_to_storage(
                 storage, self.storage_location)
         else:
             storage_path = join(self.storage_location, crawl_id)
             write_storage_file(
-                storage, join(storage_path, 'index.json'), data.json)
+                storage, join(storage_path, get_serializer().index_name),
+                data.json)
             for d_path in data_paths:
                 move_to_storage(storage, d_path, storage_path)
+            if indexes:
+                make_storage_dir(storage, storage_path)
+            for name, index_path in indexes:
+                store_file(storage, index_path, join(storage_path, name))
 
         # Assign LocalContent object
         local_content = LocalContent(url=self.url, local_path=storage_path)
         local_content.save()
+        if self.snapshots:
+            Snapshot.objects.add_refs(local_content, self.snapshots)
 
         for path in data_paths:
             try:
@@ -266,26 +699,33 @@ class Spider(ExtractorMixin, BaseCrawl):
                 ...
             }
         """
-        collector = self.collectors.first()
-        collector.extractor = self._new_extractor(url)
-        data = collector.get_content(explore={
-            'target': self.target_links,
-            'expand': self.expand_links
-        })
-        # Handle the extracted links (target & expand). Bind those  with the
-        # depth if still in limit
+        extractor = self._new_extractor(url)
+        data = Datum(**extract_page(extractor, self.get_plan()))
+        return self.handle_target(url, data)
+
+    def handle_target(self, url, data):
+        """ Bind extracted data with its URL and handle the extracted links
+        (target & expand) with the depth if still in limit """
         data.extras['url'] = url
-        extras = data.extras
         depth = self.depths['target'][url]
+        self.aggregate_links(self.followed_links(data.extras, depth), depth+1)
+        return data
+
+    def followed_links(self, links, depth):
+        """ Return the links found in target page at given depth, which are
+        still in crawling limit """
+        followed = {}
         if depth < self.crawl_depth:
-            self.aggregate_links({'target': extras['target']}, depth+1)
+            followed['target'] = links['target']
             if depth < self.crawl_depth - 1:
-                self.aggregate_links({'expand': extras['expand']}, depth+1)
-        return data
+                followed['expand'] = links['expand']
+        return followed
 
     def aggregate_links(self, links, depth):
         """ Aggregate given links (with target & expand) into
-        self.craw_links """
+        self.craw_links
+        Returns: List of added links """
+        added = []
         for key in links:
             if key == 'expand' and depth == self.crawl_depth:
                 continue
@@ -294,6 +734,8 @@ class Spider(ExtractorMixin, BaseCrawl):
                     continue
                 self.crawl_links[key].append(url)
                 self.depths[key][url] = depth
+                added.append(url)
+        return added
 
     def get_links(self, extractor):
         """ Return target and expand links of current extractor """
@@ -304,6 +746,44 @@ class Spider(ExtractorMixin, BaseCrawl):
             links[key] = urls
         return links
 
+    def is_due(self, now=None):
+        """ Return True if scheduled run of this spider is due """
+        now = now or timezone.now()
+        if self.crawl_interval:
+            if self.last_run is None or self.last_run + timedelta(
+                    seconds=self.crawl_interval) <= now:
+                return True
+        if self.crawl_schedule:
+            # Never run spider only waits for the next matched minute
+            since = self.last_run or now - timedelta(minutes=1)
+            if timezone.is_aware(since):
+                since = timezone.localtime(since)
+            try:
+                if next_cron_time(self.crawl_schedule, since) <= now:
+                    return True
+            except ValueError:
+                logger.error('Invalid schedule of {0}: {1}'.format(
+                    self, self.crawl_schedule))
+        return False
+
+    def lock_run(self, now=None):
+        """ Mark this spider as running, which fails if it's already running
+        (in this or other processes). The lock is taken by a conditional
+        update so only one caller could win.
+        Returns: True if locked """
+        now = now or timezone.now()
+        stale = now - timedelta(seconds=SCHEDULE_LOCK_TIMEOUT)
+        locked = Spider.objects.filter(pk=self.pk).filter(
+            Q(running_since__isnull=True) | Q(running_since__lt=stale)
+        ).update(running_since=now, last_run=now)
+        if locked:
+            self.running_since = self.last_run = now
+        return bool(locked)
+
+    def unlock_run(self):
+        Spider.objects.filter(pk=self.pk).update(running_since=None)
+        self.running_since = None
+
     def __unicode__(self):
         return 'Spider: {0}'.format(self.name)
 
@@ -321,64 +801,249 @@ class Selector(models.Model):
 class Result(models.Model):
     """ This model holds specific ouput information processed by Source.
     It is implemented for better adapts when called by queuing system. """
-    task_id = models.CharField(max_length=64, blank=True, null=True)
+    task_id = models.CharField(max_length=64, blank=True, null=True,
+                               unique=True)
     data = JSONField()
     other = models.ForeignKey('LocalContent', blank=True, null=True,
                               on_delete=models.SET_NULL)
+    spider = models.ForeignKey(Spider, blank=True, null=True,
+                               related_name='results',
+                               on_delete=models.SET_NULL)
+    created_time = models.DateTimeField(
+        default=datetime.now, blank=True, null=True, db_index=True)
 
     def __unicode__(self):
         return u'Task Result <{0}>'.format(self.task_id)
 
-    def get_data(self, clean=False):
+    def bind_task(self, task_id):
+        """ Save this result with given task ID. The previous result of the
+        task is replaced: it's deleted, with its local content, in the same
+        transaction """
+        with transaction.atomic():
+            previous = Result.objects.filter(task_id=task_id)
+            if self.pk:
+                previous = previous.exclude(pk=self.pk)
+            for result in previous:
+                logger.info('Replacing result of task {0}'.format(task_id))
+                result.delete()
+            self.task_id = task_id
+            self.save()
+
+    def get_data(self, clean=False, stream=False):
         """Return self.data. If clean is True, only data content will be
-        returned (time, url, ID,... will be excluded)."""
+        returned (time, url, ID,... will be excluded). Pages stored as
+        ResultItem rows are loaded by chunks if stream is True, then an
+        iterator is returned instead of list."""
         if clean:
-            content = []
-            for result in self.data['results']:
-                action = result['extras']['action']
-                res_content = result['content']
-                if action == 'crawl':
-                    items = [v['content'] for v in res_content.values()]
-                else:
-                    items = res_content
-                content.extend(items)
-            return content
+            content = self.iter_content()
+            return content if stream else list(content)
         return self.data
 
+    def serialize(self, name=None):
+        """Return self.data serialized by given serializer (SERIALIZER
+        setting if missing), used for exporting"""
+        return get_serializer(name).dumps(self.data)
+
+    def iter_content(self):
+        """Yield content of every page (or item) in this result"""
+        for page in self.iter_pages():
+            yield page['content']
+
+    def get_pages(self, start=0, count=20):
+        """Return list of pages (see iter_pages()) from given position.
+        Pages stored as ResultItem rows are loaded by a single slice query,
+        instead of reading the previous ones."""
+        if self.items.exists():
+            items = self.items.order_by('pk').only('url', 'content')
+            return [{'url': _.url, 'content': _.content}
+                    for _ in items[start:start + count]]
+        return list(itertools.islice(self.iter_pages(), start,
+                                     start + count))
+
+    def iter_pages(self):
+        """Yield every page (or item) in this result as dict of url and
+        content. Pages stored as ResultItem rows or in the JSON Lines index
+        are loaded lazily."""
+        results = self.data['results']
+        # Items of results with a single crawl may not be tagged with their
+        # operation (made before ResultItem.operation was added)
+        tagged = len([_ for _ in results if 'items' in _['extras']]) > 1
+        for index, result in enumerate(results):
+            action = result['extras']['action']
+            res_content = result['content']
+            if action == 'crawl' and 'items' in result['extras']:
+                items = self.items.order_by('pk').only('url', 'content')
+                if tagged:
+                    items = items.filter(operation=index)
+                for item in items.iterator():
+                    yield {'url': item.url, 'content': item.content}
+            elif action == 'crawl' and 'index' in result['extras']:
+                pages = self.iter_index(result['extras']['index'], index)
+                for page in pages:
+                    yield {'url': page['url'], 'content': page['content']}
+            elif action == 'crawl':
+                for value in res_content.values():
+                    yield {'url': value['url'], 'content': value['content']}
+            else:
+                for item in res_content:
+                    yield {'url': self.data.get('url'), 'content': item}
+
+    def iter_index(self, index_path=None, operation=0):
+        """Yield pages in the JSON Lines index of given crawl operation of
+        this result, read from storage (or given path if the result is not
+        finalized)"""
+        name = get_index_name(operation)
+        if self.other is None:
+            if not index_path:
+                return
+            index = open(index_path, 'r')
+        elif self.other.local_path.endswith('.zip'):
+            archive = ZipFile(storage.open(self.other.local_path))
+            index = archive.open(name)
+        else:
+            index = storage.open(join(self.other.local_path, name))
+        loads = get_line_serializer().loads
+        try:
+            for line in index:
+                if line.strip():
+                    yield loads(line)
+        finally:
+            index.close()
+
+
+class ResultItem(models.Model):
+    """ Content of single crawled page, kept apart from the Result data if
+    RESULT_ITEMS setting is on """
+    result = models.ForeignKey(Result, related_name='items')
+    # Index of the crawl operation in Result.data['results']
+    operation = models.PositiveIntegerField(default=0)
+    uuid = models.CharField(max_length=64)
+    url = models.CharField(max_length=256)
+    content = JSONField()
+    path = models.CharField(max_length=256, blank=True, default='')
+
+    def __unicode__(self):
+        return u'Result Item <{0}>'.format(self.url)
+
 
-def create_result(data, task_id=None, local_content=None):
+class CrawledPages(object):
+    """ Collects pages extracted while crawling. They are kept in memory,
+    or inserted as ResultItem rows by batches if the result is given. """
+
+    def __init__(self, result=None, batch_size=RESULT_BATCH,
+                 index_path=None, operation=0):
+        self.result = result
+        self.operation = operation
+        self.batch_size = batch_size
+        self.content = {}
+        self.paths = []
+        self.count = 0
+        self._batch = []
+        self.index_path = index_path
+        self._index = None
+        if index_path:
+            location = os.path.dirname(index_path)
+            if not os.path.exists(location):
+                os.makedirs(location)
+            self._index = open(index_path, 'a')
+            self._dumps = get_line_serializer().dumps
+
+    def add(self, uuid, url, content, path):
+        self.paths.append(path)
+        self.count += 1
+        if self._index:
+            # One compact line per page, readable while crawling
+            self._index.write(self._dumps({
+                'uuid': uuid,
+                'url': url,
+                'content': content,
+                'path': path,
+            }) + '\n')
+            self._index.flush()
+        if self.result is None:
+            if self._index is None:
+                self.content[uuid] = {'content': content, 'url': url}
+            return
+        self._batch.append(ResultItem(
+            result=self.result, operation=self.operation, uuid=uuid, url=url,
+            content=content, path=path))
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self._batch:
+            ResultItem.objects.bulk_create(self._batch)
+            self._batch = []
+
+    def get_datum(self, stopped=None):
+        """ Return Datum of the crawl, stopped is reason of early stop """
+        self.flush()
+        extras = {'path': self.paths}
+        if self.result is not None:
+            extras['items'] = self.count
+        if self._index:
+            self._index.close()
+            extras['index'] = self.index_path
+        if stopped:
+            extras['stopped'] = stopped
+        return Datum(content=self.content, **extras)
+
+
+def get_index_name(operation=0):
+    """Return name of the JSON Lines index of given crawl operation in result
+    files. The first operation keeps INDEX_JSONL."""
+    if not operation:
+        return INDEX_JSONL
+    root, ext = os.path.splitext(INDEX_JSONL)
+    return '{0}-{1}{2}'.format(root, operation, ext)
+
+
+def create_result(data, task_id=None, local_content=None, spider=None):
     """ This will create and return the Result object. It binds with a task ID
     if provided.
     Arguments:
         data - Result data as dict or string value
-        task_id - (optional) ID of related task
+        task_id - (optional) ID of related task, the result of a task which
+            is run again replaces the previous one
         local_content - (optional) related local content object
+        spider - (optional) Spider producing the result
     """
     # If no task_id (from queuing system) provided, new unique ID
-    # with prefix will be generated and used
-    if task_id is None:
-        duplicated = True
-        while duplicated:
-            task_id = NO_TASK_PREFIX + str(uuid.uuid4())
-            if not Result.objects.filter(task_id=task_id).exists():
-                break
-    res = Result(task_id=task_id, data=data)
+    # with prefix will be generated and used. Uniqueness is enforced by
+    # the database.
+    res = Result(data=data, spider=spider)
     if local_content:
         res.other = local_content
-    res.save()
+    if task_id:
+        res.bind_task(task_id)
+    else:
+        res.task_id = NO_TASK_PREFIX + str(uuid.uuid4())
+        res.save()
     return res
 
 
+class LocalContentManager(models.Manager):
+
+    def latest_for_url(self, url):
+        """ Return the latest local content of given URL which still has
+        its files, None if missing """
+        contents = self.filter(url=url, state=0).order_by(
+            '-created_time', '-pk')
+        return contents.first()
+
+
 class LocalContent(models.Model):
     """ Store scrapped content in local, this could be used to prevent
         redownloading
     """
-    url = models.CharField(max_length=256)
+    url = models.CharField(max_length=256, db_index=True)
     local_path = models.CharField(max_length=256)
     created_time = models.DateTimeField(
-        default=datetime.now, blank=True, null=True)
+        default=datetime.now, blank=True, null=True, db_index=True)
     state = models.IntegerField(default=0)
 
+    objects = LocalContentManager()
+
     def __unicode__(self):
         return u'Content (at {0}) of: {1}'.format(self.created_time, self.url)
 
@@ -388,12 +1053,7 @@ class LocalContent(models.Model):
         if not storage.exists(self.local_path):
             return
         try:
-            if os.path.isdir(self.local_path):
-                dirs, files = storage.listdir(self.local_path)
-                for fn in files:
-                    storage.delete(join(self.local_path, fn))
-            else:
-                storage.delete(self.local_path)
+            delete_storage_path(storage, self.local_path)
         except OSError:
             logger.error('Error when deleting: {0}'.format(
                 self.local_path))
@@ -402,6 +1062,302 @@ class LocalContent(models.Model):
         self.save()
 
 
+def iter_kept_pages(result=None, local_content=None, directory=None):
+    """ Return iterator of pages kept from previous crawls, as (url, kind,
+    source), see pipeline.load_kept_page(). Pages are snapshots of given
+    Result or LocalContent (IDs or objects), or files saved in given
+    directory. """
+    # Snapshots are loaded at once, the iterator could be consumed by other
+    # thread (of process pool), which doesn't share database connection
+    pages = []
+    if result is not None:
+        if not isinstance(result, Result):
+            result = Result.objects.get(pk=result)
+        local_content = result.other
+    if local_content is not None:
+        if not isinstance(local_content, LocalContent):
+            local_content = LocalContent.objects.get(pk=local_content)
+        refs = SnapshotRef.objects.filter(
+            local_content=local_content).values_list(
+            'url', 'snapshot__digest')
+        pages.extend((url, 'snapshot', digest) for url, digest in refs)
+    if directory:
+        return itertools.chain(pages, iter_saved_pages(directory))
+    return iter(pages)
+
+
+def iter_saved_pages(directory):
+    """ Yield pages (*.html) saved in given directory, as kept pages """
+    for path, dirs, files in os.walk(directory):
+        for name in sorted(files):
+            if name.lower().endswith(('.html', '.htm')):
+                file_path = os.path.abspath(join(path, name))
+                yield 'file://' + file_path, 'file', file_path
+
+
+class SnapshotManager(models.Manager):
+
+    def add_refs(self, local_content, pages):
+        """ Make local content refer to snapshots of given pages, as list
+        of (URL, digest). Snapshots must be in the snapshot store already.
+        There is one reference per URL, pages with the same content count
+        as many refs of their snapshot. Existing snapshots are claimed
+        (refs increased) first, so they are kept by delete_released().
+        Pages whose blob was deleted meanwhile are skipped. """
+        store = get_store()
+        urls = {}
+        for url, digest in dict(reversed(pages)).items():
+            urls.setdefault(digest, []).append(url)
+        counts = {}
+        for digest, digest_urls in urls.items():
+            counts.setdefault(len(digest_urls), []).append(digest)
+        with transaction.atomic():
+            for count, digests in counts.items():
+                self.filter(digest__in=digests).update(
+                    refs=F('refs') + count)
+            claimed = set(self.filter(digest__in=urls).values_list(
+                'digest', flat=True))
+        for digest in set(urls) - claimed:
+            if not store.find(digest):
+                logger.error('Snapshot {0} was deleted meanwhile, page(s) '
+                             'not kept: {1}'.format(
+                                 digest, ', '.join(urls[digest])))
+                continue
+            count = len(urls[digest])
+            try:
+                with transaction.atomic():
+                    self.create(digest=digest, refs=count,
+                                size=store.get_size(digest))
+            except IntegrityError:
+                # Added by another crawl meanwhile
+                self.filter(digest=digest).update(refs=F('refs') + count)
+            claimed.add(digest)
+        SnapshotRef.objects.bulk_create([
+            SnapshotRef(local_content=local_content, snapshot=snapshot,
+                        url=url)
+            for snapshot in self.filter(digest__in=claimed)
+            for url in urls[snapshot.digest]])
+
+    def release(self, local_content):
+        """ Remove references of local content, snapshots not referred
+        anymore are deleted with their blobs """
+        self.delete_released(self.release_many([local_content.pk]))
+
+    def release_many(self, content_ids):
+        """ Same as release() for many local contents (IDs) at once, with
+        a few queries. Snapshots are not deleted, see delete_released().
+        Returns: Digests of snapshots which are not referred anymore """
+        refs = SnapshotRef.objects.filter(local_content__in=content_ids)
+        counts = {}
+        for row in refs.values('snapshot').annotate(count=Count('pk')):
+            counts.setdefault(row['count'], []).append(row['snapshot'])
+        if not counts:
+            return []
+        refs.delete()
+        for count, ids in counts.items():
+            self.filter(pk__in=ids).update(refs=F('refs') - count)
+        ids = list(itertools.chain(*counts.values()))
+        return list(self.filter(pk__in=ids, refs__lte=0).values_list(
+            'digest', flat=True))
+
+    def delete_released(self, digests):
+        """ Delete snapshots of given digests which are still not referred,
+        with their blobs. Each row stays locked until its blob is deleted,
+        a crawl which claims the snapshot before (see add_refs()) keeps it.
+        A crawl which stored the same page earlier but refers to it only
+        after the deletion loses the page, add_refs() logs it as an error.
+        Returns: Digests of deleted snapshots """
+        store = get_store()
+        deleted = []
+        for digest in digests:
+            with transaction.atomic():
+                released = self.select_for_update().filter(
+                    digest=digest, refs__lte=0)
+                if not released.exists():
+                    continue
+                released.delete()
+                if store:
+                    store.delete(digest)
+            deleted.append(digest)
+        return deleted
+
+    def latest_for_url(self, url):
+        """ Return the latest snapshot of page at given URL, None if the
+        page has never been kept """
+        refs = SnapshotRef.objects.filter(url=url).select_related(
+            'snapshot').order_by('-pk')
+        ref = refs.first()
+        return ref.snapshot if ref else None
+
+    def known_urls(self, urls, batch_size=500):
+        """ Return set of given URLs having snapshots already, checked by
+        batches so the queries stay small """
+        known = set()
+        for batch in chunks(set(urls), batch_size):
+            known.update(SnapshotRef.objects.filter(url__in=batch).values_list(
+                'url', flat=True))
+        return known
+
+
+class Snapshot(models.Model):
+    """ Raw content (page source,...) kept in the snapshot store, named by
+    SHA-256 digest of the content. Identical content of different crawls is
+    stored once, refs is the number of SnapshotRef (one per URL of each
+    LocalContent) referring to it. """
+    digest = models.CharField(max_length=64, unique=True)
+    size = models.PositiveIntegerField(
+        default=0, help_text='Size of the compressed blob')
+    refs = models.IntegerField(default=0)
+    created_time = models.DateTimeField(default=timezone.now)
+    local_contents = models.ManyToManyField(
+        'LocalContent', through='SnapshotRef', related_name='snapshots')
+
+    objects = SnapshotManager()
+
+    def __unicode__(self):
+        return u'Snapshot <{0}>'.format(self.digest)
+
+    def get_content(self):
+        store = get_store()
+        return store.get(self.digest) if store else None
+
+
+class SnapshotRef(models.Model):
+    """ Reference from a LocalContent to a Snapshot """
+    local_content = models.ForeignKey(
+        'LocalContent', related_name='snapshot_refs')
+    snapshot = models.ForeignKey(Snapshot, related_name='snapshot_refs')
+    url = models.CharField(max_length=256, blank=True, default='',
+                           db_index=True)
+
+    class Meta:
+        unique_together = ('local_content', 'url')
+
+
+class QueueManager(models.Manager):
+
+    def enqueue(self, spider, crawl_id, links, depth):
+        """ Put links (as {'target': [...], 'expand': [...]}) at given depth
+        into the queue of a crawl. Already queued links are ignored. """
+        for kind in links:
+            if kind == 'expand' and depth >= spider.crawl_depth:
+                continue
+            urls = set(links[kind])
+            if not urls:
+                continue
+            existing = self.filter(crawl_id=crawl_id, kind=kind,
+                                   url__in=urls).values_list('url', flat=True)
+            items = [self.model(spider=spider, crawl_id=crawl_id, kind=kind,
+                                url=url, depth=depth)
+                     for url in urls.difference(existing)]
+            try:
+                with transaction.atomic():
+                    self.bulk_create(items)
+            except IntegrityError:
+                # Some were queued by another worker at the same time
+                for item in items:
+                    try:
+                        with transaction.atomic():
+                            item.save()
+                    except IntegrityError:
+                        pass
+
+    def lease(self, worker, crawl_id=None, timeout=QUEUE_LEASE_TIMEOUT):
+        """ Take the next available link for given worker, a link is
+        available if pending or its lease has expired. The lease is made
+        by conditional update, so only one worker can win a link.
+        Returns: QueueItem object or None if nothing to do """
+        now = timezone.now()
+        available = self.filter(
+            Q(state=QUEUE_PENDING) |
+            Q(state=QUEUE_LEASED, lease_expires__lt=now))
+        if crawl_id:
+            available = available.filter(crawl_id=crawl_id)
+        candidates = available.order_by('depth', 'pk')
+        for pk in candidates.values_list('pk', flat=True)[:10]:
+            leased = available.filter(pk=pk).update(
+                state=QUEUE_LEASED, worker=worker,
+                lease_expires=now + timedelta(seconds=timeout),
+                attempts=F('attempts') + 1)
+            if leased:
+                return self.get(pk=pk)
+
+    def is_finished(self, crawl_id):
+        """ Return True if all links of given crawl have been processed """
+        return not self.filter(
+            crawl_id=crawl_id,
+            state__in=(QUEUE_PENDING, QUEUE_LEASED)).exists()
+
+
+class QueueItem(models.Model):
+    """ A link in the queue of a distributed crawl. Workers lease links for
+    a limited time, expired leases will be taken by others. """
+    spider = models.ForeignKey(Spider)
+    crawl_id = models.CharField(max_length=64, db_index=True)
+    url = models.CharField(max_length=256)
+    kind = models.CharField(max_length=16, choices=LINK_KINDS)
+    depth = models.PositiveIntegerField(default=0)
+    state = models.IntegerField(choices=QUEUE_STATES, default=QUEUE_PENDING)
+    worker = models.CharField(max_length=64, blank=True, null=True)
+    lease_expires = models.DateTimeField(blank=True, null=True)
+    attempts = models.PositiveIntegerField(default=0)
+    data = JSONField(blank=True, null=True)
+
+    objects = QueueManager()
+
+    class Meta:
+        unique_together = ('crawl_id', 'kind', 'url')
+        # Lookups of lease() and is_finished()
+        index_together = [('crawl_id', 'state'), ('state', 'depth')]
+
+    def __unicode__(self):
+        return u'Queued {0} link: {1}'.format(self.kind, self.url)
+
+    def complete(self, data=None):
+        """ Mark the link as done with its data. Returns False if the lease
+        has been lost to other worker """
+        return bool(QueueItem.objects.filter(
+            pk=self.pk, worker=self.worker, state=QUEUE_LEASED).update(
+                state=QUEUE_DONE, data=data))
+
+    def release(self):
+        """ Give back failed link, it will be retried by any worker until
+        QUEUE_MAX_ATTEMPTS reached """
+        state = QUEUE_PENDING
+        if self.attempts >= QUEUE_MAX_ATTEMPTS:
+            state = QUEUE_FAILED
+        QueueItem.objects.filter(
+            pk=self.pk, worker=self.worker, state=QUEUE_LEASED).update(
+                state=state, lease_expires=None)
+
+
+def run_queue_worker(worker, crawl_id=None, limit=None):
+    """ Process links in the crawl queue until it's empty.
+    Arguments:
+        worker - Unique name of this worker
+        crawl_id - Only process links of this crawl
+        limit - Maximum number of links to be processed
+    Returns: Number of processed links
+    """
+    count = 0
+    # Spiders are kept with their crawl context for next links
+    spiders = {}
+    while limit is None or count < limit:
+        item = QueueItem.objects.lease(worker, crawl_id)
+        if item is None:
+            break
+        try:
+            if item.spider_id not in spiders:
+                spiders[item.spider_id] = item.spider
+            item.complete(spiders[item.spider_id].process_item(item))
+        except Exception:
+            logger.exception('Unable to process queued link: {0}'.format(
+                item.url))
+            item.release()
+        count += 1
+    return count
+
+
 class UserAgent(models.Model):
     """ Define a specific user agent for being used in Source """
     name = models.CharField(_('UA Name'), max_length=64)
@@ -430,15 +1386,83 @@ class ProxyServer(models.Model):
 # TODO it will be best if these below could be placed into separate module
 
 
+# Set while purging, files and related objects are then cleaned up in bulk
+# instead of by the receivers below
+_purging = threading.local()
+
+
 @receiver(pre_delete, sender=LocalContent)
 def clear_local_files(sender, instance, *args, **kwargs):
     """Ensure all files saved into media dir will be deleted as well"""
+    if getattr(_purging, 'active', False):
+        return
     instance.remove_files()
+    Snapshot.objects.release(instance)
 
 
 @receiver(pre_delete, sender=Result)
 def remove_result(sender, **kwargs):
     """Ensure all related local content will be deleted"""
+    if getattr(_purging, 'active', False):
+        return
     result = kwargs['instance']
     if result.other:
         result.other.delete()
+
+
+def _delete_file(path):
+    try:
+        return delete_storage_path(storage, path)
+    except (OSError, IOError):
+        logger.exception('Error when deleting: {0}'.format(path))
+        return 0
+
+
+def purge_results(queryset, chunk_size=500, workers=8):
+    """ Delete results of given queryset with their local contents, files
+    and snapshots. Rows are deleted by chunks of QuerySet.delete(), without
+    loading data of results and with the pre_delete receivers muted. Files
+    are then removed by a pool of threads, snapshots which are still not
+    referred by Snapshot.objects.delete_released().
+    Returns: Dict of numbers of deleted results, contents, files and
+        snapshots
+    """
+    summary = {'results': 0, 'contents': 0, 'files': 0, 'snapshots': 0}
+    pool = ThreadPool(max(workers, 1))
+    last = None
+    try:
+        while True:
+            chunk = queryset.order_by('pk')
+            if last is not None:
+                chunk = chunk.filter(pk__gt=last)
+            rows = list(chunk.values_list('pk', 'other')[:chunk_size])
+            if not rows:
+                break
+            last = rows[-1][0]
+            ids = [_[0] for _ in rows]
+            content_ids = [_[1] for _ in rows if _[1] is not None]
+            contents = LocalContent.objects.filter(pk__in=content_ids)
+            paths = list(contents.exclude(local_path='').values_list(
+                'local_path', flat=True))
+            _purging.active = True
+            try:
+                with transaction.atomic():
+                    digests = Snapshot.objects.release_many(content_ids)
+                    Result.objects.filter(pk__in=ids).defer('data').delete()
+                    # Other results of the contents are detached (SET_NULL)
+                    # here, so the collector doesn't load them
+                    Result.objects.filter(other__in=content_ids).update(
+                        other=None)
+                    contents.delete()
+            finally:
+                _purging.active = False
+            # Files are removed once rows are gone for sure
+            summary['files'] += sum(pool.imap_unordered(_delete_file, paths))
+            summary['results'] += len(ids)
+            summary['contents'] += len(content_ids)
+            summary['snapshots'] += len(
+                Snapshot.objects.delete_released(digests))
+    finally:
+        pool.close()
+        pool.join()
+    return summary
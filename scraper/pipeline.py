@@ -0,0 +1,201 @@
+import logging
+import itertools
+
+from multiprocessing import Pool, cpu_count
+from multiprocessing.pool import ThreadPool
+
+from .config import FETCH_THREADS, REEXTRACT_CHUNK
+from .extractor import Extractor, get_source
+from .serializers import get_serializer
+from .snapshots import get_store
+from .utils import CrawlStats
+
+
+logger = logging.getLogger('scraper')
+
+EMPTY_HTML = '<html></html>'
+
+# Extraction plan used by current worker process, set when the pool starts
+_plan = None
+
+
+def extract_page(extractor, plan):
+    """Run the extraction plan over page loaded by given extractor, content
+    and links are collected then index file is written into result path.
+    Arguments:
+        extractor - Extractor object, which holds the page
+        plan - Extraction plan, as returned by Collector.get_plan()
+    Returns:
+        Dict of extracted data, could be used to build Datum object
+    """
+    data, result_path = extractor.extract_content(
+        get_image=plan['get_image'],
+        selectors=plan['selectors'],
+        replace_rules=plan['replace_rules'],
+        get_media=plan.get('get_media', True),
+    )
+    serializer = get_serializer()
+    extractor.write_file(serializer.index_name, serializer.dumps(data))
+    extras = {'path': result_path}
+    store = get_store()
+    if store and plan.get('snapshot', True):
+        # Raw page is kept in the snapshot store
+        extras['snapshot'] = store.put(extractor._html)
+    explore = plan.get('explore')
+    if explore:
+        # In case of having exploring rules, additional information
+        # like other target/expand links will also be collected
+        extras.update(extract_links(extractor, explore))
+        extras['uuid'] = extractor._uuid
+    data.update(extras)
+    return data
+
+
+def extract_links(extractor, explore):
+    """Return dict of links found in extractor page, following the XPaths
+    in explore: {'target': ['//a'], 'expand': ['//div/a']}"""
+    links = {}
+    for rule in explore.keys():
+        links[rule] = [_['url'] for _ in
+                       extractor.extract_links(explore[rule])]
+    return links
+
+
+def _init_worker(plan):
+    global _plan
+    _plan = plan
+
+
+def _fetch(task):
+    """Download source of page, this runs in threads"""
+    kind, url, plan, stats = task
+    headers = {'User-Agent': plan.get('user_agent') or ''}
+    with stats.span('get_source'):
+        html = get_source(url, headers, plan.get('proxies'))
+    stats.add_page(html)
+    return kind, url, html
+
+
+def _extract(task):
+    """Parse and extract downloaded page, this runs in worker processes.
+    Only plain values are returned to the parent process."""
+    kind, url, html = task
+    stats = CrawlStats()
+    try:
+        extractor = Extractor(
+            url,
+            html=html or EMPTY_HTML,
+            base_dir=_plan['base_dir'],
+            proxies=_plan.get('proxies'),
+            user_agent=_plan.get('user_agent'),
+            stats=stats,
+            writer=_plan.get('writer'),
+        )
+        if kind == 'target':
+            data = extract_page(extractor, _plan)
+        else:
+            data = extract_links(extractor, _plan['explore'])
+    except Exception:
+        logger.exception('Unable to extract page: {0}'.format(url))
+        stats.add(errors=1)
+        data = None
+    return kind, url, data, stats.export()
+
+
+def load_kept_page(kind, source):
+    """Return source of page kept from previous crawls
+    Arguments:
+        kind - 'snapshot' (source is digest in snapshot store) or 'file'
+            (source is path to saved page)
+    """
+    if kind == 'snapshot':
+        store = get_store()
+        return store.get(source) if store else None
+    with open(source, 'r') as page:
+        return page.read()
+
+
+def _extract_kept(task):
+    """Load and extract kept page, this runs in worker processes"""
+    url, kind, source = task
+    try:
+        html = load_kept_page(kind, source)
+    except (IOError, OSError):
+        logger.exception('Unable to load page: {0}'.format(source))
+        html = None
+    if not html:
+        return url, kind, source, None, {'errors': 1}
+    _, url, data, stats = _extract(('target', url, html))
+    return url, kind, source, data, stats
+
+
+def reextract(pages, plan, workers=None, stats=None):
+    """Run the extraction plan over pages kept from previous crawls, in
+    a pool of processes. Nothing is downloaded.
+    Arguments:
+        pages - Iterable of (url, kind, source), see load_kept_page()
+        workers - Number of processes, 0 to extract in current process
+    Returns:
+        Iterator of (url, kind, source, data), in order of completion.
+        Data is same as extract_page() output, None if page failed.
+    """
+    stats = stats if stats is not None else CrawlStats()
+    if workers == 0:
+        _init_worker(plan)
+        results = itertools.imap(_extract_kept, pages)
+        pool = None
+    else:
+        pool = Pool(workers or cpu_count(), _init_worker, (plan,))
+        results = pool.imap_unordered(_extract_kept, pages, REEXTRACT_CHUNK)
+    try:
+        for url, kind, source, data, page_stats in results:
+            stats.add(**page_stats)
+            if data is not None:
+                stats.add(pages=1)
+            yield url, kind, source, data
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+
+class Pipeline(object):
+    """Processes pages in two stages: sources are downloaded by a pool of
+    threads, then parsed and extracted by a pool of processes. Both stages
+    run at the same time, each fetched page goes to extracting as soon as
+    it's ready."""
+
+    def __init__(self, plan, workers=None, threads=None, stats=None):
+        self.plan = plan
+        self.stats = stats if stats is not None else CrawlStats()
+        self.workers = workers or cpu_count()
+        self.threads = threads or FETCH_THREADS
+        # Processes are forked before any thread of this pipeline starts
+        self._extractors = Pool(self.workers, _init_worker, (plan,))
+        self._fetchers = ThreadPool(self.threads)
+
+    def process(self, tasks):
+        """Fetch and extract the given pages
+        Arguments:
+            tasks - List of (kind, url), kind is 'target' or 'expand'
+        Returns:
+            Iterator of (kind, url, data), in order of completion. Data
+            of targets is same as extract_page() output, expand pages
+            only have links. Data is None if page failed.
+        """
+        fetched = self._fetchers.imap_unordered(
+            _fetch,
+            [(kind, url, self.plan, self.stats) for kind, url in tasks])
+        for kind, url, data, stats in self._extractors.imap_unordered(
+                _extract, fetched):
+            self.stats.add(**stats)
+            yield kind, url, data
+
+    def close(self, terminate=False):
+        """Stop the pools, pending pages are dropped if terminate is set"""
+        for pool in (self._fetchers, self._extractors):
+            if terminate:
+                pool.terminate()
+            else:
+                pool.close()
+            pool.join()
@@ -0,0 +1,91 @@
+import time
+import random
+import logging
+
+from datetime import timedelta
+from multiprocessing.pool import ThreadPool
+
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from .config import SCHEDULE_JITTER
+from .models import Spider
+
+
+logger = logging.getLogger('scraper')
+
+
+def run_scheduled(spider_id, operations, close_connection=False):
+    """ Operate a locked spider then release its lock """
+    spider = Spider.objects.get(pk=spider_id)
+    try:
+        spider.operate(operations)
+    except Exception:
+        logger.exception('Scheduled run failed: {0}'.format(spider))
+    finally:
+        spider.unlock_run()
+        if close_connection:
+            # Each thread has its own connection
+            connection.close()
+
+
+class Scheduler(object):
+    """ Runs spiders having crawl_interval or crawl_schedule when they are
+    due. It's meant to be a long-running process, so HTTP sessions and
+    loaders (browsers) stay warm between runs. A spider is never run twice
+    at the same time, even with several schedulers. """
+
+    def __init__(self, operations, workers=4, jitter=SCHEDULE_JITTER):
+        """
+        Arguments:
+            operations - Operations performed in each run
+            workers - Number of spiders run at the same time, in threads.
+                0 means running inside run_pending() call.
+            jitter - Maximum random delay (seconds) added to start times
+        """
+        self.operations = operations
+        self.jitter = jitter
+        self.pool = ThreadPool(workers) if workers else None
+        # Start times (with jitter) of due spiders, by spider ID
+        self.planned = {}
+
+    def run_pending(self, now=None):
+        """ Plan the due spiders and start the ones which passed their
+        start times.
+        Returns: List of started spider IDs """
+        now = now or timezone.now()
+        spiders = Spider.objects.filter(
+            Q(crawl_interval__gt=0) | ~Q(crawl_schedule='')).exclude(
+            pk__in=self.planned.keys())
+        for spider in spiders:
+            if spider.is_due(now):
+                delay = random.uniform(0, self.jitter)
+                self.planned[spider.pk] = now + timedelta(seconds=delay)
+
+        started = []
+        for spider_id, start in self.planned.items():
+            if start > now:
+                continue
+            del self.planned[spider_id]
+            spider = Spider.objects.get(pk=spider_id)
+            if not spider.lock_run(now):
+                logger.info('Skipped, still running: {0}'.format(spider))
+                continue
+            started.append(spider_id)
+            if self.pool:
+                self.pool.apply_async(
+                    run_scheduled, (spider_id, self.operations, True))
+            else:
+                run_scheduled(spider_id, self.operations)
+        return started
+
+    def run_forever(self, tick=10):
+        while True:
+            self.run_pending()
+            time.sleep(tick)
+
+    def close(self):
+        if self.pool:
+            self.pool.close()
+            self.pool.join()
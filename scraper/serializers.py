@@ -0,0 +1,106 @@
+import logging
+import simplejson as json
+
+from .config import SERIALIZER
+
+
+logger = logging.getLogger('scraper')
+
+
+class Serializer(object):
+    """Converts data into string (and back) by given functions
+        extension - Extension of files holding serialized data
+        single_line - Output is text without line breaks, so it can be used
+            in JSON Lines files
+    """
+
+    def __init__(self, name, dumps, loads, extension='json',
+                 single_line=True):
+        self.name = name
+        self.dumps = dumps
+        self.loads = loads
+        self.extension = extension
+        self.single_line = single_line
+
+    @property
+    def index_name(self):
+        return 'index.' + self.extension
+
+    def __repr__(self):
+        return 'Serializer ({0})'.format(self.name)
+
+
+def _json():
+    return Serializer(
+        'json', lambda data: json.dumps(data, separators=(',', ':')),
+        json.loads)
+
+
+def _pretty():
+    return Serializer(
+        'pretty', lambda data: json.dumps(data, indent=2), json.loads,
+        single_line=False)
+
+
+def _ujson():
+    import ujson
+    return Serializer('ujson', ujson.dumps, ujson.loads)
+
+
+def _orjson():
+    import orjson
+    return Serializer('orjson', orjson.dumps, orjson.loads)
+
+
+def _msgpack():
+    import msgpack
+    return Serializer(
+        'msgpack',
+        lambda data: msgpack.packb(data, use_bin_type=True),
+        lambda value: msgpack.unpackb(value, raw=False),
+        extension='msgpack', single_line=False)
+
+
+SERIALIZERS = {
+    'json': _json,
+    'pretty': _pretty,
+    'ujson': _ujson,
+    'orjson': _orjson,
+    'msgpack': _msgpack,
+}
+
+_loaded = {}
+
+
+def get_serializer(name=None):
+    """Return serializer of given name, or the one in SERIALIZER setting.
+    Compact JSON is used if the serializer is unknown or its library is not
+    installed."""
+    if name is None:
+        name = SERIALIZER
+    if name not in _loaded:
+        try:
+            _loaded[name] = SERIALIZERS[name]()
+        except (KeyError, ImportError):
+            logger.exception('Cannot load serializer {0}'.format(name))
+            _loaded[name] = get_serializer('json')
+    return _loaded[name]
+
+
+def get_line_serializer(name=None):
+    """Same as get_serializer(), for JSON Lines files. Serializers writing
+    binary or multi-line output are replaced by compact JSON."""
+    serializer = get_serializer(name)
+    return serializer if serializer.single_line else get_serializer('json')
+
+
+def available_serializers():
+    """Return names of serializers which could be loaded"""
+    names = []
+    for name in sorted(SERIALIZERS):
+        try:
+            SERIALIZERS[name]()
+            names.append(name)
+        except ImportError:
+            pass
+    return names
@@ -7,5 +7,19 @@ post_crawl = dispatch.Signal(providing_args=["task_id"])
 
 
 # Signal will be fired at the end of each scraping action in single page.
-# This will be corresponded with single Result object.
-post_scrape = dispatch.Signal(providing_args=["result"])
+# This will be corresponded with single Result object. The Datum is sent
+# as it is, receivers get it serialized by datum.json (done once). It's not
+# sent if there is no receiver.
+post_scrape = dispatch.Signal(providing_args=["datum"])
+
+
+# Fired by crawling operations for each extracted page, as soon as it's
+# ready, so receivers can stream results
+post_page = dispatch.Signal(
+    providing_args=["spider", "task_id", "url", "uuid", "content", "path"])
+
+
+# Fired at the end of each operate() call with timing histograms of crawl
+# phases (see scraper.timing), for forwarding them to metrics systems
+crawl_timings = dispatch.Signal(
+    providing_args=["spider", "task_id", "result", "timings"])
@@ -0,0 +1,153 @@
+import re
+import zlib
+import logging
+
+from datetime import datetime, timedelta
+from StringIO import StringIO
+from lxml import etree
+
+from django.utils import timezone
+
+from . import extractor
+from .config import CHUNK_SIZE
+from .extractor import get_session, fetch_slot
+
+
+logger = logging.getLogger('scraper')
+
+W3C_DATETIME = re.compile(
+    r'^(\d{4})-(\d{2})-(\d{2})'
+    r'(?:T(\d{2}):(\d{2})(?::(\d{2})(?:\.\d+)?)?'
+    r'(Z|[+-]\d{2}:\d{2})?)?$')
+GZIP_TYPES = ('application/x-gzip', 'application/gzip')
+
+# Sitemap indexes may link to other indexes, stop at this level
+MAX_DEPTH = 3
+
+
+class GunzipStream(object):
+    """File-like object decompressing a gzipped stream while being read,
+    the stream doesn't need to be seekable (unlike gzip.GzipFile)"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self._buffer = ''
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            chunk = self.stream.read(CHUNK_SIZE)
+            if not chunk:
+                self._buffer += self._decompressor.flush()
+                break
+            self._buffer += self._decompressor.decompress(chunk)
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def parse_lastmod(value):
+    """Convert W3C datetime of <lastmod> into UTC datetime (aware), None
+    if invalid. Values without time zone are considered as UTC.
+        '2015-10-19', '2015-10-19T10:07:00+07:00'
+    """
+    match = W3C_DATETIME.match((value or '').strip())
+    if not match:
+        return None
+    parts = [int(_ or 0) for _ in match.groups()[:6]]
+    atime = datetime(*parts)
+    offset = match.group(7)
+    if offset and offset != 'Z':
+        delta = timedelta(hours=int(offset[1:3]), minutes=int(offset[4:6]))
+        atime = atime - delta if offset[0] == '+' else atime + delta
+    return timezone.make_aware(atime, timezone.utc)
+
+
+def open_sitemap(url, headers=None, proxies=None):
+    """Return file-like object for reading sitemap at given URL, gzipped
+    sitemaps are decompressed on the fly"""
+    if extractor.custom_loader:
+        content = extractor.get_source(url, headers, proxies) or ''
+        stream = StringIO(content)
+        gzipped = content[:2] == '\x1f\x8b'
+    else:
+        with fetch_slot():
+            response = get_session().get(url, headers=headers or {},
+                                         proxies=proxies, stream=True)
+        response.raise_for_status()
+        # Transfer encoding (Content-Encoding: gzip) is handled by urllib3
+        response.raw.decode_content = True
+        stream = response.raw
+        content_type = response.headers.get('content-type', '')
+        gzipped = url.lower().split('?')[0].endswith('.gz') or \
+            content_type.split(';')[0].strip() in GZIP_TYPES
+    if gzipped:
+        stream = GunzipStream(stream)
+    return stream
+
+
+def iter_sitemap(url, since=None, headers=None, proxies=None, depth=0,
+                 errors=None):
+    """Yield page URLs listed in sitemap or sitemap index at given URL.
+    The XML is parsed as a stream and every processed element is dropped,
+    so memory stays flat for big sitemaps.
+    Arguments:
+        since - Only pages (and sitemaps) with <lastmod> later than this
+            are returned, pages without <lastmod> are always returned
+        errors - List, URLs of sitemaps which couldn't be read (completely)
+            are appended to it
+    """
+    if since is not None and timezone.is_naive(since):
+        since = timezone.make_aware(since, timezone.get_default_timezone())
+    try:
+        stream = open_sitemap(url, headers, proxies)
+        for event, element in etree.iterparse(stream, events=('end',)):
+            tag = etree.QName(element).localname
+            if tag not in ('url', 'sitemap'):
+                continue
+            loc = lastmod = None
+            for child in element:
+                name = etree.QName(child).localname
+                if name == 'loc':
+                    loc = (child.text or '').strip()
+                elif name == 'lastmod':
+                    lastmod = parse_lastmod(child.text)
+            # Release the processed nodes
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+            if not loc or (since and lastmod and lastmod <= since):
+                continue
+            if tag == 'url':
+                yield loc
+            elif depth < MAX_DEPTH:
+                for page_url in iter_sitemap(loc, since, headers, proxies,
+                                             depth + 1, errors):
+                    yield page_url
+    except Exception:
+        logger.exception('Unable to read sitemap: {0}'.format(url))
+        if errors is not None:
+            errors.append(url)
+
+
+class Sitemap(object):
+    """Iterator of page URLs of sitemap, same as iter_sitemap(). Once
+    exhausted, 'complete' tells whether every sitemap was read without
+    error."""
+
+    def __init__(self, url, since=None, headers=None, proxies=None):
+        self.errors = []
+        self.complete = False
+        self._urls = iter_sitemap(url, since, headers, proxies,
+                                  errors=self.errors)
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        try:
+            return next(self._urls)
+        except StopIteration:
+            self.complete = not self.errors
+            raise
@@ -0,0 +1,132 @@
+import os
+import zlib
+import hashlib
+import logging
+import tempfile
+
+from os.path import join
+
+from .config import SNAPSHOT_DIR, SNAPSHOT_COMPRESSION
+
+
+logger = logging.getLogger('scraper')
+
+
+def _zlib():
+    return ('.zz', lambda value: zlib.compress(value, 6), zlib.decompress)
+
+
+def _zstd():
+    import zstandard
+    return ('.zst', zstandard.ZstdCompressor().compress,
+            zstandard.ZstdDecompressor().decompress)
+
+
+CODECS = {
+    'zlib': _zlib,
+    'zstd': _zstd,
+}
+
+
+def get_codecs():
+    """Return available codecs, as {extension: decompress function}"""
+    codecs = {}
+    for name in CODECS:
+        try:
+            extension, compress, decompress = CODECS[name]()
+        except ImportError:
+            continue
+        codecs[extension] = decompress
+    return codecs
+
+
+class SnapshotStore(object):
+    """Keeps compressed blobs (raw pages,...) on disk, named by SHA-256 of
+    their content, so the same content is only stored once. Blobs are
+    sharded into sub-directories by the first characters of their digest:
+        ROOT/3a/7b/3a7b...e1.zz
+    """
+
+    def __init__(self, root=None, compression=None):
+        self.root = root or SNAPSHOT_DIR
+        self.compression = compression or SNAPSHOT_COMPRESSION
+        try:
+            self.extension, self.compress, _ = CODECS[self.compression]()
+        except (KeyError, ImportError):
+            logger.exception('Cannot use compression {0}, zlib is used'.format(
+                self.compression))
+            self.compression = 'zlib'
+            self.extension, self.compress, _ = _zlib()
+        self.codecs = get_codecs()
+
+    @staticmethod
+    def get_digest(content):
+        if isinstance(content, unicode):
+            content = content.encode('utf-8')
+        return hashlib.sha256(content).hexdigest()
+
+    def get_location(self, digest):
+        return join(self.root, digest[:2], digest[2:4])
+
+    def find(self, digest):
+        """Return path of blob with given digest, None if missing"""
+        location = self.get_location(digest)
+        for extension in self.codecs:
+            path = join(location, digest + extension)
+            if os.path.exists(path):
+                return path
+
+    def put(self, content):
+        """Store content if not existing yet
+        Returns: Digest of content
+        """
+        if isinstance(content, unicode):
+            content = content.encode('utf-8')
+        digest = self.get_digest(content)
+        if self.find(digest):
+            return digest
+        location = self.get_location(digest)
+        if not os.path.exists(location):
+            try:
+                os.makedirs(location)
+            except OSError:
+                # Created by another process meanwhile
+                if not os.path.isdir(location):
+                    raise
+        # Written into temporary file then renamed, readers never see
+        # partial blobs
+        handle, temp_path = tempfile.mkstemp(dir=location)
+        with os.fdopen(handle, 'wb') as blob:
+            blob.write(self.compress(content))
+        os.rename(temp_path, join(location, digest + self.extension))
+        return digest
+
+    def get(self, digest):
+        """Return content of blob, None if missing"""
+        path = self.find(digest)
+        if path is None:
+            return None
+        decompress = self.codecs[os.path.splitext(path)[1]]
+        with open(path, 'rb') as blob:
+            return decompress(blob.read())
+
+    def get_size(self, digest):
+        """Return size of the stored (compressed) blob"""
+        path = self.find(digest)
+        return os.path.getsize(path) if path else 0
+
+    def delete(self, digest):
+        path = self.find(digest)
+        if path:
+            os.remove(path)
+
+
+_store = None
+
+
+def get_store():
+    """Return snapshot store of SNAPSHOT_DIR, None if the setting is not set"""
+    global _store
+    if _store is None and SNAPSHOT_DIR:
+        _store = SnapshotStore()
+    return _store
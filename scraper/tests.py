@@ -1,30 +1,40 @@
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
+from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.contrib.admin import site
+from django.db import connection, IntegrityError
 from django.core.files.storage import default_storage as storage
+from django.core.files.storage import Storage, FileSystemStorage
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.utils import timezone
 
 import os
+import csv
+import time
+import multiprocessing
+import simplejson as json
 
-from zipfile import ZipFile
+from StringIO import StringIO
+from gzip import GzipFile
+
+from zipfile import ZipFile, ZIP_STORED, ZIP_DEFLATED
+from datetime import datetime, timedelta
 from os.path import join
 from shutil import rmtree
 
-from scraper import utils, models, config
+from scraper import (utils, models, config, extractor, pipeline, scheduler,
+                     sitemaps, serializers, signals, snapshots, warc, admin,
+                     timing)
 from scraper.extractor import Extractor
+from scraper.loaders import warc_record, warc_replay
+from scraper.local_site import LocalSite
 
 
-LOCAL_HOST = 'http://127.0.0.1:8000/'
 DATA_URL = """https://raw.githubusercontent.com/zniper/django-scraper/master/scraper/test_data/"""
 DATA_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)),
                         'test_data')
 
-# For future use, with real web server
-# def start_local_site(path=''):
-#     """ Just a simple local site for testing HTTP requests """
-#     PORT = 8000
-#     handler = SimpleHTTPServer.SimpleHTTPRequestHandler
-#     httpd = SocketServer.TCPServer(('', PORT), handler)
-#     print 'Local test server is up at', PORT
-#     httpd.serve_forever()
-
 
 def get_path(file_name):
     return os.path.join(DATA_DIR, file_name)
@@ -34,6 +44,27 @@ def get_url(file_name):
     return os.path.join(DATA_URL, file_name)
 
 
+class LocalLoader(object):
+    """ Custom loader serving pages from test_data instead of network """
+
+    def get_source(self, url, headers=None, proxies=None):
+        path = get_path(url.rstrip('/').rsplit('/', 1)[-1])
+        if os.path.isfile(path):
+            return open(path, 'r').read()
+
+
+class DictLoader(LocalLoader):
+    """ Serves given pages by URL, or test_data files """
+
+    def __init__(self, pages):
+        self.pages = pages
+
+    def get_source(self, url, headers=None, proxies=None):
+        if url in self.pages:
+            return self.pages[url]
+        return super(DictLoader, self).get_source(url, headers, proxies)
+
+
 def exists(path):
     if storage.exists(path):
         return True
@@ -385,6 +416,40 @@ class SpiderTests(TestCase):
             if os.path.exists(p):
                 rmtree(p)
 
+    def test_crawl_content_pipeline(self):
+        loader = extractor.custom_loader
+        extractor.custom_loader = LocalLoader()
+        try:
+            self.spider.crawl_depth = 2
+            data = self.spider.crawl_content(workers=2)
+        finally:
+            extractor.custom_loader = loader
+        self.assertEqual(len(data.content), 5)
+        for key in data.content:
+            self.assertIn('url', data.content[key])
+            self.assertIn('post', data.content[key]['content'])
+        for p in data.extras['path']:
+            self.assertEqual(os.path.exists(p), True)
+            rmtree(p)
+
+    def test_operate_crawl_local_zip(self):
+        loader = extractor.custom_loader
+        extractor.custom_loader = LocalLoader()
+        models.COMPRESS_RESULT = True
+        spider = create_spider()
+        try:
+            result = spider.operate(
+                [{'action': 'crawl', 'target': 'content'}])
+        finally:
+            extractor.custom_loader = loader
+        path = self.get_path(result.other.local_path)
+        zfile = ZipFile(path, 'r')
+        names = zfile.namelist()
+        self.assertIn('index.json', names)
+        self.assertEqual(
+            len([_ for _ in names if _.endswith('/index.json')]), 5)
+        os.remove(path)
+
     def test_perform_operation(self):
         data = self.spider._perform(
             action='get', target='links')
@@ -466,6 +531,1731 @@ class SpiderTests(TestCase):
                 storage.delete(path)
 
 
+class PipelineTests(TestCase):
+
+    def setUp(self):
+        self.loader = extractor.custom_loader
+        extractor.custom_loader = LocalLoader()
+        self.plan = {
+            'selectors': {'post': ("//div[@class='post-body']", 'text')},
+            'replace_rules': [],
+            'get_image': False,
+            'explore': {
+                'target': ["//div[@class='post-title']/h2/a"],
+                'expand': ['//a[@rel="next"]'],
+            },
+            'base_dir': join(config.TEMP_DIR, 'test-pipeline'),
+            'proxies': None,
+            'user_agent': None,
+        }
+        self.pipeline = pipeline.Pipeline(self.plan, workers=2, threads=2)
+
+    def tearDown(self):
+        self.pipeline.close()
+        extractor.custom_loader = self.loader
+        if os.path.exists(self.plan['base_dir']):
+            rmtree(self.plan['base_dir'])
+
+    def test_process_targets(self):
+        tasks = [('target', DATA_URL+'yc.a0.html'),
+                 ('target', DATA_URL+'yc.a1.html')]
+        results = list(self.pipeline.process(tasks))
+        self.assertEqual(len(results), 2)
+        for kind, url, data in results:
+            self.assertEqual(kind, 'target')
+            self.assertGreater(len(data['content']['post']), 0)
+            self.assertEqual(os.path.exists(data['path']), True)
+            self.assertIn('uuid', data)
+
+    def test_process_expand(self):
+        results = list(self.pipeline.process(
+            [('expand', DATA_URL+'yc.0.html')]))
+        kind, url, data = results[0]
+        self.assertEqual(kind, 'expand')
+        self.assertEqual(len(data['target']), 3)
+        self.assertNotIn('content', data)
+
+    def test_process_failed_page(self):
+        results = list(self.pipeline.process(
+            [('target', DATA_URL+'not-exist.html')]))
+        self.assertEqual(results[0][2]['content']['post'], [])
+
+
+def create_spider(**kwargs):
+    """ Create spider crawling the local test pages """
+    sel0 = models.Selector(
+        key='post',
+        xpath="//div[@class='post-body']",
+        data_type='html'
+    )
+    sel0.save()
+    col0 = models.Collector(name='news-content', get_image=False)
+    col0.save()
+    col0.selectors.add(sel0)
+    options = {
+        'url': DATA_URL+'yc.0.html',
+        'name': 'Local Source',
+        'target_links': ["//div[@class='post-title']/h2/a"],
+        'expand_links': ['//a[@rel="next"]'],
+        'crawl_depth': 2,
+    }
+    options.update(kwargs)
+    spider = models.Spider(**options)
+    spider.save()
+    spider.collectors.add(col0)
+    return spider
+
+
+class QueueTests(TestCase):
+
+    def setUp(self):
+        self.loader = extractor.custom_loader
+        extractor.custom_loader = LocalLoader()
+        self.spider = create_spider()
+        self.links = {'target': [DATA_URL+'yc.a0.html', DATA_URL+'yc.a1.html']}
+
+    def tearDown(self):
+        extractor.custom_loader = self.loader
+
+    def test_enqueue_unique(self):
+        models.QueueItem.objects.enqueue(self.spider, 'crawl', self.links, 1)
+        models.QueueItem.objects.enqueue(self.spider, 'crawl', self.links, 1)
+        self.assertEqual(models.QueueItem.objects.count(), 2)
+
+    def test_enqueue_expand_limit(self):
+        links = {'expand': [DATA_URL+'yc.1.html']}
+        models.QueueItem.objects.enqueue(self.spider, 'crawl', links, 2)
+        self.assertEqual(models.QueueItem.objects.count(), 0)
+
+    def test_lease(self):
+        models.QueueItem.objects.enqueue(self.spider, 'crawl', self.links, 1)
+        first = models.QueueItem.objects.lease('w1')
+        second = models.QueueItem.objects.lease('w2')
+        self.assertNotEqual(first.url, second.url)
+        self.assertEqual(second.worker, 'w2')
+        self.assertIsNone(models.QueueItem.objects.lease('w3'))
+        self.assertEqual(
+            models.QueueItem.objects.is_finished('crawl'), False)
+
+    def test_lease_expired(self):
+        models.QueueItem.objects.enqueue(
+            self.spider, 'crawl', {'target': self.links['target'][:1]}, 1)
+        item = models.QueueItem.objects.lease('w1', timeout=-1)
+        retaken = models.QueueItem.objects.lease('w2')
+        self.assertEqual(item.pk, retaken.pk)
+        # The late worker cannot complete the link anymore
+        self.assertEqual(item.complete({}), False)
+        self.assertEqual(retaken.complete({}), True)
+        self.assertEqual(models.QueueItem.objects.is_finished('crawl'), True)
+
+    def test_release(self):
+        models.QueueItem.objects.enqueue(
+            self.spider, 'crawl', {'target': self.links['target'][:1]}, 1)
+        for i in range(config.QUEUE_MAX_ATTEMPTS):
+            item = models.QueueItem.objects.lease('w1')
+            item.release()
+        item = models.QueueItem.objects.get(pk=item.pk)
+        self.assertEqual(item.state, config.QUEUE_FAILED)
+        self.assertIsNone(models.QueueItem.objects.lease('w1'))
+
+    def test_run_queue_worker(self):
+        models.QueueItem.objects.enqueue(self.spider, 'crawl', self.links, 1)
+        count = models.run_queue_worker('w1', 'crawl')
+        self.assertEqual(count, 2)
+        for item in models.QueueItem.objects.all():
+            self.assertEqual(item.state, config.QUEUE_DONE)
+            self.assertGreater(len(item.data['content']['post']), 0)
+            rmtree(item.data['path'])
+
+    def test_operate_distributed(self):
+        operations = [{'action': 'crawl', 'target': 'distributed'}]
+        result = self.spider.operate(operations, 'distributed-task')
+        content = result.data['results'][0]['content']
+        self.assertEqual(len(content), 5)
+        self.assertEqual(models.QueueItem.objects.count(), 0)
+        self.assertGreater(result.other.pk, 0)
+        rmtree(join(storage.base_location, result.other.local_path))
+
+
+class DelayedLoader(DictLoader):
+
+    def get_source(self, url, headers=None, proxies=None):
+        time.sleep(0.02)
+        return super(DelayedLoader, self).get_source(url, headers, proxies)
+
+
+def run_worker(worker, crawl_id):
+    """ Target of worker processes in QueueProcessTests """
+    models.run_queue_worker(worker, crawl_id)
+
+
+class QueueProcessTests(TransactionTestCase):
+    """ Workers in separate processes share the queue through the (file
+    backed) test database """
+
+    def setUp(self):
+        self.loader = extractor.custom_loader
+        url = 'http://local/queue/'
+        extractor.custom_loader = DelayedLoader(site_pages(url, 40))
+        self.spider = create_spider(url=url)
+        self.urls = ['{0}p{1}'.format(url, i) for i in range(40)]
+
+    def tearDown(self):
+        extractor.custom_loader = self.loader
+
+    def test_workers(self):
+        models.QueueItem.objects.enqueue(
+            self.spider, 'processes', {'target': self.urls}, 1)
+        # Connections must not be shared with the forked processes
+        connection.close()
+        workers = [multiprocessing.Process(target=run_worker,
+                                           args=('w{0}'.format(i),
+                                                 'processes'))
+                   for i in range(3)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+            self.assertEqual(worker.exitcode, 0)
+        items = models.QueueItem.objects.filter(crawl_id='processes')
+        self.assertEqual(items.count(), len(self.urls))
+        self.assertEqual(
+            set(items.values_list('state', flat=True)), {config.QUEUE_DONE})
+        # Every link was leased only once
+        self.assertEqual(set(items.values_list('attempts', flat=True)), {1})
+        self.assertGreater(
+            len(set(items.values_list('worker', flat=True))), 1)
+        for item in items:
+            rmtree(item.data['path'])
+
+
+class RunScraperTests(TestCase):
+
+    def setUp(self):
+        self.loader = extractor.custom_loader
+        extractor.custom_loader = LocalLoader()
+        self.spider = create_spider(name='local-spider')
+        self.spider._extractor = get_extractor('yc.0.html')
+
+    def tearDown(self):
+        extractor.custom_loader = self.loader
+
+    def test_run_selected(self):
+        create_spider(name='other-spider')
+        out = StringIO()
+        call_command('run_scraper', spiders=['local-spider'],
+                     operations=['get:links'], concurrency=2, stdout=out)
+        output = out.getvalue()
+        self.assertIn('local-spider', output)
+        self.assertNotIn('other-spider', output)
+        self.assertIn('Total: 1 spider(s)', output)
+        self.assertIsNone(extractor._fetch_slots)
+        self.assertEqual(models.Result.objects.count(), 1)
+
+    def test_run_by_id(self):
+        out = StringIO()
+        call_command('run_scraper', spiders=[str(self.spider.pk)],
+                     operations=['get:page'], stdout=out)
+        result = models.Result.objects.get()
+        self.assertEqual(result.data['stats']['pages'], 1)
+        self.assertEqual(result.data['stats']['errors'], 0)
+
+    def test_invalid_options(self):
+        self.assertRaises(CommandError, call_command, 'run_scraper',
+                          spiders=['not-exist'])
+        self.assertRaises(CommandError, call_command, 'run_scraper',
+                          operations=['crawl'])
+
+    def test_crawl_stats(self):
+        self.spider._extractor = None
+        result = self.spider.operate(
+            [{'action': 'crawl', 'target': 'content'}])
+        stats = result.data['stats']
+        # Start page, 1 expand page and 3 local targets, the other 2
+        # targets are not available
+        self.assertEqual(stats['pages'], 5)
+        self.assertEqual(stats['errors'], 2)
+        self.assertGreater(stats['bytes'], 0)
+        rmtree(join(storage.base_location, result.other.local_path))
+
+
+class RunScraperProcessTests(TransactionTestCase):
+
+    def setUp(self):
+        self.loader = extractor.custom_loader
+        extractor.custom_loader = LocalLoader()
+        self.crawl_workers = models.CRAWL_WORKERS
+        models.CRAWL_WORKERS = 2
+
+    def tearDown(self):
+        extractor.custom_loader = self.loader
+        models.CRAWL_WORKERS = self.crawl_workers
+
+    def test_workers_with_crawl_workers(self):
+        create_spider(name='first')
+        create_spider(name='second')
+        out = StringIO()
+        call_command('run_scraper', workers=2, stdout=out)
+        output = out.getvalue()
+        self.assertNotIn('Failed', output)
+        self.assertIn('Total: 2 spider(s)', output)
+        self.assertEqual(models.Result.objects.count(), 2)
+        for result in models.Result.objects.all():
+            self.assertEqual(result.data['stats']['pages'], 5)
+            rmtree(join(storage.base_location, result.other.local_path))
+
+
+class SchedulerTests(TestCase):
+
+    def setUp(self):
+        self.loader = extractor.custom_loader
+        extractor.custom_loader = LocalLoader()
+        self.spider = create_spider(crawl_interval=3600)
+        self.now = timezone.now()
+
+    def tearDown(self):
+        extractor.custom_loader = self.loader
+
+    def test_next_cron_time(self):
+        start = datetime(2015, 10, 19, 10, 7)
+        self.assertEqual(utils.next_cron_time('*/15 * * * *', start),
+                         datetime(2015, 10, 19, 10, 15))
+        self.assertEqual(utils.next_cron_time('30 8 * * 1-5', start),
+                         datetime(2015, 10, 20, 8, 30))
+        self.assertEqual(utils.next_cron_time('0 0 1 * *', start),
+                         datetime(2015, 11, 1, 0, 0))
+        self.assertEqual(utils.next_cron_time('0 9 * * 7', start),
+                         datetime(2015, 10, 25, 9, 0))
+
+    def test_parse_cron_step(self):
+        self.assertEqual(utils.parse_cron('5/15 * * * *')[0],
+                         [5, 20, 35, 50])
+        self.assertEqual(utils.parse_cron('1,5/15 * * * *')[0],
+                         [1, 5, 20, 35, 50])
+        self.assertEqual(utils.parse_cron('0 1-10/3 * * *')[1],
+                         [1, 4, 7, 10])
+
+    def test_invalid_cron(self):
+        for value in ('* * *', '61 * * * *', '0 0 30 2 *'):
+            self.assertRaises(ValueError, utils.next_cron_time, value,
+                              datetime.now())
+
+    def test_is_due_interval(self):
+        self.assertEqual(self.spider.is_due(self.now), True)
+        self.spider.last_run = self.now - timedelta(minutes=30)
+        self.assertEqual(self.spider.is_due(self.now), False)
+        self.spider.last_run = self.now - timedelta(minutes=61)
+        self.assertEqual(self.spider.is_due(self.now), True)
+
+    def test_is_due_schedule(self):
+        spider = models.Spider(crawl_schedule='0 * * * *')
+        spider.last_run = self.now - timedelta(minutes=61)
+        self.assertEqual(spider.is_due(self.now), True)
+        spider.last_run = self.now
+        self.assertEqual(spider.is_due(self.now), False)
+        self.assertEqual(models.Spider().is_due(self.now), False)
+
+    def test_lock_run(self):
+        other = models.Spider.objects.get(pk=self.spider.pk)
+        self.assertEqual(self.spider.lock_run(), True)
+        self.assertEqual(other.lock_run(), False)
+        self.spider.unlock_run()
+        self.assertEqual(other.lock_run(), True)
+
+    def test_stale_lock(self):
+        old = self.now - timedelta(seconds=config.SCHEDULE_LOCK_TIMEOUT+1)
+        self.assertEqual(self.spider.lock_run(old), True)
+        self.assertEqual(self.spider.lock_run(self.now), True)
+
+    def test_run_pending(self):
+        create_spider(name='not scheduled')
+        operations = [{'action': 'get', 'target': 'links'}]
+        sched = scheduler.Scheduler(operations, workers=0, jitter=0)
+        self.assertEqual(sched.run_pending(self.now), [self.spider.pk])
+        spider = models.Spider.objects.get(pk=self.spider.pk)
+        self.assertIsNone(spider.running_since)
+        self.assertEqual(spider.last_run, self.now)
+        self.assertEqual(models.Result.objects.count(), 1)
+        # Not due anymore
+        self.assertEqual(sched.run_pending(self.now), [])
+
+    def test_run_pending_jitter(self):
+        operations = [{'action': 'get', 'target': 'links'}]
+        sched = scheduler.Scheduler(operations, workers=0, jitter=60)
+        sched.planned[self.spider.pk] = self.now + timedelta(seconds=30)
+        self.assertEqual(sched.run_pending(self.now), [])
+        later = self.now + timedelta(seconds=31)
+        self.assertEqual(sched.run_pending(later), [self.spider.pk])
+
+    def test_run_pending_locked(self):
+        self.spider.lock_run(self.now - timedelta(hours=2))
+        sched = scheduler.Scheduler([], workers=0, jitter=0)
+        self.assertEqual(sched.run_pending(self.now), [])
+
+    def test_extractor_headers(self):
+        first = Extractor('http://local/', html='<html></html>',
+                          user_agent='first')
+        second = Extractor('http://local/', html='<html></html>',
+                           user_agent='second')
+        self.assertEqual(first.headers['User-Agent'], 'first')
+        self.assertEqual(second.headers['User-Agent'], 'second')
+
+    def test_session_per_process(self):
+        session = extractor.get_session()
+        self.assertIs(extractor.get_session(), session)
+        # As inherited by forked worker process
+        extractor._local.pid = -1
+        self.assertIsNot(extractor.get_session(), session)
+
+
+SITEMAP = """<?xml version="1.0" encoding="UTF-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <url><loc>{0}yc.a0.html</loc><lastmod>2015-10-01</lastmod></url>
+  <url><loc>{0}yc.a1.html</loc><lastmod>2015-10-20T08:00:00+07:00</lastmod></url>
+  <url><loc>{0}yc.a2.html</loc></url>
+</urlset>""".format(DATA_URL)
+
+SITEMAP_INDEX = """<?xml version="1.0" encoding="UTF-8"?>
+<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <sitemap><loc>http://local/sitemap-1.xml.gz</loc></sitemap>
+  <sitemap>
+    <loc>http://local/sitemap-old.xml</loc><lastmod>2014-01-01</lastmod>
+  </sitemap>
+</sitemapindex>"""
+
+
+def gzip_content(content):
+    output = StringIO()
+    gzfile = GzipFile(fileobj=output, mode='wb')
+    gzfile.write(content)
+    gzfile.close()
+    return output.getvalue()
+
+
+class SitemapTests(TestCase):
+
+    def setUp(self):
+        self.loader = extractor.custom_loader
+        extractor.custom_loader = DictLoader({
+            'http://local/sitemap.xml': SITEMAP,
+            'http://local/sitemap-index.xml': SITEMAP_INDEX,
+            'http://local/sitemap-1.xml.gz': gzip_content(SITEMAP),
+            'http://local/sitemap-old.xml': SITEMAP,
+        })
+
+    def tearDown(self):
+        extractor.custom_loader = self.loader
+
+    def test_parse_lastmod(self):
+        self.assertEqual(sitemaps.parse_lastmod('2015-10-19'),
+                         datetime(2015, 10, 19, tzinfo=timezone.utc))
+        self.assertEqual(
+            sitemaps.parse_lastmod('2015-10-19T10:07:30.5+07:00'),
+            datetime(2015, 10, 19, 3, 7, 30, tzinfo=timezone.utc))
+        self.assertEqual(sitemaps.parse_lastmod('2015-10-19T10:07Z'),
+                         datetime(2015, 10, 19, 10, 7, tzinfo=timezone.utc))
+        self.assertIsNone(sitemaps.parse_lastmod('19/10/2015'))
+
+    def test_iter_sitemap(self):
+        urls = list(sitemaps.iter_sitemap('http://local/sitemap.xml'))
+        self.assertEqual(urls, [DATA_URL+'yc.a0.html', DATA_URL+'yc.a1.html',
+                                DATA_URL+'yc.a2.html'])
+
+    def test_iter_sitemap_since(self):
+        since = datetime(2015, 10, 10, tzinfo=timezone.utc)
+        urls = list(sitemaps.iter_sitemap('http://local/sitemap.xml', since))
+        self.assertEqual(urls, [DATA_URL+'yc.a1.html', DATA_URL+'yc.a2.html'])
+
+    def test_iter_sitemap_index(self):
+        urls = list(sitemaps.iter_sitemap('http://local/sitemap-index.xml'))
+        self.assertEqual(len(urls), 6)
+        # The old sitemap is skipped
+        since = datetime(2015, 1, 1, tzinfo=timezone.utc)
+        urls = list(sitemaps.iter_sitemap(
+            'http://local/sitemap-index.xml', since))
+        self.assertEqual(len(urls), 3)
+
+    def test_iter_sitemap_invalid(self):
+        self.assertEqual(
+            list(sitemaps.iter_sitemap('http://local/not-exist.xml')), [])
+
+    def test_sitemap_complete(self):
+        sitemap = sitemaps.Sitemap('http://local/sitemap-index.xml')
+        self.assertEqual(len(list(sitemap)), 6)
+        self.assertEqual(sitemap.complete, True)
+        extractor.custom_loader.pages.pop('http://local/sitemap-old.xml')
+        sitemap = sitemaps.Sitemap('http://local/sitemap-index.xml')
+        self.assertEqual(len(list(sitemap)), 3)
+        self.assertEqual(sitemap.complete, False)
+        self.assertEqual(sitemap.errors, ['http://local/sitemap-old.xml'])
+
+    def test_gunzip_stream(self):
+        content = 'abc' * 100000
+        stream = sitemaps.GunzipStream(StringIO(gzip_content(content)))
+        self.assertEqual(stream.read(10), content[:10])
+        self.assertEqual(stream.read(), content[10:])
+        self.assertEqual(stream.read(10), '')
+
+    def test_crawl_sitemap(self):
+        spider = create_spider(
+            sitemap_url='http://local/sitemap.xml', sitemap_changed_only=True,
+            target_links=['//nothing'], expand_links=['//nothing'],
+            crawl_depth=1)
+        spider._set_extractor()
+        data = spider.crawl_content()
+        self.assertEqual(len(data.content), 3)
+        for p in data.extras['path']:
+            rmtree(p)
+        checked = models.Spider.objects.get(pk=spider.pk).sitemap_checked
+        self.assertIsNotNone(checked)
+        # Next crawl only takes the changed pages
+        spider.sitemap_checked = datetime(2015, 10, 10, tzinfo=timezone.utc)
+        data = spider.crawl_content()
+        self.assertEqual(len(data.content), 2)
+        for p in data.extras['path']:
+            rmtree(p)
+
+    def test_crawl_sitemap_failed(self):
+        spider = create_spider(
+            sitemap_url='http://local/not-exist.xml',
+            sitemap_changed_only=True, target_links=['//nothing'],
+            expand_links=['//nothing'], crawl_depth=1)
+        spider._set_extractor()
+        spider.crawl_content()
+        # Changes since last check would be lost otherwise
+        spider = models.Spider.objects.get(pk=spider.pk)
+        self.assertIsNone(spider.sitemap_checked)
+
+
+class URLTemplateTests(TestCase):
+
+    def test_iter_values(self):
+        values = list(utils.iter_values(['1-3, 7', 'news', 'new-york', 5]))
+        self.assertEqual(values, [1, 2, 3, 7, 'news', 'new-york', 5])
+        self.assertEqual(list(utils.iter_values('2-3')), [2, 3])
+
+    def test_lazy(self):
+        urls = utils.URLTemplate('http://local/page-{0}', ['1-1000000000'])
+        self.assertEqual(next(urls), 'http://local/page-1')
+        self.assertEqual(next(urls), 'http://local/page-2')
+
+    def test_same_as_generate_urls(self):
+        base = 'http://domain/class-{0}/?name={1}'
+        elements = (('1-2', 5), ('jane', 'john'))
+        self.assertEqual(list(utils.URLTemplate(base, elements)),
+                         list(utils.generate_urls(base, elements)))
+        self.assertEqual(list(utils.URLTemplate('http://local/')),
+                         ['http://local/'])
+
+    def test_stop_early(self):
+        urls = utils.URLTemplate('http://local/{0}/page-{1}',
+                                 [['a', 'b'], '1-100'], max_misses=2)
+        generated = []
+        for url in urls:
+            generated.append(url)
+            page = int(url.rsplit('-', 1)[1])
+            urls.report(url, page <= 3)
+        self.assertEqual(len(generated), 10)
+        self.assertEqual(generated[-1], 'http://local/b/page-5')
+
+    def test_crawl_template(self):
+        loader = extractor.custom_loader
+        extractor.custom_loader = LocalLoader()
+        seed_batch = models.SEED_BATCH
+        models.SEED_BATCH = 3
+        spider = create_spider(
+            seed_template=DATA_URL+'yc.a{0}.html', seed_values=['0-99'],
+            seed_stop_after=2, target_links=['//nothing'],
+            expand_links=['//nothing'], crawl_depth=1)
+        spider._set_extractor()
+        try:
+            data = spider.crawl_content()
+        finally:
+            extractor.custom_loader = loader
+            models.SEED_BATCH = seed_batch
+        found = [v for v in data.content.values() if v['content']['post']]
+        self.assertEqual(len(found), 3)
+        self.assertLess(len(data.content), 10)
+        for p in data.extras['path']:
+            rmtree(p)
+
+    def test_unreported_urls(self):
+        spider = create_spider(seed_template='http://local/p{0}',
+                               seed_values=['0-3'], seed_stop_after=5)
+        spider.depths = {'target': {'http://local/p0': 1}, 'expand': {}}
+        spider.crawl_links = {'target': [], 'expand': []}
+        spider.seeds = spider.get_seeds()
+        seed = spider.seeds[0]
+        spider.pull_seeds()
+        # Known URL is not crawled again
+        self.assertEqual(sorted(spider.crawl_links['target']),
+                         ['http://local/p1', 'http://local/p2',
+                          'http://local/p3'])
+        self.assertNotIn('http://local/p0', seed._pending)
+        # Pages failed in pipeline are missed
+        list(spider._process_pipeline(FailingPipeline()))
+        self.assertEqual(seed.misses, 3)
+        self.assertEqual(seed._pending, {})
+
+
+class FailingPipeline(object):
+
+    def process(self, tasks):
+        return [(kind, url, None) for kind, url in tasks]
+
+
+class SlowLoader(LocalLoader):
+
+    def get_source(self, url, headers=None, proxies=None):
+        time.sleep(0.4)
+        return super(SlowLoader, self).get_source(url, headers, proxies)
+
+
+class BudgetTests(TestCase):
+
+    def setUp(self):
+        self.loader = extractor.custom_loader
+        extractor.custom_loader = LocalLoader()
+
+    def tearDown(self):
+        extractor.custom_loader = self.loader
+
+    def crawl(self, **kwargs):
+        spider = create_spider(**kwargs)
+        spider._set_extractor()
+        data = spider.crawl_content()
+        for p in data.extras['path']:
+            rmtree(p)
+        return data
+
+    def test_unlimited(self):
+        data = self.crawl()
+        self.assertEqual(len(data.content), 5)
+        self.assertNotIn('stopped', data.extras)
+
+    def test_max_pages(self):
+        data = self.crawl(max_pages=3)
+        self.assertLess(len(data.content), 5)
+        self.assertEqual(data.extras['stopped'], 'max_pages (3) reached')
+
+    def test_max_bytes(self):
+        data = self.crawl(max_bytes=1)
+        self.assertLessEqual(len(data.content), 1)
+        self.assertEqual(data.extras['stopped'], 'max_bytes (1) reached')
+
+    def test_max_duration(self):
+        extractor.custom_loader = SlowLoader()
+        data = self.crawl(max_duration=1)
+        self.assertLess(len(data.content), 5)
+        self.assertEqual(data.extras['stopped'], 'max_duration (1) reached')
+
+    def test_operate_stopped(self):
+        spider = create_spider(max_pages=2)
+        result = spider.operate([{'action': 'crawl', 'target': 'content'}])
+        self.assertIn('stopped', result.data['results'][0]['extras'])
+        self.assertGreater(result.other.pk, 0)
+        rmtree(join(storage.base_location, result.other.local_path))
+
+    def test_distributed(self):
+        spider = create_spider(max_pages=2)
+        result = spider.operate([{'action': 'crawl',
+                                  'target': 'distributed'}])
+        datum = result.data['results'][0]
+        self.assertEqual(datum['extras']['stopped'], 'max_pages (2) reached')
+        self.assertLess(len(datum['content']), 5)
+        self.assertEqual(models.QueueItem.objects.count(), 0)
+        rmtree(join(storage.base_location, result.other.local_path))
+
+
+def site_pages(url, count):
+    """ Pages of a site with start page linking to given number of pages """
+    link = '<div class="post-title"><h2><a href="{0}p{1}">P</a></h2></div>'
+    links = ''.join(link.format(url, i) for i in range(count))
+    pages = {url: '<html><body>{0}</body></html>'.format(links)}
+    for i in range(count):
+        pages['{0}p{1}'.format(url, i)] = \
+            '<html><div class="post-body">Page {0}</div></html>'.format(i)
+    return pages
+
+
+class CrawlContextTests(TestCase):
+
+    def setUp(self):
+        self.loader = extractor.custom_loader
+        pages = site_pages('http://small/', 2)
+        pages.update(site_pages('http://big/', 12))
+        extractor.custom_loader = DictLoader(pages)
+        self.ua = models.UserAgent.objects.create(name='UA', value='Agent')
+        self.proxy = models.ProxyServer.objects.create(
+            name='Proxy', address='127.0.0.1', port=8080, protocol='http')
+
+    def tearDown(self):
+        extractor.custom_loader = self.loader
+
+    def count_queries(self, url, pages):
+        spider = create_spider(url=url, user_agent=self.ua, proxy=self.proxy,
+                               expand_links=[])
+        spider = models.Spider.objects.get(pk=spider.pk)
+        with CaptureQueriesContext(connection) as context:
+            result = spider.operate(
+                [{'action': 'crawl', 'target': 'content'}])
+        self.assertEqual(len(result.data['results'][0]['content']), pages)
+        result.delete()
+        return len(context.captured_queries)
+
+    def test_constant_queries(self):
+        self.assertEqual(self.count_queries('http://small/', 2),
+                         self.count_queries('http://big/', 12))
+
+    def test_context(self):
+        spider = create_spider(user_agent=self.ua, proxy=self.proxy)
+        context = spider.get_context()
+        self.assertIs(spider.get_context(), context)
+        self.assertEqual(context.user_agent, 'Agent')
+        self.assertEqual(context.proxies, self.proxy.get_dict())
+        self.assertEqual(context.plan['selectors']['post'][1], 'html')
+        self.assertRaises(AttributeError, setattr, context, 'plan', {})
+        with self.assertNumQueries(0):
+            self.assertEqual(spider.get_ua(), 'Agent')
+            plan = spider.get_plan()
+        plan['selectors'] = {}
+        self.assertNotEqual(spider.get_plan()['selectors'], {})
+
+
+class DirectWriteTests(TestCase):
+
+    def setUp(self):
+        self.loader = extractor.custom_loader
+        extractor.custom_loader = LocalLoader()
+        self.options = (models.DIRECT_WRITE, models.COMPRESS_RESULT)
+        models.DIRECT_WRITE = True
+        models.COMPRESS_RESULT = False
+        self.spider = create_spider()
+
+    def tearDown(self):
+        extractor.custom_loader = self.loader
+        models.DIRECT_WRITE, models.COMPRESS_RESULT = self.options
+
+    def crawl(self, workers=0):
+        operations = [{'action': 'crawl', 'target': 'content',
+                       'workers': workers}]
+        return self.spider.operate(operations)
+
+    def check_storage(self, result):
+        paths = result.data['results'][0]['extras']['path']
+        self.assertEqual(len(paths), 5)
+        temp_dir = join(config.TEMP_DIR, self.spider.storage_location)
+        for path in paths:
+            self.assertTrue(path.startswith(result.other.local_path))
+            self.assertTrue(storage.exists(join(path, 'index.json')))
+            self.assertFalse(os.path.exists(
+                join(temp_dir, os.path.basename(path))))
+        self.assertTrue(storage.exists(
+            join(result.other.local_path, 'index.json')))
+        rmtree(storage.path(result.other.local_path))
+
+    def test_storage(self):
+        self.check_storage(self.crawl())
+
+    def test_storage_pipeline(self):
+        self.check_storage(self.crawl(workers=2))
+
+    def test_archive(self):
+        models.COMPRESS_RESULT = True
+        result = self.crawl()
+        zfile = ZipFile(storage.path(result.other.local_path), 'r')
+        names = zfile.namelist()
+        self.assertIn('index.json', names)
+        self.assertEqual(
+            len([_ for _ in names if _.endswith('/index.json')]), 5)
+        os.remove(storage.path(result.other.local_path))
+
+    def test_archive_discarded(self):
+        models.COMPRESS_RESULT = True
+        result = self.spider.operate([{'action': 'get', 'target': 'links'}])
+        self.assertIsNone(result.other)
+        self.assertFalse(os.path.exists(
+            self.spider.writer.archive.file_path))
+
+
+class ResultItemTests(TestCase):
+
+    def setUp(self):
+        self.loader = extractor.custom_loader
+        extractor.custom_loader = LocalLoader()
+        self.result_items = models.RESULT_ITEMS
+        models.RESULT_ITEMS = True
+        self.spider = create_spider()
+
+    def tearDown(self):
+        extractor.custom_loader = self.loader
+        models.RESULT_ITEMS = self.result_items
+
+    def check_result(self, result):
+        datum = result.data['results'][0]
+        self.assertEqual(datum['content'], {})
+        self.assertEqual(datum['extras']['items'], 5)
+        self.assertEqual(result.items.count(), 5)
+        self.assertEqual(result.spider_id, self.spider.pk)
+        content = result.get_data(clean=True, stream=True)
+        self.assertNotIsInstance(content, list)
+        content = list(content)
+        self.assertEqual(len(content), 5)
+        self.assertIn('post', content[0])
+        rmtree(join(storage.base_location, result.other.local_path))
+
+    def test_operate(self):
+        result = self.spider.operate(
+            [{'action': 'crawl', 'target': 'content'}])
+        self.check_result(result)
+
+    def test_operate_distributed(self):
+        result = self.spider.operate(
+            [{'action': 'crawl', 'target': 'distributed'}])
+        self.check_result(result)
+
+    def test_operate_twice(self):
+        result = self.spider.operate(
+            [{'action': 'crawl', 'target': 'content'},
+             {'action': 'crawl', 'target': 'content'}])
+        self.assertEqual(result.items.filter(operation=0).count(), 5)
+        self.assertEqual(result.items.filter(operation=1).count(), 5)
+        pages = list(result.iter_pages())
+        self.assertEqual(len(pages), 10)
+        self.assertEqual(len(set(page['url'] for page in pages)), 5)
+        rmtree(join(storage.base_location, result.other.local_path))
+
+    def operate(self, operations, task_id):
+        spider = models.Spider.objects.get(pk=self.spider.pk)
+        return spider.operate(operations, task_id=task_id)
+
+    def test_task_run_again(self):
+        operations = [{'action': 'crawl', 'target': 'content'}]
+        first = self.operate(operations, 'task')
+        # Interrupted run doesn't touch the result of the task
+        self.assertRaises(AttributeError, self.operate,
+                          [{'action': 'crawl', 'target': 'missing'}], 'task')
+        self.assertEqual(models.Result.objects.get(task_id='task'), first)
+        self.assertTrue(exists(first.other.local_path))
+        second = self.operate(operations, 'task')
+        self.assertEqual(models.Result.objects.get(task_id='task'), second)
+        self.assertFalse(models.Result.objects.filter(pk=first.pk).exists())
+        self.assertFalse(exists(first.other.local_path))
+        self.check_result(second)
+
+    def test_batches(self):
+        result = models.create_result({})
+        crawled = models.CrawledPages(result, batch_size=2)
+        for i in range(3):
+            crawled.add(str(i), 'http://local/{0}'.format(i), {}, '')
+        self.assertEqual(result.items.count(), 2)
+        datum = crawled.get_datum()
+        self.assertEqual(result.items.count(), 3)
+        self.assertEqual(datum.extras['items'], 3)
+        self.assertEqual(datum.content, {})
+
+    def test_in_memory(self):
+        crawled = models.CrawledPages()
+        crawled.add('a0', 'http://local/a0', {'post': []}, 'path-a0')
+        datum = crawled.get_datum('max_pages (1) reached')
+        self.assertEqual(datum.content['a0']['url'], 'http://local/a0')
+        self.assertEqual(datum.extras['path'], ['path-a0'])
+        self.assertNotIn('items', datum.extras)
+        self.assertEqual(models.ResultItem.objects.count(), 0)
+
+
+class StreamIndexTests(TestCase):
+
+    def setUp(self):
+        self.loader = extractor.custom_loader
+        extractor.custom_loader = LocalLoader()
+        self.options = (models.STREAM_INDEX, models.COMPRESS_RESULT)
+        models.STREAM_INDEX = True
+        models.COMPRESS_RESULT = False
+        self.spider = create_spider()
+
+    def tearDown(self):
+        extractor.custom_loader = self.loader
+        models.STREAM_INDEX, models.COMPRESS_RESULT = self.options
+
+    def test_crawl_content(self):
+        self.spider._set_extractor()
+        data = self.spider.crawl_content()
+        self.assertEqual(data.content, {})
+        with open(data.extras['index']) as index:
+            lines = index.readlines()
+        self.assertEqual(len(lines), 5)
+        page = json.loads(lines[0])
+        self.assertIn(page['path'], data.extras['path'])
+        self.assertIn('post', page['content'])
+        os.remove(data.extras['index'])
+        for p in data.extras['path']:
+            rmtree(p)
+
+    def check_result(self, result):
+        index_path = result.data['results'][0]['extras']['index']
+        self.assertFalse(os.path.exists(index_path))
+        content = result.get_data(clean=True)
+        self.assertEqual(len(content), 5)
+        self.assertIn('post', content[0])
+
+    def test_operate(self):
+        result = self.spider.operate(
+            [{'action': 'crawl', 'target': 'content'}])
+        self.assertTrue(storage.exists(
+            join(result.other.local_path, config.INDEX_JSONL)))
+        self.check_result(result)
+        rmtree(storage.path(result.other.local_path))
+
+    def test_operate_zip(self):
+        models.COMPRESS_RESULT = True
+        result = self.spider.operate(
+            [{'action': 'crawl', 'target': 'content'}])
+        zfile = ZipFile(storage.path(result.other.local_path), 'r')
+        self.assertIn(config.INDEX_JSONL, zfile.namelist())
+        self.check_result(result)
+        os.remove(storage.path(result.other.local_path))
+
+    def test_operate_twice(self):
+        models.COMPRESS_RESULT = True
+        result = self.spider.operate(
+            [{'action': 'crawl', 'target': 'content'},
+             {'action': 'crawl', 'target': 'content'}])
+        paths = [_['extras']['index'] for _ in result.data['results']]
+        self.assertNotEqual(paths[0], paths[1])
+        zfile = ZipFile(storage.path(result.other.local_path), 'r')
+        self.assertIn(config.INDEX_JSONL, zfile.namelist())
+        self.assertIn(models.get_index_name(1), zfile.namelist())
+        self.assertEqual(len(list(result.iter_index(operation=1))), 5)
+        self.assertEqual(len(result.get_data(clean=True)), 10)
+        os.remove(storage.path(result.other.local_path))
+
+    def test_iter_index_missing(self):
+        result = models.create_result({})
+        self.assertEqual(list(result.iter_index(None)), [])
+
+
+class SerializerTests(TestCase):
+    data = {'content': {'post': [u'Xin ch\xe0o']}, 'url': 'http://local/'}
+
+    def test_round_trip(self):
+        for name in serializers.available_serializers():
+            serializer = serializers.get_serializer(name)
+            output = serializer.dumps(self.data)
+            self.assertEqual(serializer.loads(output), self.data)
+
+    def test_default(self):
+        serializer = serializers.get_serializer()
+        self.assertEqual(serializer.name, config.SERIALIZER)
+        self.assertEqual(serializer.index_name, 'index.json')
+        self.assertNotIn(' ', serializer.dumps({'a': [1, 2]}))
+
+    def test_unknown(self):
+        serializer = serializers.get_serializer('unknown')
+        self.assertEqual(serializer.name, 'json')
+
+    def test_line_serializer(self):
+        self.assertEqual(
+            serializers.get_line_serializer('pretty').name, 'json')
+        self.assertEqual(
+            serializers.get_line_serializer('json').name, 'json')
+
+    def test_serialized_once(self):
+        data = utils.Data(url='http://local/')
+        data.add_result(utils.Datum(self.data['content']))
+        self.assertIs(data.json, data.json)
+        datum = utils.Datum(self.data['content'], action='get')
+        self.assertIs(datum.json, datum.json)
+        self.assertEqual(json.loads(datum.json)['extras']['action'], 'get')
+
+    def test_result_serialize(self):
+        result = models.create_result(self.data)
+        self.assertEqual(json.loads(result.serialize('pretty')), self.data)
+
+
+class SignalTests(TestCase):
+
+    def setUp(self):
+        self.loader = extractor.custom_loader
+        extractor.custom_loader = LocalLoader()
+        self.spider = create_spider()
+        self.spider._set_extractor()
+        self.received = []
+
+    def tearDown(self):
+        extractor.custom_loader = self.loader
+
+    def receive(self, sender, **kwargs):
+        self.received.append(kwargs)
+
+    def test_post_scrape_lazy(self):
+        data = self.spider._perform(action='get', target='links')
+        self.assertNotIn('json', data.__dict__)
+        self.assertNotIn('json', data.dict)
+        signals.post_scrape.connect(self.receive)
+        try:
+            data = self.spider._perform(action='get', target='links')
+        finally:
+            signals.post_scrape.disconnect(self.receive)
+        self.assertIs(self.received[0]['datum'], data)
+        self.assertNotIn('json', data.__dict__)
+        payload = self.received[0]['datum'].json
+        self.assertEqual(json.loads(payload)['extras']['action'], 'get')
+
+    def test_post_page(self):
+        signals.post_page.connect(self.receive)
+        try:
+            data = self.spider.crawl_content()
+        finally:
+            signals.post_page.disconnect(self.receive)
+        self.assertEqual(len(self.received), 5)
+        self.assertEqual(set(_['uuid'] for _ in self.received),
+                         set(data.content.keys()))
+        self.assertIs(self.received[0]['spider'], self.spider)
+        self.assertIn('post', self.received[0]['content'])
+        for p in data.extras['path']:
+            rmtree(p)
+
+
+class TimingTests(TestCase):
+
+    def setUp(self):
+        self.loader = extractor.custom_loader
+        extractor.custom_loader = LocalLoader()
+        self.spider = create_spider()
+        self.received = []
+
+    def tearDown(self):
+        extractor.custom_loader = self.loader
+
+    def receive(self, sender, **kwargs):
+        self.received.append(kwargs)
+
+    def test_histograms(self):
+        timings = timing.Timings()
+        timings.add('xpath', 0.0005)
+        timings.add('xpath', 0.02)
+        other = timing.Timings()
+        other.add('xpath', 100)
+        other.add('get_source', 0.3)
+        timings.merge(other.dict)
+        phases = timings.dict['phases']
+        self.assertEqual(phases['xpath']['count'], 3)
+        self.assertEqual(phases['xpath']['max'], 100)
+        self.assertEqual(phases['xpath']['buckets'],
+                         [1, 0, 0, 1, 0, 0, 0, 0, 0, 0, 1])
+        self.assertEqual(phases['get_source']['buckets'][5], 1)
+
+    def check_timings(self, workers):
+        signals.crawl_timings.connect(self.receive)
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                result = self.spider.operate(
+                    [{'action': 'crawl', 'target': 'content',
+                      'workers': workers}])
+        finally:
+            signals.crawl_timings.disconnect(self.receive)
+        # Result is written once, with its timings
+        writes = [_ for _ in queries.captured_queries
+                  if 'INSERT INTO "scraper_result"' in _['sql'] or
+                  'UPDATE "scraper_result"' in _['sql']]
+        self.assertEqual(len(writes), 1)
+        phases = result.data['timings']['phases']
+        for name in ('get_source', 'parse_content', 'xpath', 'get_content',
+                     'finalize'):
+            self.assertGreater(phases[name]['count'], 0)
+            self.assertEqual(sum(phases[name]['buckets']),
+                             phases[name]['count'])
+        self.assertEqual(models.Result.objects.get(
+            pk=result.pk).data['timings'], result.data['timings'])
+        # Writing the result is only in timings sent by the signal
+        self.assertNotIn('create_result', phases)
+        self.assertEqual(len(self.received), 1)
+        phases = self.received[0]['timings']['phases']
+        self.assertEqual(phases['create_result']['count'], 1)
+        self.assertEqual(phases['finalize'],
+                         result.data['timings']['phases']['finalize'])
+        result.delete()
+
+    def test_serial(self):
+        self.check_timings(0)
+
+    def test_pipeline(self):
+        self.check_timings(2)
+
+
+class SnapshotTests(TestCase):
+    root = 'test-snapshots'
+
+    def setUp(self):
+        self.loader = extractor.custom_loader
+        extractor.custom_loader = LocalLoader()
+        self.store = snapshots._store
+        snapshots._store = snapshots.SnapshotStore(root=self.root)
+        self.spider = create_spider()
+
+    def tearDown(self):
+        extractor.custom_loader = self.loader
+        snapshots._store = self.store
+        if os.path.exists(self.root):
+            rmtree(self.root)
+
+    def count_blobs(self):
+        return sum(len(files) for path, dirs, files in os.walk(self.root))
+
+    def test_store(self):
+        store = snapshots.get_store()
+        content = open(get_path('yc.a0.html')).read()
+        digest = store.put(content)
+        self.assertEqual(store.put(content), digest)
+        self.assertEqual(self.count_blobs(), 1)
+        path = store.find(digest)
+        self.assertEqual(path, os.path.join(
+            self.root, digest[:2], digest[2:4], digest + '.zz'))
+        self.assertLess(store.get_size(digest), len(content))
+        self.assertEqual(store.get(digest), content)
+        store.delete(digest)
+        self.assertIsNone(store.get(digest))
+
+    def test_unknown_compression(self):
+        store = snapshots.SnapshotStore(root=self.root, compression='none')
+        self.assertEqual(store.compression, 'zlib')
+
+    def test_get_page(self):
+        result = self.spider.operate([{'action': 'get', 'target': 'page'}])
+        datum = result.data['results'][0]
+        self.assertEqual(datum['content'], '')
+        snapshot = result.other.snapshots.get()
+        self.assertEqual(snapshot.digest, datum['extras']['snapshot'])
+        self.assertEqual(snapshot.get_content(),
+                         open(get_path('yc.0.html')).read().strip())
+        result.delete()
+        self.assertEqual(models.Snapshot.objects.count(), 0)
+
+    def test_crawl_twice(self):
+        operations = [{'action': 'crawl', 'target': 'content'}]
+        first = self.spider.operate(operations)
+        count = models.Snapshot.objects.count()
+        blobs = self.count_blobs()
+        self.assertGreater(count, 0)
+        self.assertEqual(blobs, count)
+        second = self.spider.operate(operations)
+        # Nothing changed, so nothing added
+        self.assertEqual(models.Snapshot.objects.count(), count)
+        self.assertEqual(self.count_blobs(), blobs)
+        refs = models.SnapshotRef.objects.count()
+        for snapshot in models.Snapshot.objects.all():
+            self.assertEqual(snapshot.refs, snapshot.snapshot_refs.count())
+            self.assertEqual(snapshot.local_contents.distinct().count(), 2)
+        first.delete()
+        self.assertEqual(models.SnapshotRef.objects.count(), refs / 2)
+        for snapshot in models.Snapshot.objects.all():
+            self.assertEqual(snapshot.refs, snapshot.snapshot_refs.count())
+        second.delete()
+        self.assertEqual(models.Snapshot.objects.count(), 0)
+        self.assertEqual(self.count_blobs(), 0)
+
+
+class CountingLoader(LocalLoader):
+
+    def __init__(self):
+        self.urls = []
+
+    def get_source(self, url, headers=None, proxies=None):
+        self.urls.append(url)
+        return super(CountingLoader, self).get_source(url, headers, proxies)
+
+
+class OfflineLoader(CountingLoader):
+    """ Fails on any download, pages and files """
+
+    def get_source(self, url, headers=None, proxies=None):
+        self.urls.append(url)
+        raise AssertionError('Downloading {0}'.format(url))
+
+    def get_file(self, url, headers=None, proxies=None):
+        return self.get_source(url, headers, proxies)
+
+
+class RemoteWorker(CountingLoader):
+    """ Acts as a worker on another host: leases a link of the crawl at the
+    first download, then queues a new link while the coordinator waits """
+    late_url = 'http://local/late.html'
+
+    def __init__(self):
+        super(RemoteWorker, self).__init__()
+        self.item = None
+
+    def get_source(self, url, headers=None, proxies=None):
+        crawl_items = models.QueueItem.objects.all()
+        if self.item is None and crawl_items:
+            crawl_item = crawl_items[0]
+            self.item = models.QueueItem.objects.create(
+                spider=crawl_item.spider, crawl_id=crawl_item.crawl_id,
+                url='http://local/remote.html', kind='expand', depth=1,
+                state=config.QUEUE_LEASED, worker='remote',
+                lease_expires=timezone.now() + timedelta(hours=1))
+        return super(RemoteWorker, self).get_source(url, headers, proxies)
+
+    def sleep(self, seconds):
+        if self.item.state == config.QUEUE_LEASED:
+            models.QueueItem.objects.enqueue(
+                self.item.spider, self.item.crawl_id,
+                {'target': [self.late_url]}, 2)
+            self.item.complete()
+            self.item.state = config.QUEUE_DONE
+
+    def time(self):
+        return time.time()
+
+
+class DistributedBudgetTests(TestCase):
+
+    def setUp(self):
+        self.loader = extractor.custom_loader
+        extractor.custom_loader = RemoteWorker()
+
+    def tearDown(self):
+        extractor.custom_loader = self.loader
+        models.time = time
+
+    def test_late_links_cancelled(self):
+        # Links queued by other workers after the budget is exceeded are
+        # never crawled
+        spider = create_spider(max_pages=1)
+        models.time = extractor.custom_loader
+        result = spider.operate([{'action': 'crawl',
+                                  'target': 'distributed'}])
+        datum = result.data['results'][0]
+        self.assertEqual(datum['extras']['stopped'], 'max_pages (1) reached')
+        self.assertNotIn(RemoteWorker.late_url, extractor.custom_loader.urls)
+        self.assertEqual(models.QueueItem.objects.count(), 0)
+        rmtree(join(storage.base_location, result.other.local_path))
+
+
+class ReextractTests(TestCase):
+    root = 'test-snapshots'
+    pages_dir = 'test-saved-pages'
+
+    def setUp(self):
+        self.loader = extractor.custom_loader
+        extractor.custom_loader = LocalLoader()
+        self.store = snapshots._store
+        snapshots._store = snapshots.SnapshotStore(root=self.root)
+        self.spider = create_spider()
+        os.makedirs(self.pages_dir)
+        for name in ('yc.a0.html', 'yc.a1.html', 'yc.a2.html'):
+            with open(os.path.join(self.pages_dir, name), 'w') as page:
+                page.write(open(get_path(name)).read())
+
+    def tearDown(self):
+        extractor.custom_loader = self.loader
+        snapshots._store = self.store
+        for path in (self.root, self.pages_dir):
+            if os.path.exists(path):
+                rmtree(path)
+
+    def add_selector(self):
+        selector = models.Selector(
+            key='title', xpath="//div[@class='post-title']//text()",
+            data_type='text')
+        selector.save()
+        self.spider.collectors.first().selectors.add(selector)
+
+    def reextract(self, **kwargs):
+        loader = extractor.custom_loader = CountingLoader()
+        operation = {'action': 'reextract', 'target': 'content'}
+        operation.update(kwargs)
+        spider = models.Spider.objects.get(pk=self.spider.pk)
+        result = spider.operate([operation])
+        self.assertEqual(loader.urls, [])
+        return result
+
+    def check_snapshots(self, workers):
+        first = self.spider.operate(
+            [{'action': 'crawl', 'target': 'content'}])
+        self.add_selector()
+        result = self.reextract(result=first.pk, workers=workers)
+        content = result.data['results'][0]['content']
+        self.assertEqual(len(content), 5)
+        titles = [v['content']['title'] for v in content.values()
+                  if v['content']['post']]
+        self.assertEqual(len(titles), 3)
+        self.assertTrue(all(titles))
+        self.assertEqual(result.data['stats']['pages'], 5)
+        # Both unavailable pages have the same (empty) snapshot
+        self.assertEqual(models.Snapshot.objects.count(), 4)
+        for snapshot in models.Snapshot.objects.all():
+            self.assertEqual(snapshot.refs, snapshot.snapshot_refs.count())
+        self.assertEqual(models.SnapshotRef.objects.count(), 10)
+        first.delete()
+        result.delete()
+
+    def test_snapshots(self):
+        self.check_snapshots(0)
+
+    def test_snapshots_parallel(self):
+        self.check_snapshots(2)
+
+    def test_binary_selector(self):
+        selector = models.Selector.objects.create(
+            key='logo', xpath='(//img)[1]/@src', data_type='binary')
+        self.spider.collectors.first().selectors.add(selector)
+        loader = extractor.custom_loader = OfflineLoader()
+        result = self.spider.operate([
+            {'action': 'reextract', 'target': 'content',
+             'directory': self.pages_dir, 'workers': 0}])
+        self.assertEqual(loader.urls, [])
+        self.assertEqual(result.data['stats']['pages'], 3)
+        self.assertEqual(result.data['stats']['errors'], 0)
+        result.delete()
+
+    def test_directory(self):
+        self.add_selector()
+        result = self.reextract(directory=self.pages_dir, workers=2)
+        content = result.data['results'][0]['content']
+        self.assertEqual(len(content), 3)
+        for value in content.values():
+            self.assertTrue(value['url'].startswith('file://'))
+            self.assertTrue(value['content']['title'])
+        result.delete()
+
+    def test_command(self):
+        out = StringIO()
+        call_command('reextract', str(self.spider.pk),
+                     directory=self.pages_dir, workers=0, stdout=out)
+        self.assertIn('3 page(s), 0 error(s)', out.getvalue())
+        self.assertEqual(models.Result.objects.count(), 1)
+        models.Result.objects.get().delete()
+
+    def test_command_no_source(self):
+        self.assertRaises(CommandError, call_command, 'reextract',
+                          str(self.spider.pk))
+
+
+def crawl_data(url, pages):
+    """ Result data of a crawl with given pages, as {url: content} """
+    content = dict((str(i), {'url': key, 'content': pages[key]})
+                   for i, key in enumerate(sorted(pages)))
+    return {'url': url, 'results': [
+        {'content': content, 'extras': {'action': 'crawl'}}]}
+
+
+class LookupTests(TestCase):
+
+    def test_unique_task_id(self):
+        first = models.create_result({})
+        second = models.create_result({})
+        self.assertNotEqual(first.task_id, second.task_id)
+        empty = models.create_result({}, task_id='')
+        self.assertTrue(empty.task_id)
+        self.assertRaises(IntegrityError, models.Result.objects.create,
+                          task_id=first.task_id, data={})
+
+    def test_task_run_again(self):
+        local = models.LocalContent.objects.create(url='http://local')
+        old = models.create_result({'run': 1}, task_id='task',
+                                   local_content=local)
+        new = models.create_result({'run': 2}, task_id='task')
+        self.assertEqual(list(models.Result.objects.all()), [new])
+        self.assertFalse(models.Result.objects.filter(pk=old.pk).exists())
+        self.assertEqual(models.LocalContent.objects.count(), 0)
+
+    def test_latest_local_content(self):
+        old = models.LocalContent.objects.create(
+            url='http://local', local_path='old',
+            created_time=datetime(2015, 1, 1))
+        models.LocalContent.objects.create(
+            url='http://local', local_path='', state=1)
+        self.assertEqual(
+            models.LocalContent.objects.latest_for_url('http://local'), old)
+        new = models.LocalContent.objects.create(
+            url='http://local', local_path='new')
+        self.assertEqual(
+            models.LocalContent.objects.latest_for_url('http://local'), new)
+        self.assertIsNone(
+            models.LocalContent.objects.latest_for_url('http://other'))
+
+    def test_snapshot_lookups(self):
+        first = models.LocalContent.objects.create(url='http://local')
+        second = models.LocalContent.objects.create(url='http://local')
+        old = models.Snapshot.objects.create(digest='old')
+        new = models.Snapshot.objects.create(digest='new')
+        for local, snapshot, url in ((first, old, 'http://local/a'),
+                                     (second, new, 'http://local/a'),
+                                     (second, old, 'http://local/b')):
+            models.SnapshotRef.objects.create(
+                local_content=local, snapshot=snapshot, url=url)
+        Snapshot = models.Snapshot.objects
+        self.assertEqual(Snapshot.latest_for_url('http://local/a'), new)
+        self.assertEqual(Snapshot.latest_for_url('http://local/b'), old)
+        self.assertIsNone(Snapshot.latest_for_url('http://local/c'))
+        urls = ['http://local/{0}'.format(_) for _ in 'abcd']
+        with self.assertNumQueries(2):
+            known = Snapshot.known_urls(urls, batch_size=2)
+        self.assertEqual(known, set(['http://local/a', 'http://local/b']))
+
+
+class AdminTests(TestCase):
+
+    def setUp(self):
+        self.admin = admin.ResultAdmin(models.Result, site)
+        self.request = RequestFactory().get('/')
+        self.inline = models.create_result(crawl_data('http://local', dict(
+            ('http://local/{0}'.format(i), {'title': str(i)})
+            for i in range(5))))
+        self.items = models.create_result({'results': []})
+        for i in range(5):
+            models.ResultItem.objects.create(
+                result=self.items, uuid=str(i),
+                url='http://items/{0}'.format(i), content={'title': str(i)})
+
+    def test_deferred_data(self):
+        queryset = self.admin.get_queryset(self.request)
+        self.assertIn('data', queryset.query.deferred_loading[0])
+        self.assertEqual(queryset.count(), 2)
+
+    def test_get_pages(self):
+        pages = self.items.get_pages(3, 5)
+        self.assertEqual([_['url'] for _ in pages],
+                         ['http://items/3', 'http://items/4'])
+        self.assertEqual(pages[0]['content'], {'title': '3'})
+        self.assertEqual(len(self.inline.get_pages(1, 2)), 2)
+        self.assertEqual(self.inline.get_pages(5, 2), [])
+
+    def test_items_view(self):
+        models.ResultItem.objects.create(
+            result=self.items, uuid='5', url='javascript:alert(1)',
+            content={})
+        self.admin.items_per_page = 10
+        response = self.admin.items_view(self.request, str(self.items.pk))
+        links = [(_['url'], _['link']) for _ in response.context_data['items']]
+        self.assertEqual(links[0], ('http://items/0', True))
+        self.assertEqual(links[5], ('javascript:alert(1)', False))
+
+    def test_paginator(self):
+        queryset = models.Result.objects.all()
+        self.assertIsNone(admin.estimate_count(queryset))
+        paginator = admin.EstimatedCountPaginator(queryset, 1)
+        self.assertEqual(paginator.count, 2)
+        self.assertEqual(paginator.num_pages, 2)
+
+
+class PurgeTests(TestCase):
+    root = 'test-purge-snapshots'
+
+    def setUp(self):
+        self.store = snapshots._store
+        snapshots._store = snapshots.SnapshotStore(root=self.root)
+        self.shared = snapshots._store.put('shared page')
+        self.spider = create_spider(name='purge')
+        self.results = [self.create(i, datetime(2015, 1, 1 + i))
+                        for i in range(3)]
+        self.new = self.create(3, datetime.now())
+
+    def tearDown(self):
+        snapshots._store = self.store
+        for path in (self.root, join(storage.base_location, 'tests/purge')):
+            if os.path.exists(path):
+                rmtree(path)
+
+    def create(self, index, created_time):
+        location = 'tests/purge/{0}'.format(index)
+        for name in ('index.json', 'sub/image.jpg'):
+            utils.write_storage_file(storage, join(location, name), 'dummy')
+        local = models.LocalContent.objects.create(
+            url='http://local', local_path=location)
+        digest = snapshots._store.put('page {0}'.format(index))
+        models.Snapshot.objects.add_refs(local, [
+            ('http://local/a', digest), ('http://local/b', self.shared)])
+        result = models.create_result({}, spider=self.spider,
+                                      local_content=local)
+        result.created_time = created_time
+        result.save()
+        return result
+
+    def purge(self, **kwargs):
+        out = StringIO()
+        call_command('purge_results', stdout=out, **kwargs)
+        return out.getvalue()
+
+    def test_purge_old(self):
+        output = self.purge(days=30, chunk=2, workers=2)
+        self.assertIn('Deleted 3 result(s), 3 local content(s), 6 file(s) '
+                      'and 3 snapshot(s)', output)
+        self.assertEqual(list(models.Result.objects.all()), [self.new])
+        self.assertEqual(models.LocalContent.objects.count(), 1)
+        for result in self.results:
+            self.assertFalse(exists(result.other.local_path))
+        self.assertTrue(exists(self.new.other.local_path))
+        shared = models.Snapshot.objects.get(digest=self.shared)
+        self.assertEqual(shared.refs, 1)
+        self.assertEqual(models.Snapshot.objects.count(), 2)
+        self.assertIsNotNone(snapshots._store.find(self.shared))
+        self.assertIsNone(snapshots._store.find(
+            snapshots.SnapshotStore.get_digest('page 0')))
+
+    def test_chunk_delete(self):
+        models.ResultItem.objects.create(
+            result=self.results[0], uuid='i0', url='http://local/a',
+            content={})
+        # Result out of the purge which shares a purged local content
+        other = models.create_result({}, local_content=self.results[0].other)
+        with CaptureQueriesContext(connection) as queries:
+            self.purge(days=30)
+        # Data of results is not loaded, results referring to the contents
+        # are looked up after they are detached
+        self.assertFalse([_ for _ in queries.captured_queries
+                          if '"scraper_result"."data"' in _['sql'] and
+                          '"other_id" IN' not in _['sql']])
+        self.assertEqual(models.Result.objects.count(), 2)
+        self.assertEqual(models.ResultItem.objects.count(), 0)
+        self.assertIsNone(models.Result.objects.get(pk=other.pk).other)
+
+    def test_keep(self):
+        self.assertIn('2 result(s) would be deleted',
+                      self.purge(keep=2, dry_run=True))
+        self.assertEqual(models.Result.objects.count(), 4)
+        self.purge(keep=2)
+        self.assertEqual(
+            sorted(models.Result.objects.values_list('pk', flat=True)),
+            [self.results[2].pk, self.new.pk])
+
+    def test_single_delete(self):
+        # Deleting one result still cleans up through the receivers
+        path = self.new.other.local_path
+        self.new.delete()
+        self.assertFalse(exists(path))
+        self.assertEqual(models.LocalContent.objects.count(), 3)
+
+    def test_no_option(self):
+        self.assertRaises(CommandError, self.purge)
+
+    def test_claimed_while_purging(self):
+        # Another crawl refers to the shared page after its snapshot was
+        # released, the blob is kept
+        contents = [_.other_id for _ in self.results + [self.new]]
+        self.assertIn(self.shared,
+                      models.Snapshot.objects.release_many(contents))
+        local = models.LocalContent.objects.create(url='http://local')
+        models.Snapshot.objects.add_refs(
+            local, [('http://local/b', self.shared)])
+        self.assertEqual(
+            models.Snapshot.objects.delete_released([self.shared]), [])
+        self.assertEqual(models.Snapshot.objects.get(
+            digest=self.shared).refs, 1)
+        self.assertIsNotNone(snapshots._store.find(self.shared))
+
+    def test_missing_blob(self):
+        # Released and deleted by a purge after the page was stored
+        models.Snapshot.objects.filter(digest=self.shared).delete()
+        snapshots._store.delete(self.shared)
+        local = models.LocalContent.objects.create(url='http://local')
+        models.Snapshot.objects.add_refs(
+            local, [('http://local/b', self.shared)])
+        self.assertEqual(local.snapshot_refs.count(), 0)
+
+
+class ExportTests(TestCase):
+
+    def setUp(self):
+        self.spider = create_spider(name='export')
+        self.old = models.create_result(
+            crawl_data('http://old', {'http://old/a': {'title': u'Old \xe1'}}),
+            task_id='old', spider=self.spider)
+        self.old.created_time = datetime(2015, 1, 1)
+        self.old.save()
+        self.new = models.create_result(
+            crawl_data('http://new', {'http://new/a': {'title': 'A'},
+                                      'http://new/b': {'title': 'B',
+                                                       'tags': [1, 2]}}),
+            task_id='new')
+        items = models.create_result(
+            {'url': 'http://items', 'results': [
+                {'content': {}, 'extras': {'action': 'crawl', 'items': 1}}]},
+            task_id='items', spider=self.spider)
+        models.ResultItem.objects.create(
+            result=items, uuid='i0', url='http://items/0',
+            content={'title': 'Item'})
+
+    def export(self, *args, **kwargs):
+        out = StringIO()
+        call_command('export_results', *args, stdout=out, **kwargs)
+        return out.getvalue()
+
+    def test_jsonl(self):
+        lines = self.export(chunk=1).splitlines()
+        records = [json.loads(_) for _ in lines]
+        self.assertEqual(sorted(_['url'] for _ in records[1:3]),
+                         ['http://new/a', 'http://new/b'])
+        self.assertEqual(records[0]['url'], 'http://old/a')
+        self.assertEqual(records[3]['url'], 'http://items/0')
+        self.assertEqual(records[0]['task_id'], 'old')
+        self.assertEqual(records[0]['content'], {'title': u'Old \xe1'})
+        self.assertEqual(records[3]['content'], {'title': 'Item'})
+
+    def test_filters(self):
+        def tasks(**kwargs):
+            return [json.loads(_)['task_id']
+                    for _ in self.export(**kwargs).splitlines()]
+        self.assertEqual(tasks(spiders=['export']), ['old', 'items'])
+        self.assertEqual(tasks(spiders=[str(self.spider.pk)]),
+                         ['old', 'items'])
+        self.assertEqual(tasks(tasks=['new']), ['new', 'new'])
+        self.assertEqual(tasks(since='2016-01-01'), ['new', 'new', 'items'])
+        self.assertEqual(tasks(until='2015-06-01 10:00:00'), ['old'])
+        self.assertEqual(tasks(full=True), ['old', 'new', 'items'])
+        self.assertRaises(CommandError, self.export, since='yesterday')
+
+    def test_csv(self):
+        rows = list(csv.reader(StringIO(self.export(format='csv'))))
+        self.assertEqual(rows[0], ['result', 'task_id', 'url', 'title'])
+        self.assertEqual(rows[1][1:], ['old', 'http://old/a', 'Old \xc3\xa1'])
+        self.assertEqual(len(rows), 5)
+        rows = list(csv.reader(StringIO(
+            self.export(format='csv', tasks=['new'], fields='tags'))))
+        self.assertEqual(rows[0][-1], 'tags')
+        self.assertEqual(sorted(_[-1] for _ in rows[1:]), ['', '[1, 2]'])
+
+    def test_output_file(self):
+        path = 'test-export.jsonl'
+        try:
+            output = self.export(output=path, tasks=['new'])
+            self.assertIn('2 record(s) exported', output)
+            self.assertEqual(len(open(path).readlines()), 2)
+        finally:
+            os.remove(path)
+
+    def test_unknown_format(self):
+        self.assertRaises(CommandError, self.export, format='xml')
+
+
+class LocalResponse(object):
+
+    def __init__(self, content):
+        self.status_code = 200 if content is not None else 404
+        self.reason = 'OK' if content is not None else 'Not Found'
+        self.headers = {'Content-Type': 'text/html',
+                        'Content-Encoding': 'gzip'}
+        self.content = content or ''
+
+
+class LocalSession(LocalLoader):
+    """ HTTP session serving test_data files, refuses requests if offline """
+
+    def __init__(self, offline=False):
+        self.offline = offline
+
+    def get(self, url, headers=None, proxies=None):
+        if self.offline:
+            raise AssertionError('Network used: ' + url)
+        return LocalResponse(self.get_source(url))
+
+
+class WARCTests(TestCase):
+    root = 'test-warc'
+
+    def setUp(self):
+        self.loader = extractor.custom_loader
+        self.warc_dir = config.WARC_DIR
+        config.WARC_DIR = self.root
+        extractor._local.session = LocalSession()
+        warc_record._writer = None
+        warc_replay._archive = None
+        self.spider = create_spider()
+
+    def tearDown(self):
+        extractor.custom_loader = self.loader
+        config.WARC_DIR = self.warc_dir
+        del extractor._local.session
+        warc_record._writer = None
+        warc_replay._archive = None
+        if os.path.exists(self.root):
+            rmtree(self.root)
+
+    def crawl(self):
+        spider = models.Spider.objects.get(pk=self.spider.pk)
+        result = spider.operate([{'action': 'crawl', 'target': 'content'}])
+        content = result.data['results'][0]['content']
+        pages = sorted((v['url'], v['content']) for v in content.values())
+        stats = result.data['stats']
+        result.delete()
+        return pages, stats
+
+    def test_record_replay(self):
+        extractor.custom_loader = warc_record
+        recorded, stats = self.crawl()
+        self.assertEqual(len(recorded), 5)
+        self.assertEqual(len(os.listdir(self.root)), 2)
+
+        extractor.custom_loader = warc_replay
+        extractor._local.session = LocalSession(offline=True)
+        replayed, replay_stats = self.crawl()
+        self.assertEqual(replayed, recorded)
+        self.assertEqual(replay_stats['pages'], stats['pages'])
+        self.assertEqual(replay_stats['errors'], stats['errors'])
+
+    def test_archive(self):
+        writer = warc.WARCWriter(self.root)
+        writer.write_response(u'http://local/a', 200, 'OK',
+                              {'Content-Length': '1'}, 'Page A')
+        writer.write_response('http://local/b', 404, 'Not Found', {}, '')
+        writer.write_response('http://local/a', 200, 'OK', {}, 'New A')
+        writer.close()
+        for rebuild in (False, True):
+            if rebuild:
+                os.remove(writer.path + warc.INDEX_EXTENSION)
+            archive = warc.WARCArchive(self.root)
+            status, headers, body = archive.get('http://local/a')
+            self.assertEqual((status, body), (200, 'New A'))
+            self.assertEqual(headers['content-length'], '5')
+            self.assertEqual(archive.get('http://local/b')[0], 404)
+            self.assertEqual(archive.get('http://local/c'), None)
+
+    def test_build_index(self):
+        writer = warc.WARCWriter(self.root)
+        for i in range(5):
+            writer.write_response('http://local/{0}'.format(i), 200, 'OK',
+                                  {}, 'Page {0}'.format(i) * (i * 100))
+        writer.close()
+        index_path = writer.path + warc.INDEX_EXTENSION
+        with open(index_path) as index:
+            written = index.read()
+        # First record (warcinfo) is not indexed, chunks end at its end
+        first = int(written.split('\t')[1])
+        for chunk_size in (7, first, 1024, os.path.getsize(writer.path)):
+            warc.build_index(writer.path, chunk_size)
+            with open(index_path) as index:
+                self.assertEqual(index.read(), written)
+
+    def test_download_file(self):
+        extractor.custom_loader = warc_record
+        worker = Extractor(get_url('yc.0.html'), base_dir=self.root)
+        self.assertEqual(worker.download_file(get_url('yc.a0.html')),
+                         'yc.a0.html')
+        self.assertEqual(worker.download_file(get_url('missing.png')), None)
+
+        extractor.custom_loader = warc_replay
+        extractor._local.session = LocalSession(offline=True)
+        worker = Extractor(get_url('yc.0.html'), base_dir=self.root)
+        self.assertEqual(worker.download_file(get_url('yc.a0.html')),
+                         'yc.a0.html')
+        self.assertEqual(worker.stats.files, 1)
+        self.assertEqual(worker.download_file(get_url('missing.png')), None)
+        with open(join(worker.location, 'yc.a0.html')) as saved:
+            self.assertEqual(saved.read(), open(get_path('yc.a0.html')).read())
+
+
+class RemoteStorage(Storage):
+    """ Acts like storages which don't keep files on local disk """
+
+    def __init__(self):
+        self.local = FileSystemStorage()
+
+    def _open(self, name, mode='rb'):
+        return self.local.open(name, mode)
+
+
 class SimpleArchiveTests(TestCase):
     base_dir = 'test-simplearchive-tmp'
     storage_dir = 'test-simplearchive-storage'
@@ -506,7 +2296,8 @@ class SimpleArchiveTests(TestCase):
         zip_path = os.path.join(self.base_dir, zip_name)
         arch = utils.SimpleArchive(zip_path)
         arch.write('index.json', '{}')
-        new_path = arch.move_to_storage(storage, self.storage_dir, remove=False)
+        new_path = arch.move_to_storage(storage, self.storage_dir,
+                                        remove=False)
         expected_file = os.path.join(self.storage_dir, zip_name)
         self.assertEqual(expected_file, new_path)
         self.assertEqual(storage.exists(expected_file), True)
@@ -525,6 +2316,58 @@ class SimpleArchiveTests(TestCase):
         self.assertEqual(storage.exists(expected_file), True)
         self.assertEqual(os.path.exists(zip_path), False)
 
+    def test_write_file(self):
+        """ Files are copied into archive, compressed only if useful """
+        zip_path = os.path.join(self.base_dir, self.id() + '.zip')
+        image_path = os.path.join(self.base_dir, 'image.jpg')
+        with open(image_path, 'wb') as image:
+            image.write('\xff\xd8' + 'a' * 1000)
+        arch = utils.SimpleArchive(zip_path)
+        arch.write('index.json', '{"a": "%s"}' % ('b' * 1000))
+        arch.write_file('data/image.jpg', image_path)
+        arch.finish()
+        zfile = ZipFile(zip_path, 'r')
+        self.assertEqual(zfile.getinfo('index.json').compress_type,
+                         ZIP_DEFLATED)
+        self.assertEqual(zfile.getinfo('data/image.jpg').compress_type,
+                         ZIP_STORED)
+        self.assertEqual(zfile.read('data/image.jpg'),
+                         open(image_path, 'rb').read())
+
+    def test_write_storage_stream(self):
+        """ File-like content is written into storage by chunks """
+        content = 'x' * (config.CHUNK_SIZE * 2 + 10)
+        file_path = os.path.join(self.storage_dir, 'stream.txt')
+        utils.write_storage_file(storage, file_path, StringIO(content))
+        self.assertEqual(storage.open(file_path).read(), content)
+
+    def test_move_dir_to_storage(self):
+        """ Files are renamed into local storage, not copied """
+        source = os.path.join(self.base_dir, 'crawl-dir')
+        os.makedirs(os.path.join(source, 'images'))
+        for name in ('index.json', 'images/01.jpg'):
+            with open(os.path.join(source, name), 'w') as item:
+                item.write(name)
+        inode = os.stat(os.path.join(source, 'index.json')).st_ino
+        new_path = utils.move_to_storage(storage, source, self.storage_dir)
+        self.assertEqual(new_path, os.path.join(self.storage_dir, 'crawl-dir'))
+        self.assertEqual(os.path.exists(source), False)
+        index_path = storage.path(os.path.join(new_path, 'index.json'))
+        self.assertEqual(os.stat(index_path).st_ino, inode)
+        self.assertEqual(
+            storage.open(os.path.join(new_path, 'images/01.jpg')).read(),
+            'images/01.jpg')
+
+    def test_move_to_remote_storage(self):
+        """ Storages without local path receive streamed content """
+        remote = RemoteStorage()
+        source = os.path.join(self.base_dir, 'remote.txt')
+        with open(source, 'w') as item:
+            item.write('remote')
+        new_path = utils.move_to_storage(remote, source, self.storage_dir)
+        self.assertEqual(storage.open(new_path).read(), 'remote')
+        self.assertEqual(os.path.exists(source), False)
+
 
 class MiscTests(TestCase):
 
@@ -576,3 +2419,44 @@ class MiscTests(TestCase):
         local.remove_files()
         self.assertEqual(local.local_path, '')
         self.assertEquals(storage.exists(new_path), False)
+
+
+class LocalSiteTests(TestCase):
+    """ Crawl the synthetic local site over HTTP, with the default loader """
+
+    def setUp(self):
+        self.loader = extractor.custom_loader
+        extractor.custom_loader = None
+        self.site = LocalSite(pages=23, fan_out=4, depth=2, images=2).start()
+
+    def tearDown(self):
+        self.site.stop()
+        extractor.custom_loader = self.loader
+
+    def test_site_pages(self):
+        self.assertEqual(self.site.articles, 20)
+        status, content_type, body = self.site.render('/list/1')
+        self.assertEqual(status, 200)
+        self.assertEqual(body.count('href="/post/'), 4)
+        self.assertNotIn('rel="next"', body)
+        self.assertEqual(self.site.render('/list/5')[0], 404)
+        self.assertEqual(self.site.render('/post/23')[0], 404)
+        self.assertEqual(self.site.render('/post/3')[2].count('<img'), 2)
+
+    def test_crawl(self):
+        spider = create_spider(url=self.site.url, crawl_depth=self.site.depth)
+        result = spider.operate([{'action': 'crawl', 'target': 'content'}])
+        # Listings are counted as crawled pages too
+        self.assertEqual(result.data['stats']['pages'],
+                         self.site.articles + 5)
+        self.assertEqual(result.data['stats']['errors'], 0)
+        self.assertEqual(self.site.requests, self.site.articles + 5)
+
+    def test_crawl_images(self):
+        spider = create_spider(url=self.site.url, crawl_depth=self.site.depth)
+        spider.collectors.update(get_image=True)
+        result = spider.operate(
+            [{'action': 'crawl', 'target': 'content', 'workers': 2}])
+        self.assertEqual(result.data['stats']['files'],
+                         self.site.articles * 2)
+        self.assertEqual(self.site.requests, self.site.articles * 3 + 5)
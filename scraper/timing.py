@@ -0,0 +1,81 @@
+import time
+import bisect
+import threading
+
+from functools import wraps
+from contextlib import contextmanager
+
+
+# Upper bounds (seconds) of histogram buckets, the last bucket holds longer
+# durations
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60)
+
+
+class Timings(object):
+    """Histograms of durations of crawl phases (get_source, xpath,...),
+    aggregated over a whole crawl. Could be updated by multiple threads and
+    merged with timings of other processes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.phases = {}
+
+    def add(self, name, duration, count=1):
+        with self._lock:
+            phase = self._get_phase(name)
+            phase['count'] += count
+            phase['total'] += duration
+            phase['max'] = max(phase['max'], duration)
+            phase['buckets'][bisect.bisect_left(BUCKETS, duration)] += count
+
+    def _get_phase(self, name):
+        if name not in self.phases:
+            self.phases[name] = {
+                'count': 0,
+                'total': 0.0,
+                'max': 0.0,
+                'buckets': [0] * (len(BUCKETS) + 1),
+            }
+        return self.phases[name]
+
+    @contextmanager
+    def span(self, name):
+        """Record duration of the enclosed code as given phase"""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add(name, time.time() - start)
+
+    def merge(self, timings):
+        """Add timings exported by dict property (from other process)"""
+        with self._lock:
+            for name, value in timings.get('phases', {}).items():
+                phase = self._get_phase(name)
+                phase['count'] += value['count']
+                phase['total'] += value['total']
+                phase['max'] = max(phase['max'], value['max'])
+                phase['buckets'] = [
+                    _ + value['buckets'][i]
+                    for i, _ in enumerate(phase['buckets'])]
+
+    @property
+    def dict(self):
+        with self._lock:
+            return {
+                'buckets': list(BUCKETS),
+                'phases': dict((name, dict(phase, buckets=phase['buckets'][:]))
+                               for name, phase in self.phases.items()),
+            }
+
+
+def timed(name):
+    """Decorator recording duration of method calls as given phase, into
+    timings of the object stats (CrawlStats)"""
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.stats.span(name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
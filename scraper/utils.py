@@ -1,19 +1,22 @@
 import os
+import re
 import logging
 import urlparse
-import simplejson as json
 import itertools
+import threading
 
 from os.path import join
 from uuid import uuid4
-from zipfile import ZipFile
-from datetime import datetime
+from zipfile import ZipFile, ZIP_STORED, ZIP_DEFLATED
+from datetime import datetime, timedelta
 from lxml import etree
-from shutil import rmtree
+from shutil import rmtree, copyfileobj
 
 from django.utils.functional import cached_property
 
-from .config import DATETIME_FORMAT
+from .config import DATETIME_FORMAT, CHUNK_SIZE, COMPRESSED_EXTENSIONS
+from .serializers import get_serializer
+from .timing import Timings
 
 
 logger = logging.getLogger(__name__)
@@ -32,6 +35,7 @@ class Data(object):
         self.url = kwargs.get('url')
         self.start = kwargs.get('start') or datetime.now()
         self.end = kwargs.get('end') or None
+        self.stats = kwargs.get('stats') or {}
         self.results = []
 
     @property
@@ -44,6 +48,7 @@ class Data(object):
             'url': self.url,
             'start': print_time(self.start),
             'end': print_time(self.end),
+            'stats': self.stats,
             'results': self.results,
         }
         return result
@@ -58,8 +63,49 @@ class Data(object):
 
     @cached_property
     def json(self):
-        """ Return as pretty JSON """
-        return json.dumps(self.dict, indent=2)
+        """ Return serialized by the SERIALIZER setting (JSON by default),
+        this is done only once """
+        return get_serializer().dumps(self.dict)
+
+
+class CrawlStats(object):
+    """Counters of a crawl: fetched pages, downloaded files, bytes and
+    errors, with timings of crawl phases. Could be updated by multiple
+    threads."""
+    FIELDS = ('pages', 'files', 'bytes', 'errors')
+
+    def __init__(self, **kwargs):
+        self._lock = threading.Lock()
+        for field in self.FIELDS:
+            setattr(self, field, kwargs.get(field, 0))
+        self.timings = Timings()
+
+    def add(self, timings=None, **kwargs):
+        """Add to counters, timings are dict exported by other stats"""
+        if timings:
+            self.timings.merge(timings)
+        with self._lock:
+            for key in kwargs:
+                setattr(self, key, getattr(self, key) + kwargs[key])
+
+    def add_page(self, content):
+        """Count a fetched page, empty content is counted as error"""
+        if content:
+            self.add(pages=1, bytes=len(content))
+        else:
+            self.add(errors=1)
+
+    def span(self, name):
+        return self.timings.span(name)
+
+    @property
+    def dict(self):
+        return dict((field, getattr(self, field)) for field in self.FIELDS)
+
+    def export(self):
+        """Return counters and timings as plain dict, which can be sent to
+        other process and added to its stats"""
+        return dict(self.dict, timings=self.timings.dict)
 
 
 class Datum(object):
@@ -74,11 +120,17 @@ class Datum(object):
 
     @property
     def dict(self):
-        return self.__dict__
+        return {
+            'content': self.content,
+            'media': self.media,
+            'images': self.images,
+            'extras': self.extras,
+        }
 
-    @property
+    @cached_property
     def json(self):
-        return json.dumps(self.__dict__, indent=2)
+        """ Same as Data.json, should be called when extras are final """
+        return get_serializer().dumps(self.dict)
 
 
 def complete_url(base, link):
@@ -175,24 +227,120 @@ def write_storage_file(storage, file_path, content):
     Arguments:
         storage - Django file storage
         file_path - relative path to the file
-        content - content of file to be written
+        content - content of file to be written, or file-like object which
+            will be copied by chunks
     """
     try:
-        mfile = storage.open(file_path, 'w')
-        mfile.write(content)
-        mfile.close()
+        _write_storage_file(storage, file_path, content)
     except IOError:
         # When directories are not auto being created, exception raised.
         # Then try to rewrite using the FileSystemStorage
         location = join(storage.base_location, os.path.dirname(file_path))
         if not os.path.exists(location):
             os.makedirs(location)
-        mfile = storage.open(file_path, 'w')
-        mfile.write(content)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        _write_storage_file(storage, file_path, content)
+    return file_path
+
+
+def _write_storage_file(storage, file_path, content):
+    mfile = storage.open(file_path, 'w')
+    try:
+        if hasattr(content, 'read'):
+            for chunk in iter(lambda: content.read(CHUNK_SIZE), ''):
+                mfile.write(chunk)
+        else:
+            mfile.write(content)
+    finally:
         mfile.close()
+
+
+def get_local_path(storage, file_path):
+    """ Return absolute path of file in storage if the storage keeps files
+    on local file system (FileSystemStorage), None otherwise """
+    try:
+        return storage.path(file_path)
+    except NotImplementedError:
+        return None
+
+
+def store_file(storage, source, file_path, keep=False):
+    """ Move a single file into storage. With a local storage, the file is
+    simply renamed (or hard linked if keep is True), it is copied by chunks
+    only when being on another device. Directory of the file must exist.
+    Arguments:
+        storage: Instance of the file storage (FileSystemStorage,...)
+        source: Path of the file to be moved
+        file_path: Relative path to the file in storage
+        keep: Leave the source file in place
+    Returns:
+        Path of file in storage
+    """
+    target = get_local_path(storage, file_path)
+    if target is None:
+        with open(source, 'rb') as content:
+            write_storage_file(storage, file_path, content)
+    else:
+        try:
+            if keep:
+                if os.path.exists(target):
+                    os.remove(target)
+                os.link(source, target)
+            else:
+                os.rename(source, target)
+        except OSError:
+            # Different devices, or links not supported
+            with open(source, 'rb') as content:
+                with open(target, 'wb') as target_file:
+                    copyfileobj(content, target_file, CHUNK_SIZE)
+        mode = getattr(storage, 'file_permissions_mode', None)
+        if mode is not None:
+            os.chmod(target, mode)
+    if not keep and os.path.exists(source):
+        os.remove(source)
     return file_path
 
 
+def delete_storage_path(storage, path):
+    """ Delete file or directory (with all its content) in storage
+    Returns: Number of deleted files
+    """
+    if not path:
+        return 0
+    local = get_local_path(storage, path)
+    if local is not None:
+        if os.path.isdir(local):
+            count = sum(len(_[2]) for _ in os.walk(local))
+            rmtree(local)
+            return count
+        if os.path.exists(local):
+            os.remove(local)
+            return 1
+        return 0
+    # Remote storages have no real directories, their files are listed
+    dirs, files = storage.listdir(path)
+    if not dirs and not files:
+        if storage.exists(path):
+            storage.delete(path)
+            return 1
+        return 0
+    count = 0
+    for name in files:
+        storage.delete(join(path, name))
+        count += 1
+    for name in dirs:
+        count += delete_storage_path(storage, join(path, name))
+    return count
+
+
+def make_storage_dir(storage, location):
+    """ Create directory in local storage if missing """
+    path = get_local_path(storage, location)
+    if path is not None and not os.path.isdir(path):
+        os.makedirs(path)
+
+
 def move_to_storage(storage, source, location):
     """ Move single file or whole directory to storage. Empty directory
     will not be moved.
@@ -205,29 +353,35 @@ def move_to_storage(storage, source, location):
     """
     source = source.strip().rstrip('/')
     if os.path.isfile(source):
-        saved_path = write_storage_file(
-            storage, join(location, os.path.basename(source)),
-            open(source, 'r').read())
-    else:
-        blank_size = len(source.rsplit('/', 1)[0]) + 1
-        for items in os.walk(source):
-            loc = join(location, items[0][blank_size:])
-            for item in items[2]:
-                write_storage_file(
-                    storage, join(loc, item),
-                    open(join(items[0], item), 'r').read())
-        saved_path = join(location, os.path.basename(source))
-
-    # Nuke old file/dir
+        make_storage_dir(storage, location)
+        return store_file(
+            storage, source, join(location, os.path.basename(source)))
+
+    blank_size = len(source.rsplit('/', 1)[0]) + 1
+    for items in os.walk(source):
+        if not items[2]:
+            continue
+        loc = join(location, items[0][blank_size:])
+        make_storage_dir(storage, loc)
+        for item in items[2]:
+            store_file(storage, join(items[0], item), join(loc, item))
+
+    # Nuke old dir
     try:
-        if os.path.isfile(source):
-            os.remove(source)
-        else:
-            rmtree(source)
+        rmtree(source)
     except OSError:
         logger.exception('Error when deleting: {0}'.format(source))
 
-    return saved_path
+    return join(location, os.path.basename(source))
+
+
+def get_compress_type(file_name):
+    """ Return ZIP compression for given file, files already compressed
+    (images, videos,...) are stored as-is """
+    extension = file_name.rsplit('.', 1)[-1].lower()
+    if extension in COMPRESSED_EXTENSIONS:
+        return ZIP_STORED
+    return ZIP_DEFLATED
 
 
 class SimpleArchive(object):
@@ -249,11 +403,16 @@ class SimpleArchive(object):
 
         if os.path.exists(self.file_path):
             os.remove(self.file_path)
-        self._file = ZipFile(self.file_path, 'w')
+        self._file = ZipFile(self.file_path, 'w', allowZip64=True)
 
     def write(self, file_name, content):
         """ Write file with content into current archive """
-        self._file.writestr(file_name, content)
+        self._file.writestr(file_name, content, get_compress_type(file_name))
+
+    def write_file(self, file_name, path):
+        """ Copy file at given path into current archive, the file is read
+        by chunks so it doesn't need to fit in memory """
+        self._file.write(path, file_name, get_compress_type(file_name))
 
     def finish(self):
         self._file.close()
@@ -269,18 +428,12 @@ class SimpleArchive(object):
         """
         self.finish()
 
-        content = open(self._file.filename, 'r').read()
         file_path = join(location, os.path.basename(self._file.filename))
-        saved_path = write_storage_file(storage, file_path, content)
-
-        # Remove file if successful
-        if remove and saved_path:
-            try:
-                os.remove(self._file.filename)
-                self._file = None
-            except OSError:
-                logger.error('Error when removing temporary file: {0}'.format(
-                    self._file.filename))
+        make_storage_dir(storage, location)
+        saved_path = store_file(storage, self._file.filename, file_path,
+                                keep=not remove)
+        if remove:
+            self._file = None
         return saved_path
 
     def __str__(self):
@@ -322,3 +475,175 @@ def generate_urls(base_url, elements=None):
         refined.append(full_list)
     for comb in itertools.product(*refined):
         yield base_url.format(*comb)
+
+
+CRON_RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 6))
+
+
+def parse_cron(expression):
+    """Convert cron expression into list of allowed values for each field
+    (minute, hour, day of month, month, day of week)
+        '*/15 8-18 * * 1-5'
+    Returns:
+        [[0, 15, 30, 45], [8, ..., 18], None, None, [1, 2, 3, 4, 5]]
+    None means any value is allowed. ValueError is raised if invalid.
+    """
+    fields = expression.split()
+    if len(fields) != 5:
+        raise ValueError('Cron expression needs 5 fields: {0}'.format(
+            expression))
+    allowed = []
+    for field, (low, high) in zip(fields, CRON_RANGES):
+        if field == '*':
+            allowed.append(None)
+            continue
+        values = set()
+        for part in field.split(','):
+            stepped = '/' in part
+            part, step = (part.split('/') + ['1'])[:2]
+            if part == '*':
+                part = '{0}-{1}'.format(low, high)
+            elif stepped and part.isdigit():
+                # 'N/step' starts at N and goes up to the end of the range
+                part = '{0}-{1}'.format(part, high)
+            values.update(interval_to_list(part)[::int(step)])
+        if high == 6 and 7 in values:
+            # Both 0 and 7 are Sunday
+            values.discard(7)
+            values.add(0)
+        if not values or min(values) < low or max(values) > high:
+            raise ValueError('Invalid cron field: {0}'.format(field))
+        allowed.append(sorted(values))
+    return allowed
+
+
+def next_cron_time(expression, after):
+    """Return the first time (without seconds) later than `after` which
+    matches the cron expression"""
+    minutes, hours, days, months, weekdays = parse_cron(expression)
+    atime = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    limit = atime + timedelta(days=366 * 5)
+    while atime < limit:
+        if months and atime.month not in months:
+            atime = (atime.replace(day=1, hour=0, minute=0) +
+                     timedelta(days=32)).replace(day=1)
+            continue
+        # Like cron, if both days are set, matching one of them is enough
+        day_ok = days is None or atime.day in days
+        weekday_ok = weekdays is None or (atime.weekday()+1) % 7 in weekdays
+        if days and weekdays:
+            day_ok = weekday_ok = day_ok or weekday_ok
+        if not (day_ok and weekday_ok):
+            atime = atime.replace(hour=0, minute=0) + timedelta(days=1)
+            continue
+        if hours and atime.hour not in hours:
+            atime = atime.replace(minute=0) + timedelta(hours=1)
+            continue
+        if minutes and atime.minute not in minutes:
+            atime += timedelta(minutes=1)
+            continue
+        return atime
+    raise ValueError('Cron expression never matches: {0}'.format(expression))
+
+
+INTERVAL = re.compile(r'^\d+(-\d+)?(,\d+(-\d+)?)*$')
+
+
+def iter_values(element):
+    """Yield values of an element of URL template, intervals (like in
+    generate_urls) are expanded lazily
+        ['1-3,7', 'news']
+    Yields:
+        1, 2, 3, 7, 'news'
+    """
+    if not isinstance(element, (list, tuple)):
+        element = [element]
+    for value in element:
+        if isinstance(value, basestring) and '-' in value and \
+                INTERVAL.match(value.replace(' ', '')):
+            for part in value.replace(' ', '').split(','):
+                bounds = part.split('-')
+                for number in xrange(int(bounds[0]), int(bounds[-1]) + 1):
+                    yield number
+        else:
+            yield value
+
+
+class URLTemplate(object):
+    """Iterator of URLs generated from a template, same as generate_urls()
+    but values of elements are produced lazily. If max_misses is set, the
+    rest of the innermost range is skipped after that number of consecutive
+    missed pages, as reported by report().
+        URLTemplate('http://domain/{0}/page-{1}', [['news', 'tech'], '1-99'])
+    """
+
+    def __init__(self, base_url, elements=None, max_misses=0):
+        self.base_url = base_url
+        self.elements = elements or []
+        self.max_misses = max_misses
+        self.misses = 0
+        self._range = None
+        self._pending = {}
+        self._urls = self._generate((), 0)
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        return next(self._urls)
+
+    def _generate(self, prefix, index):
+        if index >= len(self.elements) - 1:
+            # Innermost range, which could be stopped early
+            self._range = prefix
+            self.misses = 0
+            values = iter_values(self.elements[index]) if self.elements \
+                else [None]
+            for value in values:
+                if self.max_misses and self.misses >= self.max_misses:
+                    logger.info('Skip rest of range: {0}'.format(prefix))
+                    break
+                comb = prefix + (value,) if self.elements else prefix
+                url = self.base_url.format(*comb)
+                self._pending[url] = prefix
+                yield url
+        else:
+            for value in iter_values(self.elements[index]):
+                for url in self._generate(prefix + (value,), index + 1):
+                    yield url
+
+    def report(self, url, found):
+        """Tell whether the page at generated URL has content or not"""
+        if self._pending.pop(url, None) != self._range:
+            return
+        self.misses = 0 if found else self.misses + 1
+
+    def discard(self, url):
+        """Forget generated URL which won't be reported, e.g. not crawled"""
+        self._pending.pop(url, None)
+
+
+def chunks(iterable, size):
+    """Yield lists of at most `size` items from given iterable"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            break
+        yield chunk
+
+
+def iter_queryset(queryset, chunk_size=500):
+    """Yield objects of given queryset by chunks of primary keys, so big
+    tables are exported without loading all rows at once"""
+    queryset = queryset.order_by('pk')
+    last = None
+    while True:
+        chunk = queryset if last is None else queryset.filter(pk__gt=last)
+        count = 0
+        for obj in chunk[:chunk_size].iterator():
+            count += 1
+            last = obj.pk
+            yield obj
+        if count < chunk_size:
+            break
@@ -0,0 +1,191 @@
+import os
+import zlib
+import threading
+
+from os.path import join
+from uuid import uuid4
+from datetime import datetime
+
+
+WARC_VERSION = 'WARC/1.0'
+WARC_EXTENSION = '.warc.gz'
+# Index of records in each WARC file: URL, offset and length (tab separated)
+INDEX_EXTENSION = '.idx'
+# Headers describing the original transfer, body is stored decoded
+SKIPPED_HEADERS = ('content-encoding', 'transfer-encoding', 'content-length')
+# Size of compressed data read at once when indexing WARC files
+CHUNK_SIZE = 64 * 1024
+
+
+def gzip_member(data):
+    """Compress data as single gzip member, records can then be read
+    separately from their offsets"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def to_str(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return str(value)
+
+
+class WARCWriter(object):
+    """Writes response records into new gzipped WARC file in given directory,
+    every record is a gzip member. Offsets of records are written into an
+    index file next to it, for fast replay."""
+
+    def __init__(self, directory, prefix='crawl'):
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.pid = os.getpid()
+        name = '{0}-{1}-{2}-{3}'.format(
+            prefix, datetime.utcnow().strftime('%Y%m%d%H%M%S'), self.pid,
+            uuid4().hex[:8])
+        self.path = join(directory, name + WARC_EXTENSION)
+        self._lock = threading.Lock()
+        self._file = open(self.path, 'wb')
+        self._index = open(self.path + INDEX_EXTENSION, 'w')
+        self._offset = 0
+        self.write_record('warcinfo', None, 'application/warc-fields',
+                          'software: django-scraper\r\n'
+                          'format: WARC File Format 1.0\r\n')
+
+    def write_record(self, warc_type, url, content_type, block):
+        headers = [
+            ('WARC-Type', warc_type),
+            ('WARC-Record-ID', '<urn:uuid:{0}>'.format(uuid4())),
+            ('WARC-Date', datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')),
+        ]
+        if url:
+            headers.append(('WARC-Target-URI', to_str(url)))
+        headers.extend([
+            ('Content-Type', content_type),
+            ('Content-Length', len(block)),
+        ])
+        record = '{0}\r\n{1}\r\n{2}\r\n\r\n'.format(
+            WARC_VERSION,
+            ''.join('{0}: {1}\r\n'.format(*_) for _ in headers),
+            block)
+        data = gzip_member(record)
+        with self._lock:
+            self._file.write(data)
+            self._file.flush()
+            if url:
+                self._index.write('{0}\t{1}\t{2}\n'.format(
+                    to_str(url), self._offset, len(data)))
+                self._index.flush()
+            self._offset += len(data)
+
+    def write_response(self, url, status, reason, headers, body):
+        """Record HTTP response of given URL"""
+        body = to_str(body or '')
+        lines = ['HTTP/1.1 {0} {1}'.format(status, to_str(reason or ''))]
+        for key, value in headers.items():
+            if key.lower() not in SKIPPED_HEADERS:
+                lines.append('{0}: {1}'.format(to_str(key), to_str(value)))
+        lines.append('Content-Length: {0}'.format(len(body)))
+        block = '\r\n'.join(lines) + '\r\n\r\n' + body
+        self.write_record(
+            'response', url, 'application/http; msgtype=response', block)
+
+    def close(self):
+        self._file.close()
+        self._index.close()
+
+
+def parse_record(data):
+    """Return (WARC headers, block) of uncompressed record"""
+    head, block = data.split('\r\n\r\n', 1)
+    headers = {}
+    for line in head.split('\r\n')[1:]:
+        key, value = line.split(':', 1)
+        headers[key.strip().lower()] = value.strip()
+    length = int(headers.get('content-length', len(block)))
+    return headers, block[:length]
+
+
+def parse_response(block):
+    """Return (status, headers, body) of HTTP response block"""
+    head, body = block.split('\r\n\r\n', 1)
+    lines = head.split('\r\n')
+    status = int(lines[0].split(' ', 2)[1])
+    headers = {}
+    for line in lines[1:]:
+        key, value = line.split(':', 1)
+        headers[key.strip().lower()] = value.strip()
+    return status, headers, body
+
+
+def iter_members(warc, chunk_size=CHUNK_SIZE):
+    """Yield (offset, length, head) of gzip members in given file, head is
+    the start of uncompressed member, at least up to the end of the WARC
+    headers. The file is read by chunks, data following a member is carried
+    to the next one."""
+    offset = 0
+    data = warc.read(chunk_size)
+    while data:
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        head = ''
+        length = 0
+        while data:
+            output = decompressor.decompress(data)
+            if '\r\n\r\n' not in head:
+                head += output
+            if decompressor.unused_data:
+                length += len(data) - len(decompressor.unused_data)
+                data = decompressor.unused_data
+                break
+            length += len(data)
+            data = warc.read(chunk_size)
+        yield offset, length, head
+        offset += length
+
+
+def build_index(path, chunk_size=CHUNK_SIZE):
+    """Write index of WARC file which doesn't have one (made by other
+    tools), records are read one by one"""
+    records = []
+    with open(path, 'rb') as warc:
+        for offset, length, head in iter_members(warc, chunk_size):
+            headers, block = parse_record(head)
+            if headers.get('warc-type') == 'response':
+                records.append((headers['warc-target-uri'], offset, length))
+    with open(path + INDEX_EXTENSION, 'w') as index:
+        for record in records:
+            index.write('{0}\t{1}\t{2}\n'.format(*record))
+
+
+class WARCArchive(object):
+    """Serves responses recorded in WARC files of given directory, records
+    are located by the indexes. When an URL is recorded several times, the
+    latest one is used."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.records = {}
+        if not os.path.isdir(directory):
+            return
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith(WARC_EXTENSION):
+                continue
+            path = join(directory, name)
+            if not os.path.exists(path + INDEX_EXTENSION):
+                build_index(path)
+            with open(path + INDEX_EXTENSION, 'r') as index:
+                for line in index:
+                    url, offset, length = line.rstrip('\n').split('\t')
+                    self.records[url] = (path, int(offset), int(length))
+
+    def get(self, url):
+        """Return (status, headers, body) recorded for URL, None if missing"""
+        location = self.records.get(to_str(url))
+        if location is None:
+            return None
+        path, offset, length = location
+        with open(path, 'rb') as warc:
+            warc.seek(offset)
+            data = warc.read(length)
+        headers, block = parse_record(
+            zlib.decompress(data, 16 + zlib.MAX_WBITS))
+        return parse_response(block)
@@ -0,0 +1,108 @@
+import os
+import threading
+
+from os.path import join
+
+from django.core.files.storage import default_storage
+
+from .utils import get_uuid, write_storage_file
+
+
+class BaseWriter(object):
+    """Writes the result files of extracted pages. Each page has its own
+    location, named by an unique ID.
+        shared - Could be passed to and used by worker processes
+    """
+    shared = True
+
+    def new_id(self, url):
+        """Return new page ID, not used in this writer yet"""
+        return get_uuid(url)
+
+    def location(self, uuid):
+        """Return path to location of page with given ID"""
+        raise NotImplementedError
+
+    def write(self, path, content):
+        """Write file at relative path (page ID/file name) with content
+        Returns: Full path of written file
+        """
+        raise NotImplementedError
+
+    def discard(self):
+        """Called when nothing written is going to be kept"""
+        pass
+
+
+class FileWriter(BaseWriter):
+    """Writes files into local directory. This is the default one, using the
+    temporary directory, results are moved to storage when finalizing."""
+
+    def __init__(self, base_dir):
+        self.base_dir = base_dir
+
+    def new_id(self, url):
+        return get_uuid(url, self.base_dir)
+
+    def location(self, uuid):
+        return join(self.base_dir, uuid)
+
+    def write(self, path, content):
+        file_path = join(self.base_dir, path)
+        location = os.path.dirname(file_path)
+        if not os.path.exists(location):
+            os.makedirs(location)
+        with open(file_path, 'w') as mfile:
+            mfile.write(content)
+        return file_path
+
+
+class StorageWriter(BaseWriter):
+    """Writes files straight into their final location in storage"""
+
+    def __init__(self, base_dir, storage=None):
+        self.base_dir = base_dir
+        self.storage = storage or default_storage
+
+    def __getstate__(self):
+        # Worker processes always write to the default storage
+        return {'base_dir': self.base_dir}
+
+    def __setstate__(self, state):
+        self.__init__(state['base_dir'])
+
+    def new_id(self, url):
+        uuid = get_uuid(url)
+        while self.storage.exists(self.location(uuid)):
+            uuid = get_uuid(url)
+        return uuid
+
+    def location(self, uuid):
+        return join(self.base_dir, uuid)
+
+    def write(self, path, content):
+        return write_storage_file(
+            self.storage, join(self.base_dir, path), content)
+
+
+class ArchiveWriter(BaseWriter):
+    """Writes files as entries of an archive (SimpleArchive), which could
+    not be shared with other processes"""
+    shared = False
+
+    def __init__(self, archive):
+        self.archive = archive
+        self._lock = threading.Lock()
+
+    def location(self, uuid):
+        return join(self.archive.file_path, uuid)
+
+    def write(self, path, content):
+        with self._lock:
+            self.archive.write(path, content)
+        return join(self.archive.file_path, path)
+
+    def discard(self):
+        self.archive.finish()
+        if os.path.exists(self.archive.file_path):
+            os.remove(self.archive.file_path)
@@ -20,6 +20,7 @@ setup(
     author_email='me@zniper.net',
     packages=['scraper', 'scraper.management', 'scraper.management.commands',
               'scraper.migrations'],
+    package_data={'scraper': ['templates/admin/scraper/result/*.html']},
     keywords='crawl scraper spider web pages data extract collect',
     install_requires=[
         'requests',